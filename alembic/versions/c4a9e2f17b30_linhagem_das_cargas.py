@@ -0,0 +1,97 @@
+"""Linhagem das cargas (file_id, linha_arquivo) e views {tabela}_id_log
+
+Revision ID: c4a9e2f17b30
+Revises: 7f86ed43a086
+Create Date: 2026-10-16 23:40:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a9e2f17b30'
+down_revision: Union[str, None] = '7f86ed43a086'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tabelas destino dos carregadores que registram as cargas no load_ledger
+TABELAS = [
+    'sih_aih_reduzida',
+    'sih_aih_rejeitada',
+    'sih_aih_rejeitada_erro',
+    'sih_servicos_profissionais',
+    'sia_apac_acompanhamento_multiprofissional',
+    'sia_apac_acompanhamento_pos_cirurgia_bariatrica',
+    'sia_apac_cirurgia_bariatrica',
+    'sia_apac_confeccao_de_fistula',
+    'sia_apac_laudos_diversos',
+    'sia_apac_medicamentos',
+    'sia_apac_nefrologia',
+    'sia_apac_quimioterapia',
+    'sia_apac_radioterapia',
+    'sia_apac_tratamento_dialitico',
+    'sia_boletim_producao_ambulatorial_individualizado',
+    'sia_producao_ambulatorial',
+]
+
+# Mesmo DDL de registro_carga.DDL_LEDGER; a view abaixo depende do ledger
+DDL_LEDGER = """
+    CREATE TABLE IF NOT EXISTS load_ledger (
+        id BIGSERIAL PRIMARY KEY,
+        tabela TEXT NOT NULL,
+        arquivo TEXT NOT NULL,
+        caminho TEXT,
+        checksum TEXT,
+        linhas BIGINT,
+        status TEXT NOT NULL,
+        erro TEXT,
+        iniciado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+        concluido_em TIMESTAMPTZ,
+        UNIQUE (tabela, arquivo)
+    )
+"""
+
+
+def _tabelas_existentes():
+    existentes = set(sa.inspect(op.get_bind()).get_table_names())
+    return [tabela for tabela in TABELAS if tabela in existentes]
+
+
+def upgrade() -> None:
+    op.execute(DDL_LEDGER)
+    for tabela in _tabelas_existentes():
+        op.execute(f"""
+            ALTER TABLE {tabela}
+                ADD COLUMN IF NOT EXISTS file_id BIGINT,
+                ADD COLUMN IF NOT EXISTS linha_arquivo INTEGER
+        """)
+        op.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_file_id ON {tabela} (file_id)")
+
+        # View de compatibilidade: id_log no formato antigo '{arquivo}_{linha}';
+        # linhas carregadas antes da linhagem mantêm o id_log original
+        colunas = [coluna['name'] for coluna in sa.inspect(op.get_bind()).get_columns(tabela)]
+        id_log = "l.arquivo || '_' || t.linha_arquivo"
+        if 'id_log' in colunas:
+            id_log = f"COALESCE(t.id_log, {id_log})"
+        selecao = ", ".join(f"t.{coluna}" for coluna in colunas if coluna != 'id_log')
+        op.execute(f"DROP VIEW IF EXISTS {tabela}_id_log")
+        op.execute(f"""
+            CREATE VIEW {tabela}_id_log AS
+            SELECT {selecao}, {id_log} AS id_log
+            FROM {tabela} AS t
+            LEFT JOIN load_ledger AS l ON l.id = t.file_id
+        """)
+
+
+def downgrade() -> None:
+    for tabela in _tabelas_existentes():
+        op.execute(f"DROP VIEW IF EXISTS {tabela}_id_log")
+        op.execute(f"DROP INDEX IF EXISTS idx_{tabela}_file_id")
+        op.execute(f"""
+            ALTER TABLE {tabela}
+                DROP COLUMN IF EXISTS linha_arquivo,
+                DROP COLUMN IF EXISTS file_id
+        """)
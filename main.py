@@ -1,7 +1,7 @@
 import logging
 import os
 import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, BinaryIO
 from dotenv import load_dotenv
 import duckdb
 import pandas as pd
@@ -9,12 +9,13 @@ from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from pydantic import ConfigDict
 from pydantic_settings import BaseSettings
 from datetime import datetime
 import logging.handlers
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from uuid import uuid4
 import psutil
 import time
@@ -22,10 +23,12 @@ import json
 from io import StringIO
 import traceback
 import threading
-from queue import PriorityQueue
-from asyncio import Semaphore
+from queue import Queue, Empty
+import asyncio
+import anyio.to_thread
+import asyncpg
 import gc
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import csv
 import numpy as np
 from collections import defaultdict
@@ -35,7 +38,15 @@ import psycopg2
 import tempfile
 import shutil
 from sqlalchemy.pool import NullPool
+from src.core.services.data_service import parse_file_name
 from pydantic import ValidationError
+import sqlite3
+import multiprocessing
+import fcntl
+import hashlib
+from contextlib import contextmanager, ExitStack
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # -----------------------------------------------------------------------------
 # Configurações iniciais e carregamento do ambiente
@@ -478,6 +489,57 @@ GRUPOS_INFO = {
 # -----------------------------------------------------------------------------
 # Modelo de Dados para Parâmetros da Consulta
 # -----------------------------------------------------------------------------
+IDENTIFICADOR_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+TABELA_RE = re.compile(r'^(?:[A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*$')
+FUNCOES_AGREGACAO = ['count', 'sum', 'avg', 'min', 'max', 'count_distinct']
+# Funções que exigem coluna numérica (tipos do GRUPOS_INFO)
+FUNCOES_NUMERICAS = ['sum', 'avg']
+TIPOS_NUMERICOS = ('SMALLINT', 'INTEGER', 'BIGINT', 'NUMERIC')
+
+class Medida(BaseModel):
+    """Medida agregada calculada por grupo de campos_agrupamento."""
+    funcao: str
+    coluna: Optional[str] = None
+    alias: Optional[str] = None
+
+    @field_validator('funcao')
+    def validate_funcao(cls, v):
+        v = v.lower()
+        if v not in FUNCOES_AGREGACAO:
+            raise ValueError(f'Função deve ser uma de {FUNCOES_AGREGACAO}')
+        return v
+
+    @field_validator('coluna', 'alias')
+    def validate_identificador(cls, v):
+        if v is not None and not IDENTIFICADOR_RE.match(v):
+            raise ValueError(f'Identificador inválido: {v}')
+        return v
+
+    @field_validator('coluna')
+    def normalize_coluna(cls, v):
+        return v.upper() if v is not None else v
+
+    @model_validator(mode='after')
+    def validate_coluna_obrigatoria(self):
+        if self.funcao != 'count' and self.coluna is None:
+            raise ValueError(f'A função {self.funcao} exige o campo coluna')
+        return self
+
+    @property
+    def nome(self) -> str:
+        if self.alias:
+            return self.alias
+        return f"{self.funcao}_{self.coluna}".lower() if self.coluna else "qtd_registros"
+
+    def to_sql(self) -> str:
+        if self.funcao == 'count':
+            expr = f"COUNT({self.coluna or '*'})"
+        elif self.funcao == 'count_distinct':
+            expr = f"COUNT(DISTINCT {self.coluna})"
+        else:
+            expr = f"{self.funcao.upper()}({self.coluna})"
+        return f"{expr} AS {self.nome}"
+
 class QueryParams(BaseModel):
     base: str
     grupo: str
@@ -487,6 +549,7 @@ class QueryParams(BaseModel):
     competencia_fim: str
     table_name: Optional[str] = None
     consulta_personalizada: Optional[str] = None
+    medidas: Optional[List[Medida]] = None
     
     @field_validator('base')
     def validate_base(cls, v):
@@ -494,6 +557,12 @@ class QueryParams(BaseModel):
             raise ValueError('Base deve ser SIH ou SIA')
         return v.upper()
 
+    @field_validator('table_name')
+    def validate_table_name(cls, v):
+        if v is not None and not TABELA_RE.match(v):
+            raise ValueError('table_name deve ser tabela ou schema.tabela (letras, números e _)')
+        return v
+
     @field_validator('cnes_list')
     def validate_cnes(cls, v):
         if v == ["*"]:
@@ -511,46 +580,700 @@ class QueryParams(BaseModel):
             raise ValueError('Formato inválido. Use MM/YYYY')
         return v
 
+    @field_validator('medidas')
+    def validate_medidas(cls, v):
+        if v is not None:
+            if not v:
+                raise ValueError('medidas deve conter ao menos uma medida')
+            nomes = [m.nome for m in v]
+            if len(set(nomes)) != len(nomes):
+                raise ValueError('Nomes de medidas duplicados; use alias')
+        return v
+
+    @model_validator(mode='after')
+    def validate_agregacao(self):
+        """
+        Modo de agregação: campos_agrupamento vira a lista do GROUP BY, então é
+        validado como identificador, normalizado para maiúsculas e sem
+        repetições; sum/avg só são aceitos em colunas numéricas do GRUPOS_INFO.
+        Sem medidas os campos são mantidos como enviados.
+        """
+        if not self.medidas:
+            return self
+        campos = []
+        for campo in self.campos_agrupamento:
+            campo = campo.strip().upper()
+            if not IDENTIFICADOR_RE.match(campo):
+                raise ValueError(f'Campo inválido: {campo}')
+            if campo not in campos:
+                campos.append(campo)
+        self.campos_agrupamento = campos
+
+        tipos = GRUPOS_INFO.get(self.grupo, {}).get('colunas', {})
+        for medida in self.medidas:
+            if medida.funcao not in FUNCOES_NUMERICAS:
+                continue
+            tipo = tipos.get(medida.coluna.lower(), 'TEXT')
+            if not tipo.upper().startswith(TIPOS_NUMERICOS):
+                raise ValueError(
+                    f'A função {medida.funcao} exige coluna numérica; {medida.coluna} é {tipo}'
+                )
+        return self
+
 # -----------------------------------------------------------------------------
-# Funções de Utilidade para Processamento e Conversão
+# Catálogo persistente de arquivos Parquet
 # -----------------------------------------------------------------------------
-def log_execution(message: str, is_start: bool = True) -> None:
-    marker = ">>>" if is_start else "<<<"
-    logging.info(f"{marker} {message}")
+class ParquetCatalog:
+    """
+    Catálogo (SQLite) dos arquivos Parquet em parquet_files/{base}/{grupo}/.
+
+    Cada arquivo é registrado com base, grupo, UF, competência (YYYYMM), tamanho
+    em bytes, número de linhas e tamanho descomprimido (lidos do footer) e mtime. A atualização é
+    incremental: pastas cujo mtime não mudou não são listadas novamente e o
+    footer só é relido quando tamanho ou mtime do arquivo mudam. As consultas
+    usam o índice (base, grupo, competencia) e custam proporcionalmente ao
+    número de arquivos encontrados.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS catalog_files (
+            path TEXT PRIMARY KEY,
+            pasta TEXT NOT NULL,
+            base TEXT NOT NULL,
+            grupo TEXT NOT NULL,
+            uf TEXT NOT NULL,
+            competencia INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            num_rows INTEGER,
+            mtime REAL NOT NULL,
+            uncompressed_bytes INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_lookup
+            ON catalog_files (base, grupo, competencia, uf);
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_pasta
+            ON catalog_files (pasta);
+        CREATE TABLE IF NOT EXISTS catalog_dirs (
+            path TEXT PRIMARY KEY,
+            base TEXT NOT NULL,
+            grupo TEXT NOT NULL,
+            mtime REAL NOT NULL,
+            refreshed_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, root: str, db_path: str, refresh_interval: int = 300):
+        self.root = root
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(catalog_files)")}
+            if "uncompressed_bytes" not in columns:
+                # Catálogo anterior ao tamanho descomprimido: força a releitura dos footers
+                conn.execute("ALTER TABLE catalog_files ADD COLUMN uncompressed_bytes INTEGER")
+                conn.execute("DELETE FROM catalog_dirs")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _read_footer(path: str) -> Tuple[Optional[int], Optional[int]]:
+        """Número de linhas e tamanho descomprimido (soma dos row groups) do footer."""
+        try:
+            metadata = pq.read_metadata(path)
+            uncompressed = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+            return metadata.num_rows, uncompressed
+        except Exception as e:
+            logging.warning(f"[catalog] Footer ilegível em {path}: {e}")
+            return None, None
+
+    def refresh(self, base: str, grupo: str, force: bool = False) -> Dict[str, int]:
+        """
+        Atualiza incrementalmente o catálogo de um grupo.
+
+        Com force=False a pasta do grupo só é percorrida quando o seu mtime mudou
+        ou quando o último refresh completo tem mais de refresh_interval segundos.
+        Dentro do intervalo ainda é comparado o mtime de cada pasta de competência
+        conhecida, para que partes novas ou removidas apareçam na consulta seguinte.
+        """
+        group_dir = os.path.join(self.root, base, grupo)
+        stats = {"pastas": 0, "pastas_alteradas": 0, "arquivos_lidos": 0, "arquivos_removidos": 0}
+        with self._lock, self._connect() as conn:
+            try:
+                group_mtime = os.stat(group_dir).st_mtime
+            except FileNotFoundError:
+                conn.execute("DELETE FROM catalog_files WHERE base = ? AND grupo = ?", (base, grupo))
+                conn.execute("DELETE FROM catalog_dirs WHERE base = ? AND grupo = ?", (base, grupo))
+                return stats
+
+            row = conn.execute(
+                "SELECT mtime, refreshed_at FROM catalog_dirs WHERE path = ?", (group_dir,)
+            ).fetchone()
+            known_dirs = dict(conn.execute(
+                "SELECT path, mtime FROM catalog_dirs WHERE base = ? AND grupo = ? AND path != ?",
+                (base, grupo, group_dir)
+            ).fetchall())
+
+            if (not force and row is not None and row[0] == group_mtime
+                    and time.time() - row[1] < self.refresh_interval):
+                # Nenhuma pasta criada ou removida: só um stat por pasta de competência
+                for path, mtime in known_dirs.items():
+                    try:
+                        dir_mtime = os.stat(path).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if dir_mtime != mtime:
+                        uf, competencia = parse_file_name(os.path.basename(path), grupo)
+                        self._refresh_dir(conn, path, base, grupo, uf, competencia, dir_mtime, stats)
+                if stats["pastas_alteradas"]:
+                    logging.info(f"[catalog] Refresh {base}/{grupo}: {stats}")
+                return stats
+
+            seen_dirs = set()
+            with os.scandir(group_dir) as entries:
+                for entry in entries:
+                    parsed = parse_file_name(entry.name, grupo)
+                    if parsed is None or not entry.is_dir():
+                        continue
+                    uf, competencia = parsed
+                    stats["pastas"] += 1
+                    seen_dirs.add(entry.path)
+                    dir_mtime = entry.stat().st_mtime
+                    if not force and known_dirs.get(entry.path) == dir_mtime:
+                        continue
+                    self._refresh_dir(conn, entry.path, base, grupo, uf, competencia, dir_mtime, stats)
+
+            for gone in set(known_dirs) - seen_dirs:
+                removed = conn.execute("DELETE FROM catalog_files WHERE pasta = ?", (gone,)).rowcount
+                stats["arquivos_removidos"] += removed
+                conn.execute("DELETE FROM catalog_dirs WHERE path = ?", (gone,))
+
+            conn.execute(
+                "INSERT OR REPLACE INTO catalog_dirs VALUES (?, ?, ?, ?, ?)",
+                (group_dir, base, grupo, group_mtime, time.time())
+            )
+        logging.info(f"[catalog] Refresh {base}/{grupo}: {stats}")
+        return stats
+
+    def _refresh_dir(self, conn: sqlite3.Connection, pasta: str, base: str, grupo: str,
+                     uf: str, competencia: int, dir_mtime: float, stats: Dict[str, int]) -> None:
+        stats["pastas_alteradas"] += 1
+        self._refresh_folder(conn, pasta, base, grupo, uf, competencia, stats)
+        conn.execute(
+            "INSERT OR REPLACE INTO catalog_dirs VALUES (?, ?, ?, ?, ?)",
+            (pasta, base, grupo, dir_mtime, time.time())
+        )
+
+    def _refresh_folder(self, conn: sqlite3.Connection, pasta: str, base: str, grupo: str,
+                        uf: str, competencia: int, stats: Dict[str, int]) -> None:
+        known = {
+            path: (size, mtime) for path, size, mtime in conn.execute(
+                "SELECT path, size_bytes, mtime FROM catalog_files "
+                "WHERE pasta = ? AND uncompressed_bytes IS NOT NULL", (pasta,)
+            ).fetchall()
+        }
+        seen = set()
+        with os.scandir(pasta) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".parquet") or not entry.is_file():
+                    continue
+                seen.add(entry.path)
+                st = entry.stat()
+                if known.get(entry.path) == (st.st_size, st.st_mtime):
+                    continue
+                stats["arquivos_lidos"] += 1
+                num_rows, uncompressed = self._read_footer(entry.path)
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO catalog_files
+                        (path, pasta, base, grupo, uf, competencia, size_bytes, num_rows, mtime, uncompressed_bytes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (entry.path, pasta, base, grupo, uf, competencia,
+                     st.st_size, num_rows, st.st_mtime, uncompressed)
+                )
+        known_all = {
+            path for (path,) in conn.execute("SELECT path FROM catalog_files WHERE pasta = ?", (pasta,))
+        }
+        for gone in known_all - seen:
+            conn.execute("DELETE FROM catalog_files WHERE path = ?", (gone,))
+            stats["arquivos_removidos"] += 1
+
+    def lookup(self, base: str, grupo: str, comp_inicio: int, comp_fim: int) -> List[Dict[str, Any]]:
+        """Retorna os arquivos do grupo no intervalo de competências (YYYYMM, inclusivo)."""
+        self.refresh(base, grupo)
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                """
+                SELECT path, uf, competencia, size_bytes, num_rows, uncompressed_bytes, mtime
+                FROM catalog_files
+                WHERE base = ? AND grupo = ? AND competencia BETWEEN ? AND ?
+                ORDER BY competencia, uf, path
+                """,
+                (base, grupo, comp_inicio, comp_fim)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def describe(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """Metadados de uma lista de arquivos; arquivos fora do catálogo usam os.stat."""
+        found = {}
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            for i in range(0, len(paths), 500):
+                lote = paths[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT path, uf, competencia, size_bytes, num_rows, uncompressed_bytes, mtime FROM catalog_files "
+                    f"WHERE path IN ({', '.join('?' * len(lote))})",
+                    lote
+                ).fetchall()
+                found.update({row["path"]: dict(row) for row in rows})
+        entries = []
+        for path in paths:
+            if path not in found:
+                st = os.stat(path)
+                num_rows, uncompressed = self._read_footer(path)
+                found[path] = {
+                    "path": path, "size_bytes": st.st_size, "mtime": st.st_mtime,
+                    "num_rows": num_rows, "uncompressed_bytes": uncompressed
+                }
+            entries.append(found[path])
+        return entries
+
+def competencia_to_int(comp: str) -> int:
+    """Converte MM/YYYY em YYYYMM."""
+    dt = datetime.strptime(comp, '%m/%Y')
+    return dt.year * 100 + dt.month
 
 def get_parquet_files(base: str, grupo: str, comp_inicio: str, comp_fim: str) -> List[str]:
     log_execution("Iniciando busca de arquivos Parquet")
-    import glob
-    ufs = ['AC','AL','AP','AM','BA','CE','DF','ES','GO','MA','MT','MS','MG',
-           'PA','PB','PR','PE','PI','RJ','RN','RS','RO','RR','SC','SP','SE','TO']
     logging.info(f"[get_parquet_files] Parâmetros: base={base}, grupo={grupo}, intervalo={comp_inicio} a {comp_fim}")
-    
-    files = []
-    start_date = datetime.strptime(comp_inicio, '%m/%Y')
-    end_date = datetime.strptime(comp_fim, '%m/%Y')
-    current_date = start_date
-    while current_date <= end_date:
-        periodo = current_date.strftime('%y%m')
-        for uf in ufs:
-            nome_pasta = f"{grupo}{uf}{periodo}.parquet"
-            caminho = os.path.join("parquet_files", base, grupo, nome_pasta)
-            if os.path.isdir(caminho):
-                found = glob.glob(os.path.join(caminho, "*.parquet"))
-                if found:
-                    logging.info(f"Encontrados {len(found)} arquivos em {nome_pasta}")
-                    files.extend(found)
-                else:
-                    logging.debug(f"Pasta {nome_pasta} vazia")
-            else:
-                logging.debug(f"Pasta não encontrada: {caminho}")
-        # Avança para o próximo mês
-        if current_date.month == 12:
-            current_date = current_date.replace(year=current_date.year + 1, month=1)
-        else:
-            current_date = current_date.replace(month=current_date.month + 1)
+    entries = catalog.lookup(base, grupo, competencia_to_int(comp_inicio), competencia_to_int(comp_fim))
+    files = [entry["path"] for entry in entries]
     logging.info(f"Total de arquivos coletados: {len(files)}")
     log_execution("Finalizada busca de arquivos Parquet", False)
     return files
+
+# -----------------------------------------------------------------------------
+# Pool de conexões DuckDB por job
+# -----------------------------------------------------------------------------
+class JobProgress:
+    """
+    Contadores e tempos por fase de um job, atualizados por process_data e
+    save_results. Com publisher, um snapshot é publicado (no máximo a cada
+    interval segundos, e sempre nas trocas de fase) para consulta externa.
+    """
+
+    COUNTERS = ("files_total", "files_scanned", "bytes_read", "rows_scanned",
+                "rows_filtered", "rows_converted", "rows_copied")
+
+    def __init__(self, publisher=None, interval: float = 1.0):
+        self.publisher = publisher
+        self.interval = interval
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.phase_name: Optional[str] = None
+        self.phase_started: Dict[str, float] = {}
+        self.phase_elapsed: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._last_publish = 0.0
+
+    def add(self, counter: str, value: int) -> None:
+        with self._lock:
+            self.counters[counter] += value
+        self.publish()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Marca a fase atual e acumula o tempo gasto nela (fases podem se sobrepor)."""
+        start = time.time()
+        with self._lock:
+            self.phase_name = name
+            self.phase_started[name] = start
+        self.publish(force=True)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phase_elapsed[name] += time.time() - start
+                self.phase_started.pop(name, None)
+            self.publish(force=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            elapsed = dict(self.phase_elapsed)
+            for name, start in self.phase_started.items():
+                elapsed[name] = elapsed.get(name, 0.0) + now - start
+            snapshot = {
+                **self.counters,
+                "phase": self.phase_name,
+                "phase_elapsed_s": {name: round(value, 2) for name, value in elapsed.items()},
+            }
+        files_total = snapshot["files_total"]
+        if files_total:
+            snapshot["percent_files"] = round(100 * snapshot["files_scanned"] / files_total, 1)
+        # Estimativa da carga: linhas já convertidas que ainda faltam copiar, no ritmo atual
+        copying = elapsed.get("carga")
+        if copying and snapshot["rows_copied"] and snapshot["rows_converted"] > snapshot["rows_copied"]:
+            rate = snapshot["rows_copied"] / copying
+            snapshot["copy_eta_s"] = round((snapshot["rows_converted"] - snapshot["rows_copied"]) / rate, 1)
+        return snapshot
+
+    def publish(self, force: bool = False) -> None:
+        if self.publisher is None:
+            return
+        now = time.time()
+        if not force and now - self._last_publish < self.interval:
+            return
+        self._last_publish = now
+        try:
+            self.publisher(self.snapshot())
+        except Exception as e:
+            logging.warning(f"Falha ao publicar progresso: {e}")
+
+class JobCancelled(Exception):
+    """O job foi cancelado durante a execução."""
+
+class JobContext:
+    """
+    Estado de execução de um job: conexão DuckDB exclusiva, sufixo próprio para
+    as tabelas temporárias e o alias do Postgres anexado (pg_db_{tag}), os
+    contadores de progresso e o sinal de cancelamento.
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, job_id: Optional[str] = None,
+                 progress: Optional[JobProgress] = None):
+        self.con = con
+        self.job_id = job_id or str(uuid4())
+        self.progress = progress or JobProgress()
+        self.tag = re.sub(r'[^0-9a-zA-Z]', '', self.job_id)[:12].lower()
+        self.tables = set()
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Interrompe a consulta DuckDB e sinaliza o cancelamento à carga no PostgreSQL."""
+        self.cancelled.set()
+        self.con.interrupt()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled.is_set():
+            raise JobCancelled(f"Job {self.job_id} cancelado")
+
+    def table(self, name: str) -> str:
+        """Nome de tabela com escopo do job, ex.: temp_converted_1a2b3c4d5e6f."""
+        scoped = f"{name}_{self.tag}"
+        self.tables.add(scoped)
+        return scoped
+
+    def cleanup(self) -> None:
+        for name in self.tables:
+            self.con.execute(f"DROP TABLE IF EXISTS {name}")
+        self.tables.clear()
+
+class DuckDBPool:
+    """
+    Pool de conexões DuckDB em memória, uma por job em execução.
+
+    Cada conexão é um banco independente, então jobs concorrentes não
+    compartilham tabelas nem anexos. O número de jobs simultâneos é limitado
+    por max_jobs; os excedentes aguardam uma conexão livre.
+
+    O orçamento de memória (memory_budget) e as CPUs são divididos igualmente
+    entre os jobs: cada conexão recebe memory_limit, threads e um temp_directory
+    próprio, para que consultas acima do limite façam spill em disco em vez de
+    esgotar a memória do servidor.
+    """
+
+    def __init__(self, max_jobs: int, memory_budget: int, temp_directory: str,
+                 threads_per_job: Optional[int] = None):
+        self.max_jobs = max_jobs
+        self.threads_per_job = threads_per_job or max(1, (os.cpu_count() or 1) // max_jobs)
+        self.memory_per_job = max(256 * 1024**2, memory_budget // max_jobs)
+        self.temp_directory = temp_directory
+        self._idle = Queue()
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        self._created = 0
+        self._created_lock = threading.Lock()
+
+    def _new_connection(self) -> duckdb.DuckDBPyConnection:
+        with self._created_lock:
+            self._created += 1
+            numero = self._created
+        spill_dir = os.path.join(self.temp_directory, f"conexao_{os.getpid()}_{numero}")
+        os.makedirs(spill_dir, exist_ok=True)
+        con = duckdb.connect(database=':memory:')
+        con.execute(f"SET threads = {self.threads_per_job}")
+        con.execute(f"SET memory_limit = '{self.memory_per_job // 1024**2}MiB'")
+        con.execute(f"SET temp_directory = '{spill_dir}'")
+        logging.info(
+            f"[pool] Conexão DuckDB {numero}: threads={self.threads_per_job}, "
+            f"memory_limit={self.memory_per_job // 1024**2}MiB, temp_directory={spill_dir}"
+        )
+        return con
+
+    @contextmanager
+    def job(self, job_id: Optional[str] = None, progress: Optional[JobProgress] = None):
+        """Reserva uma conexão para o job e remove as tabelas do job ao final."""
+        self._slots.acquire()
+        try:
+            try:
+                con = self._idle.get_nowait()
+            except Empty:
+                con = self._new_connection()
+            ctx = JobContext(con, job_id, progress)
+            try:
+                yield ctx
+            finally:
+                ctx.cleanup()
+                self._idle.put(con)
+        finally:
+            self._slots.release()
+
+# -----------------------------------------------------------------------------
+# Cache de resultados em disco
+# -----------------------------------------------------------------------------
+def canonical_params(params: QueryParams) -> Dict[str, Any]:
+    """Forma canônica dos parâmetros que definem o conteúdo do resultado."""
+    data = params.model_dump(exclude={"table_name"})
+    data["cnes_list"] = sorted(set(params.cnes_list))
+    return data
+
+class ResultCache:
+    """
+    Cache de resultados em Parquet (zstd) no disco local, com evicção LRU por bytes.
+
+    A chave combina os parâmetros canônicos da consulta, a variante do resultado
+    (ex.: "table" com colunas de erro, "stream" sem elas) e um carimbo de versão
+    dos arquivos lidos (caminho, tamanho e mtime vindos do catálogo). Qualquer
+    alteração nos arquivos gera uma chave nova; as entradas antigas saem pela evicção.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, params: QueryParams, entries: List[Dict[str, Any]], variant: str) -> str:
+        versao = [(e["path"], e["size_bytes"], e["mtime"]) for e in entries]
+        payload = json.dumps(
+            {"params": canonical_params(params), "variant": variant, "data_version": versao},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: str) -> Optional[BinaryIO]:
+        """
+        Abre o resultado em cache (atualizando o LRU) e devolve o arquivo aberto,
+        ou None; quem recebe o arquivo deve fechá-lo. Uma evicção concorrente,
+        deste ou de outro processo, só remove o nome do diretório: o arquivo já
+        aberto continua legível até o close.
+        """
+        if not self.enabled:
+            return None
+        try:
+            handle = open(self.path(key), "rb")
+        except FileNotFoundError:
+            return None
+        os.utime(handle.fileno())
+        return handle
+
+    def put_table(self, con: duckdb.DuckDBPyConnection, table: str, key: str) -> None:
+        """Grava uma tabela DuckDB no cache."""
+        if not self.enabled:
+            return
+        tmp_path = f"{self.path(key)}.{uuid4().hex}.tmp"
+        try:
+            con.execute(f"COPY {table} TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            self.commit(tmp_path, key)
+        except Exception as e:
+            logging.warning(f"[cache] Falha ao gravar resultado {key[:12]}: {e}")
+            self.discard(tmp_path)
+
+    def open_writer(self, key: str, schema: pa.Schema) -> Tuple[pq.ParquetWriter, str]:
+        """Abre um writer Parquet temporário para gravar o resultado batch a batch."""
+        tmp_path = f"{self.path(key)}.{uuid4().hex}.tmp"
+        return pq.ParquetWriter(tmp_path, schema, compression="zstd"), tmp_path
+
+    def commit(self, tmp_path: str, key: str) -> None:
+        if os.path.getsize(tmp_path) > self.max_bytes:
+            logging.info(f"[cache] Resultado {key[:12]} maior que o limite do cache; descartado")
+            self.discard(tmp_path)
+            return
+        os.replace(tmp_path, self.path(key))
+        logging.info(f"[cache] Resultado {key[:12]} armazenado")
+        self.evict()
+
+    @staticmethod
+    def discard(tmp_path: str) -> None:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> None:
+        """Remove as entradas menos usadas até o total caber em max_bytes."""
+        with self._lock:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".parquet") and entry.is_file():
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    logging.info(f"[cache] Evicção de {os.path.basename(path)} ({size} bytes)")
+                except FileNotFoundError:
+                    pass
+
+# -----------------------------------------------------------------------------
+# Controle de admissão das consultas pesadas
+# -----------------------------------------------------------------------------
+class ResourceMonitor:
+    """Amostra memória e CPU do servidor em uma thread de fundo."""
+
+    def __init__(self, interval: float, max_memory_percent: float, max_cpu_percent: float):
+        self.interval = interval
+        self.max_memory_percent = max_memory_percent
+        self.max_cpu_percent = max_cpu_percent
+        self.memory_percent = 0.0
+        self.memory_used = 0
+        self.cpu_percent = 0.0
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            psutil.cpu_percent()  # primeira leitura só inicializa o contador
+            self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            mem = psutil.virtual_memory()
+            self.memory_percent = mem.percent
+            self.memory_used = mem.used
+            self.cpu_percent = psutil.cpu_percent(interval=self.interval)
+
+    def overloaded(self) -> bool:
+        return self.memory_percent > self.max_memory_percent or self.cpu_percent > self.max_cpu_percent
+
+    def metrics(self) -> Dict[str, str]:
+        return {
+            "memory_used": f"{self.memory_used/1024**3:.1f}GB",
+            "memory_percent": f"{self.memory_percent}%",
+            "cpu_usage": f"{self.cpu_percent}%"
+        }
+
+class AdmissionRejected(Exception):
+    pass
+
+class AdmissionController:
+    """
+    Fila limitada para as consultas pesadas, com custo estimado em bytes.
+
+    Cada consulta reserva o custo estimado (bytes descomprimidos dos arquivos
+    lidos, limitado ao memory_limit de um job) de uma capacidade total igual ao
+    orçamento de memória do DuckDB. As consultas são admitidas em ordem de
+    chegada quando o custo cabe e o servidor não está sobrecarregado; sem
+    nenhuma consulta em execução, a primeira da fila é sempre admitida. Só há
+    rejeição quando a fila está cheia ou a espera passa de timeout.
+    """
+
+    def __init__(self, capacity: int, max_queue: int, timeout: float, monitor: ResourceMonitor):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.monitor = monitor
+        self.in_use = 0
+        self.running = 0
+        self._queue: List[object] = []
+        self._cond = threading.Condition()
+
+    def estimate_cost(self, files: List[str], memory_per_job: int) -> int:
+        entries = catalog.describe(files)
+        scanned = sum(entry.get("uncompressed_bytes") or entry["size_bytes"] for entry in entries)
+        return max(1, min(scanned, memory_per_job, self.capacity))
+
+    def _can_admit(self, ticket: object, cost: int) -> bool:
+        if self._queue[0] is not ticket:
+            return False
+        if self.running == 0:
+            return True
+        return self.in_use + cost <= self.capacity and not self.monitor.overloaded()
+
+    def acquire(self, cost: int) -> Callable[[], None]:
+        """Aguarda a admissão e retorna a função que libera a reserva."""
+        ticket = object()
+        deadline = time.time() + self.timeout
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise AdmissionRejected(f"Fila de consultas cheia ({self.max_queue})")
+            self._queue.append(ticket)
+            try:
+                while not self._can_admit(ticket, cost):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise AdmissionRejected(f"Consulta aguardou mais de {self.timeout:.0f}s na fila")
+                    # Reavalia periodicamente, pois a carga do servidor muda sem notificação
+                    self._cond.wait(min(remaining, self.monitor.interval))
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            self.in_use += cost
+            self.running += 1
+
+        released = threading.Event()
+
+        def release() -> None:
+            if released.is_set():
+                return
+            released.set()
+            with self._cond:
+                self.in_use -= cost
+                self.running -= 1
+                self._cond.notify_all()
+
+        return release
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": self.running,
+                "queued": len(self._queue),
+                "reserved_bytes": self.in_use,
+                "capacity_bytes": self.capacity,
+            }
+
+# -----------------------------------------------------------------------------
+# Funções de Utilidade para Processamento e Conversão
+# -----------------------------------------------------------------------------
+def log_execution(message: str, is_start: bool = True) -> None:
+    marker = ">>>" if is_start else "<<<"
+    logging.info(f"{marker} {message}")
+
  
 def get_schema_info(grupo: str) -> dict:
     grupo = grupo.strip().upper()
@@ -691,21 +1414,147 @@ def split_csv(file_path: str, lines_per_chunk: int, output_dir: str) -> List[str
     return chunk_files
 
 # -----------------------------------------------------------------------------
-# Função de salvamento otimizado utilizando COPY e chunks
+# Sink de COPY binário paralelo para o PostgreSQL
 # -----------------------------------------------------------------------------
-def save_results(source_table: str, target_table: str, params: QueryParams) -> None:
-    """Processo de salvamento otimizado com validação em 5 etapas"""
+def _next_batch(reader: pa.RecordBatchReader) -> Optional[pa.RecordBatch]:
     try:
-        # =====================================================================
-        # Etapa 1: Preparação e logging
-        # =====================================================================
-        logging.info("=== INÍCIO DO SALVAMENTO ===")
-        logging.info(f"Parâmetros: {params.model_dump()}")
-        logging.info(f"Origem: {source_table} → Destino: {target_table}")
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
 
-        # =====================================================================
-        # Etapa 2: Obtenção do schema com verificação de tipos
-        # =====================================================================
+def split_table_name(name: str) -> Tuple[Optional[str], str]:
+    """Separa 'schema.tabela' em (schema, tabela); sem schema retorna (None, tabela)."""
+    if not TABELA_RE.match(name):
+        raise ValueError(f"Nome de tabela inválido: {name}")
+    schema, _, table = name.rpartition(".")
+    return schema or None, table
+
+def _batch_records(batch: pa.RecordBatch) -> List[tuple]:
+    return list(zip(*(column.to_pylist() for column in batch.columns)))
+
+async def _copy_batches_async(
+    reader: pa.RecordBatchReader,
+    table: str,
+    columns: List[str],
+    parallelism: int,
+    progress: Optional["JobProgress"] = None,
+    cancelled: Optional[threading.Event] = None
+) -> int:
+    """
+    Distribui os record batches do DuckDB entre N conexões asyncpg, cada uma
+    executando COPY ... FROM STDIN (FORMAT BINARY) via copy_records_to_table.
+    Se cancelled for sinalizado, a cópia para antes do próximo batch.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=parallelism * 2)
+    total_rows = 0
+    schema, table_name = split_table_name(table)
+
+    async def producer():
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                raise JobCancelled("Cópia para o PostgreSQL cancelada")
+            batch = await loop.run_in_executor(None, _next_batch, reader)
+            if batch is None:
+                break
+            await queue.put(batch)
+        for _ in range(parallelism):
+            await queue.put(None)
+
+    async def writer(conn: asyncpg.Connection):
+        nonlocal total_rows
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            records = await loop.run_in_executor(None, _batch_records, batch)
+            await conn.copy_records_to_table(table_name, schema_name=schema, records=records, columns=columns)
+            total_rows += batch.num_rows
+            if progress is not None:
+                progress.add("rows_copied", batch.num_rows)
+
+    conns = await asyncio.gather(*(
+        asyncpg.connect(
+            user=settings.db_user,
+            password=settings.db_pass,
+            database=settings.db_name,
+            host=settings.db_host,
+            port=int(settings.db_port),
+            timeout=10
+        )
+        for _ in range(parallelism)
+    ))
+    tasks = [asyncio.create_task(producer())] + [asyncio.create_task(writer(c)) for c in conns]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*(c.close() for c in conns), return_exceptions=True)
+    return total_rows
+
+def copy_binary_parallel(
+    con: duckdb.DuckDBPyConnection,
+    source_table: str,
+    target_table: str,
+    columns: List[str],
+    parallelism: int,
+    batch_size: int,
+    progress: Optional["JobProgress"] = None,
+    cancelled: Optional[threading.Event] = None
+) -> int:
+    """Copia uma tabela DuckDB para o PostgreSQL com COPY binário em paralelo"""
+    start = time.time()
+    reader = con.execute(f"SELECT * FROM {source_table}").fetch_record_batch(batch_size)
+    total_rows = asyncio.run(
+        _copy_batches_async(reader, target_table, columns, parallelism, progress, cancelled)
+    )
+    elapsed = max(time.time() - start, 1e-6)
+    logging.info(
+        f"COPY binário concluído: {total_rows} registros em {elapsed:.1f}s "
+        f"({total_rows / elapsed:,.0f} registros/s, {parallelism} conexões)"
+    )
+    return total_rows
+
+# -----------------------------------------------------------------------------
+# Função de salvamento otimizado utilizando COPY e chunks
+# -----------------------------------------------------------------------------
+class StagedLoad:
+    """
+    Carga de resultados no PostgreSQL em etapas.
+
+    Cada append copia uma tabela DuckDB para a tabela de carga do job
+    ({destino}_carga_{tag}, no mesmo schema do destino, UNLOGGED se
+    PG_COPY_UNLOGGED). A cópia roda numa
+    thread própria, sobre um cursor da conexão do job, enquanto o próximo chunk
+    é processado. finish() valida a contagem de registros, remove as colunas de
+    erro sem ocorrências e substitui a tabela destino numa única transação;
+    abort() descarta a tabela de carga e mantém a tabela destino intacta.
+    O cancelamento do job é verificado entre os chunks e entre os batches da
+    cópia; um job cancelado levanta JobCancelled e a carga deve ser abortada.
+    """
+
+    def __init__(self, target_table: str, params: QueryParams, job: "JobContext"):
+        # Destino "schema.tabela": a tabela de carga fica no mesmo schema e o
+        # RENAME final recebe só o nome da tabela
+        schema, self.table = split_table_name(target_table.lower())
+        qualifier = f"{schema}." if schema else ""
+        self.target_table = f"{qualifier}{self.table}"
+        self.params = params
+        self.job = job
+        self.load_table = f"{qualifier}{self.table}_carga_{job.tag}"
+        self.unlogged = settings.pg_copy_unlogged
+        self.columns: Optional[List[str]] = None
+        self.rows = 0
+        self.chunks = 0
+        self.error_counts: Dict[str, int] = defaultdict(int)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    # -------------------------------------------------------------------------
+    # Etapas 2 e 3: schema da origem e criação da tabela de carga
+    # -------------------------------------------------------------------------
+    def _create_load_table(self, source_table: str) -> None:
         logging.info("Obtendo schema da tabela origem...")
         schema_query = f"""
             SELECT 
@@ -714,105 +1563,598 @@ def save_results(source_table: str, target_table: str, params: QueryParams) -> N
                 CASE 
                     WHEN data_type LIKE 'VARCHAR%' THEN 'TEXT'
                     WHEN data_type LIKE 'DECIMAL%' THEN 'NUMERIC'
+                    WHEN data_type = 'DOUBLE' THEN 'DOUBLE PRECISION'
+                    WHEN data_type = 'HUGEINT' THEN 'NUMERIC'
                     ELSE UPPER(data_type)
                 END AS pg_type
             FROM information_schema.columns 
             WHERE table_name = '{source_table.lower()}'
+            ORDER BY ordinal_position
         """
-        schema = duckdb.execute(schema_query).fetchall()
+        schema = self.job.con.execute(schema_query).fetchall()
         logging.info(f"Schema detectado ({len(schema)} colunas):\n{pd.DataFrame(schema)}")
 
-        # =====================================================================
-        # Etapa 3: Criação da tabela com transação atômica
-        # =====================================================================
-        logging.info("Criando tabela no PostgreSQL...")
+        logging.info("Criando tabela de carga no PostgreSQL...")
         columns = []
         for col in schema:
-            pg_type = GRUPOS_INFO.get(params.grupo, {}).get('colunas', {}).get(col[0].lower(), col[2])
+            pg_type = GRUPOS_INFO.get(self.params.grupo, {}).get('colunas', {}).get(col[0].lower(), col[2])
             columns.append(f'"{col[0]}" {pg_type}')
-        
-        create_table_sql = f"CREATE TABLE IF NOT EXISTS {target_table} ({', '.join(columns)})"
-        
-        with engine.connect() as conn:
-            # Transação explícita com commit garantido
-            with conn.begin():
-                logging.info(f"Executando DDL:\n{create_table_sql}")
-                conn.execute(text(f"DROP TABLE IF EXISTS {target_table} CASCADE"))
-                conn.execute(text(create_table_sql))
-            
-            # Verificação pós-criação
-            exists = conn.execute(text(f"""
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.tables 
-                    WHERE table_name = '{target_table.lower()}'
-                )
-            """)).scalar()
-            
-            if not exists:
-                raise RuntimeError(f"Falha na criação da tabela {target_table}")
-            
-            logging.info("Tabela criada com sucesso - Verificação OK")
 
-        # =====================================================================
-        # Etapa 4: Transferência de dados com conexão persistente
-        # =====================================================================
-        logging.info("Iniciando transferência via COPY...")
-        connection_params = {
-            "dbname": settings.db_name,
-            "user": settings.db_user,
-            "password": settings.db_pass,
-            "host": settings.db_host,
-            "port": settings.db_port,
-            "connect_timeout": 10
-        }
-        
+        unlogged = "UNLOGGED " if self.unlogged else ""
+        create_table_sql = f"CREATE {unlogged}TABLE {self.load_table} ({', '.join(columns)})"
+
+        with engine.begin() as conn:
+            logging.info(f"Executando DDL:\n{create_table_sql}")
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.load_table} CASCADE"))
+            conn.execute(text(create_table_sql))
+        self.columns = [col[0] for col in schema]
+        logging.info(f"Tabela {self.load_table} criada com sucesso")
+
+    # -------------------------------------------------------------------------
+    # Etapa 4: transferência de dados
+    # -------------------------------------------------------------------------
+    def append(self, source_table: str, drop_source: bool = False) -> None:
+        """Agenda a cópia de source_table (removida após a cópia se drop_source)."""
+        self.job.check_cancelled()
+        con = self.job.con
+        if self.columns is None:
+            self._create_load_table(source_table)
+        else:
+            source_columns = [col[0] for col in con.execute(f"DESCRIBE {source_table}").fetchall()]
+            if source_columns != self.columns:
+                raise ValueError(f"Schema do chunk diverge da tabela de carga: {source_columns} vs {self.columns}")
+
+        error_cols = [col for col in self.columns if col.startswith('new_')]
+        counts = ", ".join(["COUNT(*)"] + [f"COUNT({col})" for col in error_cols])
+        row = con.execute(f"SELECT {counts} FROM {source_table}").fetchone()
+        self.rows += row[0]
+        for col, error_count in zip(error_cols, row[1:]):
+            self.error_counts[col] += error_count
+
+        self.wait()
+        self.job.check_cancelled()
+        self.chunks += 1
+        self._pending = self._executor.submit(self._copy, source_table, self.chunks, drop_source)
+
+    def _copy(self, source_table: str, chunk: int, drop_source: bool) -> None:
+        cursor = self.job.con.cursor()
+        progress = self.job.progress
         try:
-            # Conexão explícita com tratamento de erro
-            duckdb.execute("INSTALL postgres; LOAD postgres;")
-            attach_cmd = f"ATTACH '{' '.join(f'{k}={v}' for k,v in connection_params.items())}' AS pg_db (TYPE POSTGRES)"
-            duckdb.execute(attach_cmd)
-            
-            # Operação de COPY com batch size
-            copy_query = f"""
-                INSERT INTO pg_db.{target_table} 
-                SELECT * FROM {source_table}
-            """
-            
-            result = duckdb.execute(copy_query)
-            logging.info(f"Dados transferidos - {result.fetchall()[0][0]} registros")
-            
+            logging.info(f"[{self.job.job_id}] Transferindo chunk {chunk} ({source_table} → {self.load_table})")
+            with progress.phase("carga"):
+                if settings.pg_copy_mode == "binary":
+                    copy_binary_parallel(
+                        cursor, source_table, self.load_table, self.columns,
+                        settings.pg_copy_parallelism, settings.pg_copy_batch_size, progress,
+                        self.job.cancelled
+                    )
+                else:
+                    copied = copy_via_attach(cursor, source_table, self.load_table, f"pg_db_{self.job.tag}_{chunk}")
+                    progress.add("rows_copied", copied)
+            if drop_source:
+                cursor.execute(f"DROP TABLE IF EXISTS {source_table}")
         except Exception as copy_error:
             logging.error("Falha na transferência de dados:")
             logging.error(f"Tipo: {type(copy_error).__name__}")
             logging.error(f"Mensagem: {str(copy_error)}")
             raise
+        finally:
+            cursor.close()
+
+    def wait(self) -> None:
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    # -------------------------------------------------------------------------
+    # Etapa 5: validação e troca atômica
+    # -------------------------------------------------------------------------
+    def finish(self) -> None:
+        self.wait()
+        self._executor.shutdown()
+        self.job.check_cancelled()
+        with self.job.progress.phase("validacao"):
+            self._validate_and_swap()
+
+    def _validate_and_swap(self) -> None:
+        if self.columns is None:
+            raise RuntimeError("Nenhum dado foi carregado na tabela de carga")
 
-        # =====================================================================
-        # Etapa 5: Validação pós-transferência
-        # =====================================================================
         with engine.connect() as conn:
-            pg_count = conn.execute(text(f"SELECT COUNT(*) FROM {target_table}")).scalar()
-            duckdb_count = duckdb.execute(f"SELECT COUNT(*) FROM {source_table}").fetchone()[0]
-            
-            if pg_count != duckdb_count:
-                raise ValueError(f"Divergência de registros: DuckDB={duckdb_count} vs PG={pg_count}")
-            
-            logging.info(f"Validação OK - Registros consistentes: {pg_count}")
+            pg_count = conn.execute(text(f"SELECT COUNT(*) FROM {self.load_table}")).scalar()
+        if pg_count != self.rows:
+            raise ValueError(f"Divergência de registros: DuckDB={self.rows} vs PG={pg_count}")
+        logging.info(f"Validação OK - Registros consistentes: {pg_count} ({self.chunks} chunks)")
+
+        with engine.begin() as conn:
+            for col, error_count in self.error_counts.items():
+                if error_count > 0:
+                    logging.warning(f"Erros detectados em {col}: {error_count} registros")
+                else:
+                    conn.execute(text(f'ALTER TABLE {self.load_table} DROP COLUMN "{col}"'))
+            if self.unlogged:
+                conn.execute(text(f"ALTER TABLE {self.load_table} SET LOGGED"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.target_table} CASCADE"))
+            conn.execute(text(f"ALTER TABLE {self.load_table} RENAME TO {self.table}"))
+        logging.info(f"Tabela {self.load_table} promovida para {self.target_table}")
 
+    def abort(self) -> None:
+        try:
+            self.wait()
+        except Exception:
+            pass
+        self._executor.shutdown()
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {self.load_table} CASCADE"))
+        except Exception as drop_error:
+            logging.warning(f"Erro ao remover tabela de carga: {str(drop_error)}")
+
+def save_results(source_table: str, target_table: str, params: QueryParams,
+                 job: Optional["JobContext"] = None) -> None:
+    """
+    Processo de salvamento otimizado com validação em 5 etapas.
+
+    Os dados passam pela tabela de carga do StagedLoad e só substituem a tabela
+    destino após a validação. No modo "binary" (PG_COPY_MODE) a cópia usa COPY
+    binário em paralelo; o modo "attach" usa a extensão postgres do DuckDB.
+    """
+    if job is None:
+        job = JobContext(duckdb.default_connection)
+    # =========================================================================
+    # Etapa 1: Preparação e logging
+    # =========================================================================
+    logging.info("=== INÍCIO DO SALVAMENTO ===")
+    logging.info(f"Parâmetros: {params.model_dump()}")
+    logging.info(f"Origem: {source_table} → Destino: {target_table}")
+
+    load = StagedLoad(target_table, params, job)
+    try:
+        load.append(source_table)
+        load.finish()
     except Exception as e:
         logging.error("Falha crítica no processo de salvamento", exc_info=True)
+        load.abort()
         raise RuntimeError(f"Erro durante o salvamento: {str(e)}") from e
 
+def copy_via_attach(
+    con: duckdb.DuckDBPyConnection,
+    source_table: str,
+    target_table: str,
+    pg_alias: str
+) -> int:
+    """Transfere os dados com a extensão postgres do DuckDB (INSERT ... SELECT único)"""
+    connection_params = {
+        "dbname": settings.db_name,
+        "user": settings.db_user,
+        "password": settings.db_pass,
+        "host": settings.db_host,
+        "port": settings.db_port,
+        "connect_timeout": 10
+    }
+    start = time.time()
+    con.execute("INSTALL postgres; LOAD postgres;")
+    attach_cmd = f"ATTACH '{' '.join(f'{k}={v}' for k,v in connection_params.items())}' AS {pg_alias} (TYPE POSTGRES)"
+    con.execute(attach_cmd)
+    try:
+        copy_query = f"""
+            INSERT INTO {pg_alias}.{target_table} 
+            SELECT * FROM {source_table}
+        """
+        total_rows = con.execute(copy_query).fetchall()[0][0]
     finally:
-        # =====================================================================
-        # Limpeza de recursos
-        # =====================================================================
-        logging.info("Executando limpeza final...")
         try:
-            duckdb.execute("DETACH pg_db")
+            con.execute(f"DETACH {pg_alias}")
             logging.info("Conexão PostgreSQL liberada")
         except Exception as detach_error:
             logging.warning(f"Erro ao desconectar: {str(detach_error)}")
+    elapsed = max(time.time() - start, 1e-6)
+    logging.info(
+        f"Dados transferidos - {total_rows} registros em {elapsed:.1f}s "
+        f"({total_rows / elapsed:,.0f} registros/s)"
+    )
+    return total_rows
+
+# -----------------------------------------------------------------------------
+# Agendador de jobs persistente (SQLite) com processos worker
+# -----------------------------------------------------------------------------
+class JobStore:
+    """
+    Fila persistente dos jobs de /query/async em SQLite.
+
+    O estado sobrevive a reinícios e é compartilhado por todos os processos
+    (workers uvicorn e processos worker). Um job é reservado atomicamente por um
+    único UPDATE ... RETURNING, na ordem prioridade (maior primeiro) e criação.
+    Falhas são reenfileiradas com backoff exponencial até max_attempts; jobs em
+    execução cujo heartbeat parou (worker morto) voltam para a fila.
+
+    Submissões idênticas (mesmos parâmetros canônicos e tabela destino) enquanto
+    um job equivalente está na fila ou em execução são anexadas a ele (single-flight).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            params TEXT NOT NULL,
+            table_name TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            next_attempt_at REAL NOT NULL,
+            heartbeat_at REAL,
+            progress TEXT,
+            dedup_key TEXT,
+            attached INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_fila
+            ON jobs (status, priority DESC, created_at);
+    """
+
+    # Colunas adicionadas depois da criação da fila (bancos existentes)
+    MIGRATIONS = {
+        "progress": "ALTER TABLE jobs ADD COLUMN progress TEXT",
+        "dedup_key": "ALTER TABLE jobs ADD COLUMN dedup_key TEXT",
+        "attached": "ALTER TABLE jobs ADD COLUMN attached INTEGER NOT NULL DEFAULT 0",
+    }
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, ddl in self.MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(ddl)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key, status)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def dedup_key(params: QueryParams, table_name: str) -> str:
+        payload = json.dumps(
+            {"params": canonical_params(params), "table_name": table_name},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def submit(self, params: QueryParams, table_name: str, priority: int = 0,
+               max_attempts: int = 1) -> Tuple[str, bool]:
+        """
+        Enfileira o job ou anexa a submissão a um job equivalente ainda ativo.
+        Retorna (job_id, anexado). Ao anexar, o job herda a maior prioridade.
+        """
+        key = self.dedup_key(params, table_name)
+        now = time.time()
+        with self._connect() as conn:
+            # Serializa as submissões para que duas requisições iguais não criem dois jobs
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                UPDATE jobs
+                SET attached = attached + 1, priority = MAX(priority, ?)
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE dedup_key = ? AND status IN ('queued', 'running') AND NOT cancel_requested
+                    ORDER BY created_at
+                    LIMIT 1
+                )
+                RETURNING job_id
+                """,
+                (priority, key)
+            ).fetchone()
+            if row:
+                return row["job_id"], True
+            job_id = str(uuid4())
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, status, priority, params, table_name, max_attempts,
+                                  created_at, next_attempt_at, dedup_key)
+                VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, priority, params.model_dump_json(), table_name, max_attempts, now, now, key)
+            )
+        return job_id, False
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Reserva o próximo job pronto para execução (ou None se a fila estiver vazia)."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'running', worker = ?, attempts = attempts + 1,
+                    started_at = ?, heartbeat_at = ?, error = NULL
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE status = 'queued' AND next_attempt_at <= ?
+                    ORDER BY priority DESC, created_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (worker, now, now, now)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def heartbeat(self, job_id: str) -> bool:
+        """Atualiza o heartbeat do job; retorna True se o cancelamento foi solicitado."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? RETURNING cancel_requested",
+                (time.time(), job_id)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE job_id = ?",
+                (json.dumps(progress), time.time(), job_id)
+            )
+
+    def complete(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? WHERE job_id = ?",
+                (time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, backoff: float) -> str:
+        """Registra a falha; reenfileira com backoff exponencial se ainda houver tentativas."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN cancel_requested THEN 'cancelled'
+                                  WHEN attempts < max_attempts THEN 'queued'
+                                  ELSE 'error' END,
+                    error = ?,
+                    next_attempt_at = ? + ? * (1 << (attempts - 1)),
+                    finished_at = CASE WHEN attempts < max_attempts AND NOT cancel_requested
+                                       THEN NULL ELSE ? END
+                WHERE job_id = ?
+                RETURNING status
+                """,
+                (error, now, backoff, now, job_id)
+            ).fetchone()
+        return row["status"] if row else "error"
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancela um job na fila ou sinaliza o cancelamento de um job em execução."""
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                UPDATE jobs
+                SET cancel_requested = 1,
+                    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END
+                WHERE job_id = ?
+                RETURNING status
+                """,
+                (time.time(), job_id)
+            ).fetchone()
+        return row["status"] if row else None
+
+    def mark_cancelled(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ?",
+                (time.time(), job_id)
+            )
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """Devolve à fila os jobs em execução sem heartbeat há mais de stale_after segundos."""
+        with self._connect() as conn:
+            requeued = conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN cancel_requested THEN 'cancelled'
+                                  WHEN attempts < max_attempts THEN 'queued'
+                                  ELSE 'error' END,
+                    error = 'Worker interrompido durante a execução',
+                    next_attempt_at = ?,
+                    finished_at = CASE WHEN attempts < max_attempts AND NOT cancel_requested
+                                       THEN NULL ELSE ? END
+                WHERE status = 'running' AND heartbeat_at < ?
+                """,
+                (time.time(), time.time(), time.time() - stale_after)
+            ).rowcount
+        if requeued:
+            logging.warning(f"[jobs] {requeued} jobs sem heartbeat foram liberados")
+        return requeued
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def is_result_table(self, table_name: str) -> bool:
+        """Indica se a tabela é destino de algum job concluído (tabelas expostas em /results)."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE lower(table_name) = ? AND status = 'completed' LIMIT 1",
+                (table_name.lower(),)
+            ).fetchone()
+        return row is not None
+
+def job_status_response(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Formato público do status de um job."""
+    def iso(ts):
+        return datetime.fromtimestamp(ts).isoformat() if ts else None
+    status = {"running": "processing"}.get(row["status"], row["status"])
+    response = {
+        "job_id": row["job_id"],
+        "status": status,
+        "priority": row["priority"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "created_at": iso(row["created_at"]),
+        "start_time": iso(row["started_at"]),
+        "end_time": iso(row["finished_at"]),
+        "worker": row["worker"],
+        "table_name": row["table_name"],
+        "attached": row.get("attached") or 0,
+    }
+    if row["error"]:
+        response["error"] = row["error"]
+    response["progress"] = json.loads(row["progress"]) if row.get("progress") else None
+    return response
+
+def run_claimed_job(row: Dict[str, Any], worker: str) -> None:
+    """
+    Executa um job reservado. Uma thread de heartbeat mantém o job vivo e
+    verifica pedidos de cancelamento: a consulta DuckDB é interrompida, a carga
+    no PostgreSQL para no próximo chunk ou batch (e a tabela de carga é
+    descartada) e, se o job não parar em JOB_CANCEL_GRACE segundos, o processo
+    worker é encerrado (o supervisor inicia outro).
+    """
+    job_id = row["job_id"]
+    params = QueryParams.model_validate_json(row["params"])
+    progress = JobProgress(
+        publisher=lambda snapshot: job_store.update_progress(job_id, snapshot),
+        interval=settings.job_progress_interval
+    )
+    current: Dict[str, Any] = {}
+    done = threading.Event()
+    cancelled = threading.Event()
+
+    def heartbeat():
+        while not done.wait(settings.job_heartbeat_interval):
+            if job_store.heartbeat(job_id) and not cancelled.is_set():
+                logging.warning(f"[{worker}] Cancelamento solicitado para o job {job_id}")
+                cancelled.set()
+                if "job" in current:
+                    current["job"].cancel()
+                if not done.wait(settings.job_cancel_grace):
+                    job_store.mark_cancelled(job_id)
+                    logging.error(f"[{worker}] Job {job_id} não parou após o cancelamento; encerrando worker")
+                    os._exit(1)
+
+    threading.Thread(target=heartbeat, name=f"heartbeat-{job_id[:8]}", daemon=True).start()
+    logging.info(f"[{worker}] Executando job {job_id} (tentativa {row['attempts']}/{row['max_attempts']})")
+    try:
+        with progress.phase("descoberta"):
+            files = get_parquet_files(params.base, params.grupo, params.competencia_inicio, params.competencia_fim)
+        if not files:
+            raise ValueError("Nenhum arquivo encontrado")
+        with duckdb_pool.job(job_id, progress) as job:
+            current["job"] = job
+            # Mesmo caminho em chunks do /query: os contadores avançam a cada chunk
+            _adaptive_processing(files, params, job, row["table_name"])
+        progress.publish(force=True)
+        job_store.complete(job_id)
+        logging.info(f"[{worker}] Job {job_id} concluído")
+    except Exception as e:
+        if cancelled.is_set():
+            job_store.mark_cancelled(job_id)
+            logging.info(f"[{worker}] Job {job_id} cancelado")
+        else:
+            status = job_store.fail(job_id, str(e), settings.job_retry_backoff)
+            logging.error(f"[{worker}] Job {job_id} falhou ({status}): {str(e)}")
+    finally:
+        done.set()
+
+def job_worker_main(worker: str) -> None:
+    """Loop de um processo worker: reserva e executa jobs até ser encerrado."""
+    global duckdb_pool
+    # Um job por processo, com o mesmo orçamento de memória/threads de um job da API
+    duckdb_pool = DuckDBPool(
+        1, duckdb_pool.memory_per_job, settings.duckdb_temp_directory,
+        threads_per_job=duckdb_pool.threads_per_job
+    )
+    logging.info(f"[{worker}] Worker iniciado (pid {os.getpid()})")
+    last_sweep = 0.0
+    while True:
+        if time.time() - last_sweep > settings.job_heartbeat_interval:
+            job_store.requeue_stale(settings.job_stale_after)
+            last_sweep = time.time()
+        row = job_store.claim(worker)
+        if row is None:
+            time.sleep(settings.job_poll_interval)
+            continue
+        run_claimed_job(row, worker)
+
+class JobWorkerPool:
+    """Supervisiona os processos worker (spawn), reiniciando os que terminarem.
+
+    Cada worker uvicorn executa o evento de startup, mas só o que obtiver o lock
+    exclusivo em lock_path inicia o pool: a máquina tem no máximo `size` processos
+    worker, e a memória DuckDB dos jobs assíncronos fica limitada a
+    size * memory_per_job, independentemente do número de workers uvicorn.
+    """
+
+    def __init__(self, size: int, lock_path: str):
+        self.size = size
+        self.lock_path = lock_path
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._stop = threading.Event()
+        self._monitor = None
+        self._lock_fd: Optional[int] = None
+
+    def _acquire_lock(self) -> bool:
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _spawn(self, name: str) -> None:
+        process = self._ctx.Process(target=job_worker_main, args=(name,), name=name, daemon=True)
+        process.start()
+        self._processes[name] = process
+
+    def start(self) -> bool:
+        """Inicia os processos worker; retorna False se outro processo já detém o pool."""
+        if not self._acquire_lock():
+            logging.info(f"[jobs] Pool de workers já iniciado por outro processo ({self.lock_path})")
+            return False
+        prefix = f"worker-{os.getpid()}"
+        for i in range(self.size):
+            self._spawn(f"{prefix}-{i}")
+        self._monitor = threading.Thread(target=self._watch, name="job-worker-monitor", daemon=True)
+        self._monitor.start()
+        logging.info(f"[jobs] {self.size} processos worker iniciados")
+        return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(1.0):
+            for name, process in list(self._processes.items()):
+                if not process.is_alive():
+                    logging.warning(f"[jobs] {name} terminou (código {process.exitcode}); reiniciando")
+                    self._spawn(name)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=10)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
 
 # -----------------------------------------------------------------------------
 # Endpoints FastAPI
@@ -826,26 +2168,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+job_workers: Optional[JobWorkerPool] = None
+
 # -----------------------------------------------------------------------------
-# Variáveis globais para gerenciamento de tarefas
+# Executores do trabalho bloqueante (fora do event loop)
 # -----------------------------------------------------------------------------
-task_lock = threading.Lock()
-task_queue = PriorityQueue()
-async_jobs = {}
+# io_executor: descoberta de arquivos, catálogo e fila SQLite (operações curtas).
+# query_executor: DuckDB e carga no PostgreSQL (jobs de /query e abertura de
+#   /query/stream). Cada tarefa espera um slot do duckdb_pool, então
+#   QUERY_THREADS deve ser >= MAX_CONCURRENT_JOBS para todos os slots serem usados.
+# stream_executor: leitura dos batches (next()) de streams já abertos. Esses
+#   passos já têm o slot e nunca esperam outro; num executor separado, não ficam
+#   presos atrás de jobs que aguardam o slot que o próprio stream ocupa (deadlock).
+#   Tem MAX_CONCURRENT_JOBS threads, uma por stream aberto ao mesmo tempo.
+# admission_executor: espera na fila de admissão, limitada a ADMISSION_MAX_QUEUE.
+# Endpoints síncronos restantes usam o threadpool do anyio (API_THREAD_LIMIT).
+# Os executores são criados junto com as demais instâncias globais, após Settings.
+async def run_blocking(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs):
+    """Executa uma função bloqueante no executor indicado sem travar o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+async def iterate_in_executor(executor: ThreadPoolExecutor, iterator):
+    """
+    Consome um gerador síncrono no executor, um item por vez. Se o cliente
+    desconectar, o gerador é fechado no executor depois do next() em andamento.
+    """
+    done = object()
+    pending = None
+    try:
+        while True:
+            pending = executor.submit(next, iterator, done)
+            item = await asyncio.wrap_future(pending)
+            pending = None
+            if item is done:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.add_done_callback(lambda _: executor.submit(iterator.close))
+        else:
+            executor.submit(iterator.close)
+
+pg_pool: Optional[asyncpg.Pool] = None
+
+@app.on_event("startup")
+async def start_pg_pool():
+    """Pool asyncpg das leituras da API (tabelas de resultado e metadados)."""
+    global pg_pool
+    pg_pool = await asyncpg.create_pool(
+        user=settings.db_user,
+        password=settings.db_pass,
+        database=settings.db_name,
+        host=settings.db_host,
+        port=int(settings.db_port),
+        min_size=settings.pg_pool_min_size,
+        max_size=settings.pg_pool_max_size,
+        command_timeout=settings.pg_read_timeout,
+        timeout=10
+    )
+
+@app.on_event("shutdown")
+async def close_pg_pool():
+    if pg_pool is not None:
+        await pg_pool.close()
+
+@app.on_event("startup")
+def start_job_workers():
+    global job_workers
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.api_thread_limit
+    resource_monitor.start()
+    if settings.job_workers > 0:
+        job_workers = JobWorkerPool(settings.job_workers, settings.job_store_path + ".workers.lock")
+        if not job_workers.start():
+            job_workers = None
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    if job_workers is not None:
+        job_workers.stop()
+    for executor in (admission_executor, query_executor, stream_executor, io_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
 
 # -----------------------------------------------------------------------------
 # Endpoint principal para consulta
 # -----------------------------------------------------------------------------
 @app.post("/query", tags=["Main"])
-async def query_data(params: QueryParams, background_tasks: BackgroundTasks):
+async def query_data(params: QueryParams):
     logging.info(f"Nova requisição: {params.model_dump()}")
-    files = get_parquet_files(params.base, params.grupo, params.competencia_inicio, params.competencia_fim)
+    files = await run_blocking(
+        io_executor, get_parquet_files,
+        params.base, params.grupo, params.competencia_inicio, params.competencia_fim
+    )
     if not files:
         logging.error("Nenhum arquivo encontrado")
         raise HTTPException(status_code=404, detail="Nenhum arquivo encontrado")
+    release = await admit_query(files)
     start_time = datetime.now().isoformat()
     logging.info(f"Iniciando processamento de {len(files)} arquivos às {start_time}")
-    background_tasks.add_task(lambda: process_with_logging(files, params, start_time))
+    future = query_executor.submit(process_with_logging, files, params, start_time, release)
+    # Falhas já são registradas em process_with_logging; evita o aviso de exceção não lida
+    future.add_done_callback(lambda f: f.exception())
     return {
         "status": "processing",
         "start_time": start_time,
@@ -853,68 +2276,367 @@ async def query_data(params: QueryParams, background_tasks: BackgroundTasks):
         "message": "Processamento iniciado. Verifique os logs para detalhes."
     }
 
-def process_with_logging(files: List[str], params: QueryParams, start_time: str):
+def process_with_logging(files: List[str], params: QueryParams, start_time: str,
+                         release: Optional[Callable[[], None]] = None):
     try:
         adaptive_processing(files, params)
         logging.info("Processamento concluído com sucesso")
     except Exception as e:
         logging.critical(f"Erro catastrófico: {str(e)}\n{traceback.format_exc()}")
         raise
+    finally:
+        if release is not None:
+            release()
+
+def _admit(files: List[str]) -> Callable[[], None]:
+    cost = admission.estimate_cost(files, duckdb_pool.memory_per_job)
+    try:
+        return admission.acquire(cost)
+    except AdmissionRejected as e:
+        logging.warning(f"Consulta rejeitada pela admissão: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "high_load", "message": str(e), "metrics": resource_monitor.metrics()},
+            headers={"Retry-After": str(int(settings.admission_retry_after))}
+        )
+
+async def admit_query(files: List[str]) -> Callable[[], None]:
+    """Aguarda na fila de admissão sem bloquear o event loop."""
+    return await run_blocking(admission_executor, _admit, files)
 
 @app.post("/query/async", tags=["Async Operations"])
-async def async_query(params: QueryParams, background_tasks: BackgroundTasks) -> Dict[str, str]:
-    async with Semaphore(1):
-        job_id = str(uuid4())
-        async_jobs[job_id] = {
-            "status": "processing",
-            "start_time": datetime.now().isoformat(),
-            "progress": 0
-        }
-        def task_processor():
-            try:
-                files = get_parquet_files(params.base, params.grupo, params.competencia_inicio, params.competencia_fim)
-                temp_table = process_parquet_files(files, params)
-                table_name = params.table_name if params.table_name else GRUPOS_INFO[params.grupo]['tabela']
-                save_results(temp_table, table_name, params)
-                async_jobs[job_id].update({
-                    "status": "completed", 
-                    "end_time": datetime.now().isoformat(),
-                    "table_name": table_name
-                })
-            except Exception as e:
-                async_jobs[job_id].update({
-                    "status": "error",
-                    "error": str(e),
-                    "end_time": datetime.now().isoformat()
-                })
-        background_tasks.add_task(task_processor)
-        return {"job_id": job_id, "status_url": f"/query/jobs/{job_id}"}
+async def async_query(params: QueryParams, priority: int = Query(0, ge=-10, le=10)) -> Dict[str, Any]:
+    """
+    Enfileira a consulta no agendador persistente; maior prioridade executa antes.
+    Se um job com os mesmos parâmetros ainda está ativo, retorna o job_id dele.
+    """
+    table_name = params.table_name if params.table_name else GRUPOS_INFO[params.grupo]['tabela']
+    job_id, attached = await run_blocking(
+        io_executor, job_store.submit, params, table_name, priority, settings.job_max_attempts
+    )
+    if attached:
+        logging.info(f"Consulta anexada ao job ativo {job_id}: {params.model_dump()}")
+    else:
+        logging.info(f"Job {job_id} enfileirado (prioridade {priority}): {params.model_dump()}")
+    return {"job_id": job_id, "status_url": f"/query/jobs/{job_id}", "deduplicated": attached}
 
 @app.get("/query/jobs/{job_id}", tags=["Async Operations"])
 async def get_job_status(job_id: str):
-    if job_id not in async_jobs:
+    row = await run_blocking(io_executor, job_store.get, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    return job_status_response(row)
+
+@app.get("/query/jobs/{job_id}/events", tags=["Async Operations"])
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events com o status e o progresso do job, até a finalização."""
+    row = await run_blocking(io_executor, job_store.get, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+
+    async def events():
+        last = None
+        while not await request.is_disconnected():
+            row = await run_blocking(io_executor, job_store.get, job_id)
+            payload = json.dumps(job_status_response(row), ensure_ascii=False)
+            if payload != last:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last = payload
+            if row["status"] in ("completed", "error", "cancelled"):
+                yield f"event: end\ndata: {payload}\n\n"
+                return
+            await asyncio.sleep(settings.job_progress_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.post("/query/jobs/{job_id}/cancel", tags=["Async Operations"])
+async def cancel_job(job_id: str):
+    status = await run_blocking(io_executor, job_store.cancel, job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
-    return async_jobs[job_id]
+    if status in ("completed", "error"):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} já finalizado ({status})")
+    return job_status_response(await run_blocking(io_executor, job_store.get, job_id))
+
+# -----------------------------------------------------------------------------
+# Leitura das tabelas de resultado (asyncpg)
+# -----------------------------------------------------------------------------
+async def _check_result_table(table_name: str) -> None:
+    """
+    Só tabelas destino de jobs concluídos são expostas; as demais tabelas do
+    schema (load_ledger, tabelas de origem etc.) respondem 404.
+    """
+    if not IDENTIFICADOR_RE.match(table_name):
+        raise HTTPException(status_code=400, detail="Nome de tabela inválido")
+    if not await run_blocking(io_executor, job_store.is_result_table, table_name):
+        raise HTTPException(status_code=404, detail=f"Tabela {table_name} não encontrada")
+
+async def _result_table_columns(conn: asyncpg.Connection, table_name: str) -> List[asyncpg.Record]:
+    columns = await conn.fetch(
+        """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1
+        ORDER BY ordinal_position
+        """,
+        table_name.lower()
+    )
+    if not columns:
+        raise HTTPException(status_code=404, detail=f"Tabela {table_name} não encontrada")
+    return columns
+
+@app.get("/results/{table_name}/metadata", tags=["Results"])
+async def result_metadata(table_name: str):
+    """Colunas, linhas estimadas (pg_class) e tamanho de uma tabela de resultado."""
+    await _check_result_table(table_name)
+    async with pg_pool.acquire() as conn:
+        columns = await _result_table_columns(conn, table_name)
+        stats = await conn.fetchrow(
+            """
+            SELECT c.reltuples::BIGINT AS linhas_estimadas,
+                   pg_total_relation_size(c.oid) AS tamanho_bytes
+            FROM pg_class c
+            WHERE c.oid = to_regclass($1)
+            """,
+            table_name.lower()
+        )
+    return {
+        "table_name": table_name.lower(),
+        "colunas": [{"nome": c["column_name"], "tipo": c["data_type"]} for c in columns],
+        "linhas_estimadas": max(stats["linhas_estimadas"], 0) if stats else None,
+        "tamanho_bytes": stats["tamanho_bytes"] if stats else None,
+    }
+
+@app.get("/results/{table_name}", tags=["Results"])
+async def read_results(
+    table_name: str,
+    limit: Optional[int] = Query(None, ge=1),
+    prefetch: int = Query(5_000, ge=100, le=100_000)
+):
+    """
+    Transmite uma tabela de resultado em NDJSON a partir de um cursor do
+    servidor (protocolo binário do asyncpg); a memória fica limitada ao prefetch.
+    """
+    await _check_result_table(table_name)
+    async with pg_pool.acquire() as conn:
+        columns = await _result_table_columns(conn, table_name)
+    select = ", ".join(f'"{c["column_name"]}"' for c in columns)
+    query = f'SELECT {select} FROM "{table_name.lower()}"' + (f" LIMIT {limit}" if limit else "")
+
+    async def rows():
+        # A conexão do cursor só é reservada quando o corpo começa a ser enviado
+        async with pg_pool.acquire() as conn, conn.transaction(readonly=True):
+            buffer = []
+            async for record in conn.cursor(query, prefetch=prefetch):
+                buffer.append(json.dumps(dict(record), default=str, ensure_ascii=False) + "\n")
+                if len(buffer) >= prefetch:
+                    yield "".join(buffer).encode("utf-8")
+                    buffer.clear()
+            if buffer:
+                yield "".join(buffer).encode("utf-8")
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@app.get("/health", tags=["Main"])
+async def health():
+    """Carga do servidor (última amostra) e estado da fila de admissão."""
+    return {"status": "ok", "metrics": resource_monitor.metrics(), "admission": admission.status()}
+
+@app.post("/catalog/refresh", tags=["Catalog"])
+async def refresh_catalog(base: str, grupo: str, force: bool = False):
+    """Força a atualização incremental (ou completa, com force=true) do catálogo de um grupo."""
+    stats = await run_blocking(io_executor, catalog.refresh, base.upper(), grupo.upper(), force=force)
+    return {"base": base.upper(), "grupo": grupo.upper(), **stats}
+
+# -----------------------------------------------------------------------------
+# Streaming de resultados direto do DuckDB (sem passar pelo PostgreSQL)
+# -----------------------------------------------------------------------------
+STREAM_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+}
+
+class _ChunkSink:
+    """Destino de escrita que acumula bytes até serem drenados pelo gerador."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def iter_file(handle: BinaryIO, chunk_size: int = 1024 * 1024):
+    """Lê um arquivo já aberto em blocos, fechando-o ao final ou na desconexão do cliente."""
+    try:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        handle.close()
+
+def iter_record_batches(
+    reader: pa.RecordBatchReader,
+    formato: str,
+    stack: ExitStack,
+    cache_key: Optional[str] = None
+):
+    """
+    Serializa os record batches do DuckDB no formato pedido, um batch por vez.
+    A memória fica limitada ao tamanho do batch; a conexão do job é liberada
+    (stack.close) ao final ou quando o cliente desconecta. Com cache_key, os
+    batches também são gravados no cache de resultados, que só é efetivado se
+    o streaming chegar ao fim.
+    """
+    sink = _ChunkSink()
+    writer = None
+    cache_writer = cache_tmp = None
+    try:
+        if cache_key:
+            cache_writer, cache_tmp = result_cache.open_writer(cache_key, reader.schema)
+        if formato == "arrow":
+            writer = pa.ipc.new_stream(sink, reader.schema)
+        elif formato == "parquet":
+            writer = pq.ParquetWriter(sink, reader.schema, compression="zstd")
+        for batch in reader:
+            if cache_writer is not None:
+                cache_writer.write_table(pa.Table.from_batches([batch]))
+            if formato == "ndjson":
+                yield "".join(
+                    json.dumps(row, default=str, ensure_ascii=False) + "\n" for row in batch.to_pylist()
+                ).encode("utf-8")
+                continue
+            if formato == "arrow":
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))
+            yield sink.drain()
+        if writer is not None:
+            writer.close()
+            writer = None
+            yield sink.drain()
+        if cache_writer is not None:
+            cache_writer.close()
+            cache_writer = None
+            result_cache.commit(cache_tmp, cache_key)
+            cache_tmp = None
+    finally:
+        if writer is not None:
+            writer.close()
+        if cache_writer is not None:
+            cache_writer.close()
+        if cache_tmp is not None:
+            result_cache.discard(cache_tmp)
+        stack.close()
+
+def _open_stream_reader(files: List[str], params: QueryParams, batch_size: int,
+                       release: Callable[[], None]) -> Tuple[ExitStack, str, pa.RecordBatchReader]:
+    """Reserva uma conexão do pool e inicia a consulta; a pilha libera conexão e admissão."""
+    stack = ExitStack()
+    stack.callback(release)
+    job = stack.enter_context(duckdb_pool.job())
+    try:
+        query = build_result_query(job.con, files, params)
+        reader = job.con.execute(query).fetch_record_batch(batch_size)
+    except Exception as e:
+        stack.close()
+        logging.error(f"[{job.job_id}] Falha ao iniciar streaming: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return stack, job.job_id, reader
+
+@app.post("/query/stream", tags=["Main"])
+async def stream_query(
+    params: QueryParams,
+    formato: str = Query("arrow", pattern="^(arrow|parquet|ndjson)$"),
+    batch_size: int = Query(100_000, ge=1_000, le=1_000_000)
+):
+    """
+    Executa a consulta e transmite o resultado em Arrow IPC, Parquet ou NDJSON
+    diretamente de um record batch reader do DuckDB.
+    """
+    logging.info(f"Nova requisição de streaming ({formato}): {params.model_dump()}")
+    files = await run_blocking(
+        io_executor, get_parquet_files,
+        params.base, params.grupo, params.competencia_inicio, params.competencia_fim
+    )
+    if not files:
+        raise HTTPException(status_code=404, detail="Nenhum arquivo encontrado")
+
+    extensao = "arrows" if formato == "arrow" else formato
+    headers = {"Content-Disposition": f'attachment; filename="{params.base}_{params.grupo}.{extensao}"'}
+
+    cache_key = None
+    if result_cache.enabled:
+        entries = await run_blocking(io_executor, catalog.describe, files)
+        cache_key = result_cache.key(params, entries, variant="stream")
+        cached = await run_blocking(io_executor, result_cache.get, cache_key)
+        if cached:
+            logging.info(f"Streaming servido do cache ({cache_key[:12]})")
+            headers["X-Cache"] = "HIT"
+            if formato == "parquet":
+                return StreamingResponse(
+                    iterate_in_executor(stream_executor, iter_file(cached)),
+                    media_type=STREAM_MEDIA_TYPES[formato],
+                    headers=headers
+                )
+            stack = ExitStack()
+            stack.callback(cached.close)
+            parquet_file = pq.ParquetFile(cached)
+            reader = pa.RecordBatchReader.from_batches(
+                parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=batch_size)
+            )
+            return StreamingResponse(
+                iterate_in_executor(stream_executor, iter_record_batches(reader, formato, stack)),
+                media_type=STREAM_MEDIA_TYPES[formato],
+                headers=headers
+            )
+        headers["X-Cache"] = "MISS"
+
+    release = await admit_query(files)
+    try:
+        stack, job_id, reader = await run_blocking(
+            query_executor, _open_stream_reader, files, params, batch_size, release
+        )
+    except BaseException:
+        release()
+        raise
+
+    headers["X-Job-Id"] = job_id
+    return StreamingResponse(
+        iterate_in_executor(stream_executor, iter_record_batches(reader, formato, stack, cache_key)),
+        media_type=STREAM_MEDIA_TYPES[formato],
+        headers=headers
+    )
 
 # -----------------------------------------------------------------------------
 # Middleware de Monitoramento de Performance
 # -----------------------------------------------------------------------------
 @app.middleware("http")
 async def resource_guard(request: Request, call_next):
-    mem = psutil.virtual_memory()
-    cpu = psutil.cpu_percent()
-    if mem.percent > 75 or cpu > 85:
-        return JSONResponse(
-            status_code=503,
-            content={
-                "error": "high_load",
-                "message": "Servidor sob alta carga",
-                "metrics": {
-                    "memory_used": f"{mem.used/1024**3:.1f}GB",
-                    "cpu_usage": f"{cpu}%"
-                }
-            }
-        )
+    # A carga é controlada pela fila de admissão das consultas pesadas
+    # (AdmissionController); status, health e demais endpoints leves passam direto.
     try:
         response = await call_next(request)
         return response
@@ -936,62 +2658,89 @@ def verify_db_connection():
         logging.error(f"Erro na conexão com o PostgreSQL: {str(e)}")
         raise
 
-# -----------------------------------------------------------------------------
-# Execução local com Uvicorn
-# -----------------------------------------------------------------------------
-if __name__ == "__main__":
-    import uvicorn
-    try:
-        settings = Settings()
-        print("Configurações carregadas com sucesso!")
-        print(settings.model_dump())
-    except ValidationError as e:
-        print("Erro nas configurações:")
-        print(e.json(indent=2))
-        exit(1)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
 # -----------------------------------------------------------------------------
 # Funções auxiliares de tarefas e processamento adaptativo (ATUALIZADA)
 # -----------------------------------------------------------------------------
 def adaptive_processing(files: List[str], params: QueryParams) -> None:
-    chunk_size = 50  # Tamanho inicial do chunk
+    with duckdb_pool.job() as job:
+        _adaptive_processing(files, params, job)
+
+def plan_chunks(files: List[str], max_bytes: int) -> List[List[str]]:
+    """
+    Agrupa os arquivos em chunks cujo tamanho descomprimido (footer Parquet,
+    via catálogo) não passa de max_bytes. Um arquivo maior que o limite forma
+    um chunk sozinho; o DuckDB faz spill em disco nesse caso.
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_bytes = 0
+    for entry in catalog.describe(files):
+        file_bytes = entry.get("uncompressed_bytes") or entry["size_bytes"]
+        if current and current_bytes + file_bytes > max_bytes:
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(entry["path"])
+        current_bytes += file_bytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _adaptive_processing(files: List[str], params: QueryParams, job: JobContext,
+                         table_name: Optional[str] = None) -> None:
+    """
+    Processa os arquivos em chunks limitados pelo tamanho descomprimido
+    (CHUNK_MAX_BYTES; padrão: o memory_limit do job).
+
+    Cada chunk é anexado à tabela de carga do StagedLoad, com a transferência do
+    chunk anterior em paralelo ao processamento do próximo; a tabela destino só
+    é substituída ao final, numa única transação. No modo de agregação todos os
+    arquivos são processados de uma vez, já que grupos não podem ser divididos
+    entre chunks; o memory_limit do job faz o DuckDB usar spill em disco.
+
+    Os contadores de progresso do job (arquivos, bytes e linhas) são publicados
+    ao fim de cada chunk. table_name é a tabela destino (padrão: params.table_name
+    ou a tabela do grupo).
+    """
     total_files = len(files)
+    job.progress.add("files_total", total_files)
+    max_bytes = settings.chunk_max_bytes or duckdb_pool.memory_per_job
+    chunks = [files] if params.medidas else plan_chunks(files, max_bytes)
     processed = 0
-    logging.info(f"Iniciando processamento adaptativo de {total_files} arquivos")
-    
-    for i in range(0, total_files, chunk_size):
-        chunk = files[i:i+chunk_size]
-        logging.info(f"Processando chunk {i//chunk_size + 1} com {len(chunk)} arquivos")
-        
-        try:
-            # Processar e salvar
-            temp_table = process_data(chunk, params)
-            table_name = params.table_name if params.table_name else GRUPOS_INFO[params.grupo]['tabela']
-            save_results(temp_table, table_name, params)
-            processed += len(chunk)
-            
-            # Calcula e loga o progresso
-            progress = (processed / total_files) * 100
-            logging.info(f"Progresso: {processed}/{total_files} arquivos ({progress:.1f}%) - Memória: {psutil.virtual_memory().percent}%")
-            
-            # Ajuste dinâmico do tamanho do chunk baseado no uso de memória
-            mem = psutil.virtual_memory()
-            if mem.percent > 70:
-                chunk_size = max(10, chunk_size // 2)
-                logging.warning(f"Reduzindo chunk size para {chunk_size} (Memória: {mem.percent}%)")
-            elif mem.percent < 30:
-                chunk_size = min(100, chunk_size * 2)
-                logging.info(f"Aumentando chunk size para {chunk_size} (Memória: {mem.percent}%)")
-                
-        except Exception as e:
-            logging.error(f"Erro no chunk {i//chunk_size + 1}: {str(e)}")
-            raise
+    table_name = table_name or params.table_name or GRUPOS_INFO[params.grupo]['tabela']
+    logging.info(
+        f"[{job.job_id}] Iniciando processamento de {total_files} arquivos "
+        f"em {len(chunks)} chunks (limite de {max_bytes / 1024**2:.1f}MB descomprimidos por chunk)"
+    )
+
+    load = StagedLoad(table_name, params, job)
+    try:
+        for chunk_num, chunk in enumerate(chunks, start=1):
+            logging.info(f"Processando chunk {chunk_num}/{len(chunks)} com {len(chunk)} arquivos")
+            try:
+                # Processar e anexar à tabela de carga
+                temp_table = process_data(chunk, params, is_chunk=True, job=job)
+                chunk_table = job.table(f"chunk_{chunk_num}")
+                job.con.execute(f"ALTER TABLE {temp_table} RENAME TO {chunk_table}")
+                load.append(chunk_table, drop_source=True)
+                processed += len(chunk)
+
+                # Calcula e loga o progresso
+                progress = (processed / total_files) * 100
+                logging.info(f"Progresso: {processed}/{total_files} arquivos ({progress:.1f}%) - Memória: {psutil.virtual_memory().percent}%")
+
+            except Exception as e:
+                logging.error(f"Erro no chunk {chunk_num}: {str(e)}")
+                raise
+
+        load.finish()
+    except Exception:
+        load.abort()
+        raise
 
 # -----------------------------------------------------------------------------
 # Função para construção de query com tratamento de erros (ATUALIZADA)
 # -----------------------------------------------------------------------------
-def build_conversion_query(grupo: str, columns: list) -> str:
+def build_conversion_query(grupo: str, columns: list, with_errors: bool = True) -> str:
     """Constrói query de conversão usando tipos do GRUPOS_INFO"""
     if grupo not in GRUPOS_INFO:
         raise ValueError(f"Grupo {grupo} não encontrado no GRUPOS_INFO")
@@ -1016,7 +2765,7 @@ def build_conversion_query(grupo: str, columns: list) -> str:
         error_condition = " OR ".join(error_conditions) if error_conditions else "FALSE"
         error_expr = f"CASE WHEN {col} IS NOT NULL AND ({error_condition}) THEN 'ERRO_TIPO' ELSE NULL END AS new_{col}_error"
         
-        selects.append(f"{conversion_expr}, {error_expr}")
+        selects.append(f"{conversion_expr}, {error_expr}" if with_errors else conversion_expr)
         logging.info(f"Conversão aplicada: {col} -> {dtype}")
 
     return ", ".join(selects)
@@ -1028,10 +2777,171 @@ def get_cnes_column(grupo: str) -> str:
         raise ValueError(f"Grupo {grupo} não possui mapeamento de CNES")
     return CAMPOS_CNES[grupo]
 
+def build_query_plan(params: QueryParams) -> Tuple[List[str], str]:
+    """Retorna as colunas projetadas e a cláusula WHERE do filtro de CNES."""
+    cnes_col = get_cnes_column(params.grupo)
+    campos = params.campos_agrupamento.copy()
+
+    if cnes_col not in campos and not params.medidas:
+        campos.append(cnes_col)
+        logging.info(f"Adicionada coluna CNES: {cnes_col}")
+
+    where_clause = ""
+    if params.cnes_list != ["*"]:
+        cnes_list = ", ".join([f"'{c}'" for c in params.cnes_list])
+        where_clause = f"WHERE {cnes_col} IN ({cnes_list})"
+        logging.info(f"Filtro CNES aplicado: {len(params.cnes_list)} valores")
+    return campos, where_clause
+
+def build_fused_query(con: duckdb.DuckDBPyConnection, files: List[str], params: QueryParams,
+                      campos: List[str], where_clause: str, with_errors: bool = True) -> str:
+    """
+    Compila filtro CNES, TRIM, TRY_CAST e marcação de erros em um único SELECT.
+
+    O DESCRIBE usa apenas os metadados dos arquivos; a leitura efetiva dos dados
+    acontece uma única vez, quando o SELECT retornado é executado.
+    """
+    source_columns = con.execute(
+        f"DESCRIBE SELECT {', '.join(campos)} FROM read_parquet({files})"
+    ).fetchall()
+    clean_operations = [
+        f"TRIM({col[0]}) AS {col[0]}" if 'VARCHAR' in col[1] else col[0]
+        for col in source_columns
+    ]
+    conversion_query = build_conversion_query(params.grupo, campos, with_errors)
+    return f"""
+        SELECT {conversion_query}
+        FROM (
+            SELECT {', '.join(clean_operations)}
+            FROM read_parquet({files})
+            {where_clause}
+        )
+    """
+
+def process_data_fused(job: "JobContext", files: List[str], params: QueryParams,
+                       campos: List[str], where_clause: str, is_chunk: bool = False) -> str:
+    """
+    Modo fundido do process_data: filtro, limpeza e conversão num único SELECT,
+    com uma leitura dos arquivos Parquet; as contagens de erro saem de um
+    agregado (COUNT(*) FILTER) sobre a tabela temporária já materializada.
+    Em chunks (is_chunk) as colunas de erro são mantidas para que todos os chunks
+    tenham o mesmo schema.
+    """
+    con = job.con
+    converted_table = job.table("temp_converted")
+    fused_query = build_fused_query(con, files, params, campos, where_clause)
+    logging.info(f"[{job.job_id}] Executando pipeline fundido (filtro + limpeza + conversão)")
+    con.execute(f"CREATE OR REPLACE TABLE {converted_table} AS {fused_query}")
+
+    error_cols = [
+        col[0] for col in con.execute(f"DESCRIBE {converted_table}").fetchall()
+        if col[0].startswith('new_')
+    ]
+    filters = "".join(f", COUNT(*) FILTER (WHERE {col} IS NOT NULL)" for col in error_cols)
+    row = con.execute(f"SELECT COUNT(*){filters} FROM {converted_table}").fetchone()
+    logging.info(f"Registros convertidos: {row[0]}")
+    counts = dict(zip(error_cols, row[1:]))
+    # Filtro e conversão acontecem no mesmo SELECT
+    job.progress.add("rows_filtered", row[0])
+    job.progress.add("rows_converted", row[0])
+
+    for col, error_count in counts.items():
+        if error_count > 0:
+            logging.warning(f"Erros detectados em {col}: {error_count} registros")
+        elif not is_chunk:
+            con.execute(f"ALTER TABLE {converted_table} DROP COLUMN {col}")
+    if not is_chunk:
+        logging.info(f"Colunas de erro removidas (sem erros): {sum(1 for c in counts.values() if c == 0)}")
+    return converted_table
+
+def build_aggregated_query(con: duckdb.DuckDBPyConnection, files: List[str], params: QueryParams,
+                           where_clause: str) -> str:
+    """GROUP BY campos_agrupamento com as medidas de params.medidas sobre o SELECT fundido."""
+    grupos = params.campos_agrupamento
+    campos = list(dict.fromkeys(grupos + [m.coluna for m in params.medidas if m.coluna]))
+    fused_query = build_fused_query(con, files, params, campos, where_clause, with_errors=False)
+    medidas_sql = ", ".join(m.to_sql() for m in params.medidas)
+    logging.info(f"Agregando por {grupos}: {medidas_sql}")
+    return f"""
+        SELECT {', '.join(grupos)}, {medidas_sql}
+        FROM ({fused_query})
+        GROUP BY {', '.join(grupos)}
+    """
+
+def build_result_query(con: duckdb.DuckDBPyConnection, files: List[str], params: QueryParams) -> str:
+    """SELECT final da consulta (agregado ou convertido, sem colunas de erro), sem materialização."""
+    campos, where_clause = build_query_plan(params)
+    if params.medidas:
+        return build_aggregated_query(con, files, params, where_clause)
+    return build_fused_query(con, files, params, campos, where_clause, with_errors=False)
+
+def process_data_aggregated(job: JobContext, files: List[str], params: QueryParams, where_clause: str) -> str:
+    """
+    Modo de agregação: GROUP BY campos_agrupamento com as medidas de params.medidas,
+    calculado pelo DuckDB sobre o SELECT fundido. Só o resultado agregado é
+    materializado.
+    """
+    con = job.con
+    aggregated_table = job.table("temp_aggregated")
+    aggregated_query = build_aggregated_query(con, files, params, where_clause)
+    con.execute(f"CREATE OR REPLACE TABLE {aggregated_table} AS {aggregated_query}")
+    total = con.execute(f"SELECT COUNT(*) FROM {aggregated_table}").fetchone()[0]
+    logging.info(f"[{job.job_id}] Resultado agregado: {total} grupos")
+    job.progress.add("rows_converted", total)
+    return aggregated_table
+
 def process_data(
+    files: List[str],
+    params: QueryParams,
+    is_chunk: bool = False,
+    fused: Optional[bool] = None,
+    job: Optional["JobContext"] = None
+) -> str:
+    """
+    Ponto de entrada do processamento: serve o resultado do cache de resultados
+    quando disponível; caso contrário processa os arquivos e grava o resultado.
+    """
+    if job is None:
+        job = JobContext(duckdb.default_connection)
+    progress = job.progress
+    entries = catalog.describe(files)
+    with progress.phase("processamento"):
+        cache_key = None
+        if result_cache.enabled:
+            variant = "chunk" if is_chunk else "table"
+            cache_key = result_cache.key(params, entries, variant=variant)
+            cached = result_cache.get(cache_key)
+            if cached:
+                result_table = job.table("temp_converted")
+                # Lê do arquivo já aberto, imune à evicção concorrente da entrada
+                reader_name = f"cache_reader_{job.tag}"
+                with cached, pq.ParquetFile(cached) as parquet_file:
+                    job.con.register(reader_name, pa.RecordBatchReader.from_batches(
+                        parquet_file.schema_arrow, parquet_file.iter_batches()
+                    ))
+                    try:
+                        job.con.execute(f"CREATE OR REPLACE TABLE {result_table} AS SELECT * FROM {reader_name}")
+                    finally:
+                        job.con.unregister(reader_name)
+                logging.info(f"[{job.job_id}] Resultado servido do cache ({cache_key[:12]})")
+                progress.add("files_scanned", len(files))
+                progress.add("rows_converted", job.con.execute(f"SELECT COUNT(*) FROM {result_table}").fetchone()[0])
+                return result_table
+
+        result_table = _process_data(files, params, is_chunk, fused, job)
+        progress.add("files_scanned", len(files))
+        progress.add("bytes_read", sum(entry["size_bytes"] for entry in entries))
+        progress.add("rows_scanned", sum(entry.get("num_rows") or 0 for entry in entries))
+        if cache_key:
+            result_cache.put_table(job.con, result_table, cache_key)
+        return result_table
+
+def _process_data(
     files: List[str], 
     params: QueryParams,
-    is_chunk: bool = False
+    is_chunk: bool = False,
+    fused: Optional[bool] = None,
+    job: Optional["JobContext"] = None
 ) -> str:
     """
     Processa arquivos Parquet com as seguintes etapas:
@@ -1039,43 +2949,53 @@ def process_data(
     2. Limpeza básica dos dados
     3. Conversão de tipos com registro de erros
     4. Validação e ajustes finais
+
+    Com fused=True (padrão definido em FUSED_PIPELINE) as etapas 1 a 3 são
+    executadas em um único SELECT, sem tabelas intermediárias. Se params.medidas
+    estiver preenchido, o resultado é agregado por campos_agrupamento.
+
+    As tabelas temporárias recebem o sufixo do job (job.table) e são criadas na
+    conexão DuckDB exclusiva do job, permitindo jobs concorrentes. Com is_chunk
+    as colunas de erro são mantidas mesmo sem ocorrências (schema fixo entre chunks).
     """
+    if fused is None:
+        fused = settings.fused_pipeline
+    if job is None:
+        job = JobContext(duckdb.default_connection)
+    con = job.con
+    filtered_table = job.table("temp_filtered")
+    cleaned_table = job.table("temp_cleaned")
+    converted_table = job.table("temp_converted")
     try:
         # =====================================================================
         # Passo 1: Filtragem inicial
         # =====================================================================
-        cnes_col = get_cnes_column(params.grupo)
-        campos = params.campos_agrupamento.copy()
-        
-        if cnes_col not in campos:
-            campos.append(cnes_col)
-            logging.info(f"Adicionada coluna CNES: {cnes_col}")
+        campos, where_clause = build_query_plan(params)
 
-        # Construir cláusula WHERE
-        where_clause = ""
-        if params.cnes_list != ["*"]:
-            cnes_list = ", ".join([f"'{c}'" for c in params.cnes_list])
-            where_clause = f"WHERE {cnes_col} IN ({cnes_list})"
-            logging.info(f"Filtro CNES aplicado: {len(params.cnes_list)} valores")
+        if params.medidas:
+            return process_data_aggregated(job, files, params, where_clause)
+        if fused:
+            return process_data_fused(job, files, params, campos, where_clause, is_chunk)
 
         # Criar tabela filtrada
-        duckdb.execute(f"""
-            CREATE OR REPLACE TABLE temp_filtered AS
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {filtered_table} AS
             SELECT {', '.join(campos)}
             FROM read_parquet({files})
             {where_clause}
         """)
         
         # Log de amostra após filtragem
-        sample = duckdb.execute("SELECT * FROM temp_filtered LIMIT 5").fetchdf()
-        logging.info("Amostra pós-filtro (temp_filtered):\n%s", sample)
+        job.progress.add("rows_filtered", con.execute(f"SELECT COUNT(*) FROM {filtered_table}").fetchone()[0])
+        sample = con.execute(f"SELECT * FROM {filtered_table} LIMIT 5").fetchdf()
+        logging.info("Amostra pós-filtro (%s):\n%s", filtered_table, sample)
         logging.info("Tipos originais:\n%s", sample.dtypes)
 
         # =====================================================================
         # Passo 2: Limpeza dos dados
         # =====================================================================
         clean_operations = []
-        columns = duckdb.execute("DESCRIBE temp_filtered").fetchall()
+        columns = con.execute(f"DESCRIBE {filtered_table}").fetchall()
         
         for col in columns:
             col_name, col_type = col[0], col[1]
@@ -1085,15 +3005,15 @@ def process_data(
             else:
                 clean_operations.append(col_name)
 
-        duckdb.execute(f"""
-            CREATE OR REPLACE TABLE temp_cleaned AS
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {cleaned_table} AS
             SELECT {', '.join(clean_operations)}
-            FROM temp_filtered
+            FROM {filtered_table}
         """)
         
         # Identificar colunas textuais para validação
         text_columns = [
-            col[0] for col in duckdb.execute("DESCRIBE temp_cleaned").fetchall()
+            col[0] for col in con.execute(f"DESCRIBE {cleaned_table}").fetchall()
             if 'VARCHAR' in col[1]
         ]
 
@@ -1109,10 +3029,10 @@ def process_data(
             SELECT 
                 COUNT(*) AS total_linhas,
                 SUM(CASE WHEN ({condition}) THEN 1 ELSE 0 END) AS textos_validos
-            FROM temp_cleaned
+            FROM {cleaned_table}
         """
 
-        sample_clean = duckdb.execute(validation_query).fetchdf()
+        sample_clean = con.execute(validation_query).fetchdf()
         logging.info("Estatísticas de limpeza:\n%s", sample_clean)
 
         # =====================================================================
@@ -1123,57 +3043,58 @@ def process_data(
         logging.info("Iniciando conversão de tipos com query:")
         logging.info(conversion_query[:500] + "...")  # Log parcial da query
 
-        duckdb.execute(f"""
-            CREATE OR REPLACE TABLE temp_converted AS
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {converted_table} AS
             SELECT {conversion_query}
-            FROM temp_cleaned
+            FROM {cleaned_table}
         """)
+        job.progress.add("rows_converted", con.execute(f"SELECT COUNT(*) FROM {converted_table}").fetchone()[0])
 
         # =====================================================================
         # Passo 4: Validação e ajustes
         # =====================================================================
         # Verificar colunas de erro
-        describe_df = duckdb.execute("DESCRIBE temp_converted").fetchdf()
+        describe_df = con.execute(f"DESCRIBE {converted_table}").fetchdf()
         logging.info(f"Colunas disponíveis no DESCRIBE: {describe_df.columns.tolist()}")
 
         error_cols = [col for col in describe_df['column_name'] 
                       if col.startswith('new_')]
         
         for col in error_cols:
-            error_count = duckdb.execute(f"""
+            error_count = con.execute(f"""
                 SELECT COUNT(*) 
-                FROM temp_converted 
+                FROM {converted_table} 
                 WHERE {col} IS NOT NULL
             """).fetchone()[0]
             
             if error_count > 0:
                 logging.warning(f"Erros detectados em {col}: {error_count} registros")
-            else:
+            elif not is_chunk:
                 logging.info(f"Coluna {col} sem erros - será removida")
-                duckdb.execute(f"""
-                    ALTER TABLE temp_converted DROP COLUMN {col};
+                con.execute(f"""
+                    ALTER TABLE {converted_table} DROP COLUMN {col};
                 """)
 
         # Log final
-        final_sample = duckdb.execute("""
+        final_sample = con.execute(f"""
             SELECT 
                 column_name AS coluna,
                 data_type AS tipo
             FROM information_schema.columns 
-            WHERE table_name = 'temp_converted'
+            WHERE table_name = '{converted_table}'
         """).fetchdf()
         
         logging.info("Estrutura final da tabela convertida:\n%s", final_sample)
 
-        return "temp_converted"
+        return converted_table
 
     except Exception as e:
         logging.error("Falha no processamento de dados", exc_info=True)
         raise
 
-def process_parquet_files(files: List[str], params: QueryParams) -> pd.DataFrame:
+def process_parquet_files(files: List[str], params: QueryParams, job: Optional[JobContext] = None) -> str:
     """Wrapper para processamento completo"""
-    return process_data(files, params, is_chunk=False)
+    return process_data(files, params, is_chunk=False, job=job)
 
 def export_schema(df: pd.DataFrame, table_name: str) -> str:
     """Exporta o schema do DataFrame para SQL PostgreSQL"""
@@ -1237,6 +3158,41 @@ class Settings(BaseSettings):
     db_pass: str = Field(..., env="DB_PASS")
     db_host: str = Field(..., env="DB_HOST")
     db_port: int = Field(..., env="DB_PORT")
+    parquet_root: str = Field("parquet_files", env="PARQUET_ROOT")
+    catalog_path: str = Field("parquet_files/catalogo.sqlite", env="CATALOG_PATH")
+    catalog_refresh_interval: int = Field(300, env="CATALOG_REFRESH_INTERVAL")
+    fused_pipeline: bool = Field(True, env="FUSED_PIPELINE")
+    max_concurrent_jobs: int = Field(4, env="MAX_CONCURRENT_JOBS")
+    duckdb_memory_budget_mb: int = Field(0, env="DUCKDB_MEMORY_BUDGET_MB")
+    duckdb_temp_directory: str = Field("cache/duckdb_tmp", env="DUCKDB_TEMP_DIRECTORY")
+    chunk_max_bytes: int = Field(0, env="CHUNK_MAX_BYTES")
+    pg_copy_mode: str = Field("binary", env="PG_COPY_MODE")
+    pg_copy_parallelism: int = Field(4, env="PG_COPY_PARALLELISM")
+    pg_copy_unlogged: bool = Field(True, env="PG_COPY_UNLOGGED")
+    pg_copy_batch_size: int = Field(50_000, env="PG_COPY_BATCH_SIZE")
+    job_store_path: str = Field("cache/jobs.sqlite", env="JOB_STORE_PATH")
+    job_workers: int = Field(2, env="JOB_WORKERS")
+    job_max_attempts: int = Field(3, env="JOB_MAX_ATTEMPTS")
+    job_retry_backoff: float = Field(30.0, env="JOB_RETRY_BACKOFF")
+    job_heartbeat_interval: float = Field(5.0, env="JOB_HEARTBEAT_INTERVAL")
+    job_stale_after: float = Field(120.0, env="JOB_STALE_AFTER")
+    job_cancel_grace: float = Field(30.0, env="JOB_CANCEL_GRACE")
+    job_poll_interval: float = Field(1.0, env="JOB_POLL_INTERVAL")
+    job_progress_interval: float = Field(1.0, env="JOB_PROGRESS_INTERVAL")
+    admission_max_queue: int = Field(32, env="ADMISSION_MAX_QUEUE")
+    io_threads: int = Field(8, env="IO_THREADS")
+    pg_pool_min_size: int = Field(0, env="PG_POOL_MIN_SIZE")
+    pg_pool_max_size: int = Field(10, env="PG_POOL_MAX_SIZE")
+    pg_read_timeout: float = Field(300.0, env="PG_READ_TIMEOUT")
+    query_threads: int = Field(0, env="QUERY_THREADS")
+    api_thread_limit: int = Field(40, env="API_THREAD_LIMIT")
+    admission_timeout: float = Field(300.0, env="ADMISSION_TIMEOUT")
+    admission_retry_after: float = Field(30.0, env="ADMISSION_RETRY_AFTER")
+    admission_max_memory_percent: float = Field(75.0, env="ADMISSION_MAX_MEMORY_PERCENT")
+    admission_max_cpu_percent: float = Field(85.0, env="ADMISSION_MAX_CPU_PERCENT")
+    resource_sample_interval: float = Field(1.0, env="RESOURCE_SAMPLE_INTERVAL")
+    result_cache_dir: str = Field("cache/resultados", env="RESULT_CACHE_DIR")
+    result_cache_max_bytes: int = Field(10 * 1024**3, env="RESULT_CACHE_MAX_BYTES")
     
     model_config = ConfigDict(
         env_file=".env",
@@ -1252,3 +3208,44 @@ engine = create_engine(
     poolclass=NullPool,
     connect_args={'options': '-c statement_timeout=15000'}
 )
+
+catalog = ParquetCatalog(settings.parquet_root, settings.catalog_path, settings.catalog_refresh_interval)
+duckdb_pool = DuckDBPool(
+    settings.max_concurrent_jobs,
+    settings.duckdb_memory_budget_mb * 1024**2 or int(psutil.virtual_memory().total * 0.5),
+    settings.duckdb_temp_directory
+)
+result_cache = ResultCache(settings.result_cache_dir, settings.result_cache_max_bytes)
+job_store = JobStore(settings.job_store_path)
+resource_monitor = ResourceMonitor(
+    settings.resource_sample_interval,
+    settings.admission_max_memory_percent,
+    settings.admission_max_cpu_percent
+)
+admission = AdmissionController(
+    duckdb_pool.memory_per_job * duckdb_pool.max_jobs,
+    settings.admission_max_queue,
+    settings.admission_timeout,
+    resource_monitor
+)
+io_executor = ThreadPoolExecutor(settings.io_threads, thread_name_prefix="io")
+query_executor = ThreadPoolExecutor(
+    settings.query_threads or settings.max_concurrent_jobs, thread_name_prefix="query"
+)
+stream_executor = ThreadPoolExecutor(settings.max_concurrent_jobs, thread_name_prefix="stream")
+admission_executor = ThreadPoolExecutor(settings.admission_max_queue, thread_name_prefix="admission")
+
+# -----------------------------------------------------------------------------
+# Execução local com Uvicorn
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    import uvicorn
+    try:
+        settings = Settings()
+        print("Configurações carregadas com sucesso!")
+        print(settings.model_dump())
+    except ValidationError as e:
+        print("Erro nas configurações:")
+        print(e.json(indent=2))
+        exit(1)
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,10 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from ..models.request_models import QueryParams
-from ..services.data_service import DataService
+from ..services.data_service import DataService, InvalidCursor
 from ..auth.jwt_handler import verify_token
-from ..utils.db import get_db
-from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import pandas as pd
 
 router = APIRouter()
@@ -12,27 +10,36 @@ router = APIRouter()
 @router.get("/query")
 async def query_data(
     params: QueryParams,
-    token: Dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    page_size: int = Query(10_000, ge=1, le=100_000),
+    cursor: Optional[str] = None,
+    token: Dict = Depends(verify_token)
 ) -> Dict[str, Any]:
     try:
-        service = DataService(db)
-        df = await service.get_data(
+        service = DataService()
+        df, next_cursor, total = await service.get_page(
             base=params.base,
             grupo=params.grupo,
             estados=params.estados,
             colunas=params.colunas,
             competencia_inicio=params.competencia_inicio,
-            competencia_fim=params.competencia_fim
+            competencia_fim=params.competencia_fim,
+            page_size=page_size,
+            cursor=cursor
         )
-        if df.empty:
+        if df.empty and cursor is None:
             raise HTTPException(status_code=404, detail="Dados não encontrados")
             
         return {
             "data": df.to_dict(orient='records'),
-            "total_registros": len(df),
-            "colunas": df.columns.tolist()
+            "registros_pagina": len(df),
+            "total_registros": total,
+            "colunas": df.columns.tolist(),
+            "next_cursor": next_cursor
         }
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
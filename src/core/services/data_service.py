@@ -1,13 +1,139 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
-from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import os
+import re
+import threading
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+class InvalidCursor(ValueError):
+    pass
+
+class ParquetReadError(RuntimeError):
+    """Falha ao ler arquivos Parquet (não confundir com consulta sem dados)."""
+
+# Índice em memória das pastas de grupo: caminho -> (mtime, {(UF, YYYYMM): arquivos})
+_DIR_INDEX: Dict[str, Tuple[float, Dict[Tuple[str, int], List[str]]]] = {}
+_DIR_INDEX_LOCK = threading.Lock()
+# Metadados por arquivo de parte: caminho -> (mtime, registros, colunas)
+_FILE_META: Dict[str, Tuple[float, int, frozenset]] = {}
+_FILE_META_LOCK = threading.Lock()
+
+UFS = ['AC','AL','AP','AM','BA','CE','DF','ES','GO','MA','MT','MS','MG',
+       'PA','PB','PR','PE','PI','RJ','RN','RS','RO','RR','SC','SP','SE','TO']
+
+def parse_file_name(nome: str, grupo: str) -> Optional[Tuple[str, int]]:
+    """
+    Extrai (UF, competência YYYYMM) de nomes como RDSP2201.parquet ou
+    BISP2311_1.parquet. Usado também pelo catálogo da API (main.ParquetCatalog).
+    """
+    match = re.match(rf"^{re.escape(grupo)}([A-Z]{{2}})(\d{{2}})(\d{{2}})(?:_\d+)?\.parquet$", nome, re.IGNORECASE)
+    if not match:
+        return None
+    uf, yy, mm = match.group(1).upper(), int(match.group(2)), int(match.group(3))
+    if uf not in UFS or not 1 <= mm <= 12:
+        return None
+    ano = 1900 + yy if yy >= 90 else 2000 + yy
+    return uf, ano * 100 + mm
+
+def group_index(path: str, grupo: str) -> Dict[Tuple[str, int], List[str]]:
+    """Índice (UF, competência) -> arquivos da pasta, refeito só quando o mtime da pasta muda."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    with _DIR_INDEX_LOCK:
+        cached = _DIR_INDEX.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        index: Dict[Tuple[str, int], List[str]] = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                chave = parse_file_name(entry.name, grupo)
+                if chave:
+                    index.setdefault(chave, []).append(entry.path)
+        for arquivos in index.values():
+            arquivos.sort()
+        _DIR_INDEX[path] = (mtime, index)
+        return index
+
+def file_meta(path: str) -> Tuple[int, frozenset]:
+    """
+    (registros, colunas) de um arquivo Parquet, lidos do footer só quando o
+    mtime do arquivo muda. Arquivos ilegíveis levantam ParquetReadError.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        with _FILE_META_LOCK:
+            cached = _FILE_META.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        metadata = pq.read_metadata(path)
+    except Exception as e:
+        raise ParquetReadError(f"Erro ao ler metadados Parquet de {path}: {e}") from e
+    meta = (mtime, metadata.num_rows, frozenset(metadata.schema.names))
+    with _FILE_META_LOCK:
+        _FILE_META[path] = meta
+    return meta[1], meta[2]
+
+def expand_parquet_paths(paths: List[str]) -> List[str]:
+    """
+    Expande cada pasta {grupo}{UF}{AAMM}.parquet nos seus arquivos de partes
+    (*.parquet), em ordem; caminhos que já são arquivos são mantidos.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as it:
+                files.extend(sorted(
+                    entry.path for entry in it
+                    if entry.name.endswith(".parquet") and entry.is_file()
+                ))
+        else:
+            files.append(path)
+    return files
+
+def scan_parquet(files: List[str], colunas: Optional[List[str]] = None) -> pa.Table:
+    """
+    Lê os arquivos (ou pastas de partes) como um único pyarrow.dataset,
+    decodificando só as colunas pedidas num scan multi-thread. UF e
+    competência já são selecionadas na escolha dos arquivos (group_index).
+    Partes sem alguma das colunas pedidas são ignoradas, como na leitura
+    arquivo a arquivo; partes ilegíveis levantam ParquetReadError.
+    """
+    schemas, validos, erros = [], [], []
+    for file in expand_parquet_paths(files):
+        try:
+            schema = pq.read_schema(file)
+        except Exception as e:
+            erros.append(f"{file}: {e}")
+            continue
+        faltando = [col for col in (colunas or []) if col not in schema.names]
+        if faltando:
+            logger.warning(f"Arquivo {file} ignorado: colunas ausentes {faltando}")
+            continue
+        schemas.append(schema)
+        validos.append(file)
+    if erros:
+        raise ParquetReadError("Erro ao ler arquivos Parquet: " + "; ".join(erros))
+    if not validos:
+        return pa.table({})
+
+    schema = pa.unify_schemas(schemas, promote_options="default")
+    dataset = ds.dataset(validos, schema=schema, format="parquet")
+    return dataset.to_table(columns=colunas or None, use_threads=True)
+
 class DataService:
-    def __init__(self, db: Session):
-        self.db = db
+    def __init__(self):
         self.base_path = "parquet_files"
 
     def _parse_competencia(self, comp_str: str) -> tuple:
@@ -19,16 +145,19 @@ class DataService:
         files = []
         ano_ini, mes_ini = self._parse_competencia(comp_inicio)
         ano_fim, mes_fim = self._parse_competencia(comp_fim)
+        index = group_index(os.path.join(self.base_path, base, grupo), grupo)
+        if not index:
+            return files
+
+        competencias = []
+        ano, mes = ano_ini, mes_ini
+        while (ano, mes) <= (ano_fim, mes_fim):
+            competencias.append(ano * 100 + mes)
+            ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
 
         for estado in estados:
-            path = os.path.join(self.base_path, base, grupo)
-            if not os.path.exists(path):
-                continue
-                
-            pattern = f"{grupo}{estado}"
-            for file in os.listdir(path):
-                if file.startswith(pattern) and file.endswith('.parquet'):
-                    files.append(os.path.join(path, file))
+            for competencia in competencias:
+                files.extend(index.get((estado.upper(), competencia), []))
         
         return files
 
@@ -41,19 +170,115 @@ class DataService:
         if not files:
             return pd.DataFrame()
 
-        dfs = []
+        table = scan_parquet(files, colunas)
+        if table.num_columns == 0:
+            return pd.DataFrame()
+
+        return table.to_pandas() 
+
+    @staticmethod
+    def _files_fingerprint(files: List[str]) -> str:
+        return hashlib.sha1("\n".join(files).encode("utf-8")).hexdigest()[:16]
+
+    def _encode_cursor(self, files: List[str], file_idx: int, offset: int) -> str:
+        payload = {"h": self._files_fingerprint(files), "f": file_idx, "o": offset}
+        raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    def _decode_cursor(self, files: List[str], cursor: Optional[str]) -> Tuple[int, int]:
+        if not cursor:
+            return 0, 0
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            file_idx, offset = int(payload["f"]), int(payload["o"])
+        except Exception as e:
+            raise InvalidCursor("Cursor inválido") from e
+        if payload.get("h") != self._files_fingerprint(files) or file_idx < 0 or offset < 0:
+            raise InvalidCursor("Cursor não corresponde a esta consulta (os arquivos mudaram?)")
+        return file_idx, offset
+
+    async def get_page(self, base: str, grupo: str, estados: List[str],
+                       colunas: List[str], competencia_inicio: str,
+                       competencia_fim: str, page_size: int,
+                       cursor: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str], int]:
+        """
+        Lê uma página de até page_size registros a partir do cursor.
+
+        O cursor (opaco, base64) guarda o índice do arquivo, o deslocamento de
+        linhas dentro dele e uma impressão digital da lista de arquivos. O total
+        vem das contagens em cache (file_meta) e só os arquivos da página são
+        abertos; os row groups anteriores ao deslocamento são pulados pelo
+        metadado do Parquet. A leitura roda numa thread, fora do event loop.
+        Como no scan_parquet, partes sem alguma das colunas pedidas são
+        ignoradas (e não entram no total).
+        Retorna (dados, próximo cursor ou None, total de registros dos arquivos).
+        """
+        return await asyncio.to_thread(
+            self._read_page, base, grupo, estados, colunas,
+            competencia_inicio, competencia_fim, page_size, cursor
+        )
+
+    def _read_page(self, base: str, grupo: str, estados: List[str],
+                   colunas: List[str], competencia_inicio: str,
+                   competencia_fim: str, page_size: int,
+                   cursor: Optional[str]) -> Tuple[pd.DataFrame, Optional[str], int]:
+        files = expand_parquet_paths(sorted(self._get_parquet_files(base, grupo, estados,
+                                                                    competencia_inicio, competencia_fim)))
+        if not files:
+            return pd.DataFrame(), None, 0
+
+        file_idx, offset = self._decode_cursor(files, cursor)
+        row_counts = []
         for file in files:
+            num_rows, nomes = file_meta(file)
+            faltando = [col for col in (colunas or []) if col not in nomes]
+            if faltando:
+                logger.warning(f"Arquivo {file} ignorado: colunas ausentes {faltando}")
+                num_rows = 0
+            row_counts.append(num_rows)
+        total = sum(row_counts)
+
+        tables = []
+        remaining = page_size
+        while remaining > 0 and file_idx < len(files):
+            if offset >= row_counts[file_idx]:
+                file_idx, offset = file_idx + 1, 0
+                continue
             try:
-                df = pq.read_table(file).to_pandas()
-                if not colunas:
-                    colunas = df.columns.tolist()
-                df = df[colunas]
-                dfs.append(df)
+                with pq.ParquetFile(files[file_idx]) as parquet_file:
+                    first_group, skip = 0, offset
+                    while (first_group < parquet_file.num_row_groups
+                           and skip >= parquet_file.metadata.row_group(first_group).num_rows):
+                        skip -= parquet_file.metadata.row_group(first_group).num_rows
+                        first_group += 1
+                    batches = parquet_file.iter_batches(
+                        batch_size=min(page_size, 65_536),
+                        row_groups=range(first_group, parquet_file.num_row_groups),
+                        columns=colunas or None
+                    )
+                    for batch in batches:
+                        # O deslocamento dentro do row group pode atravessar vários batches
+                        if skip >= batch.num_rows:
+                            skip -= batch.num_rows
+                            continue
+                        batch = batch.slice(skip, remaining)
+                        skip = 0
+                        if batch.num_rows:
+                            tables.append(pa.Table.from_batches([batch]))
+                        remaining -= batch.num_rows
+                        offset += batch.num_rows
+                        if remaining == 0:
+                            break
             except Exception as e:
-                print(f"Erro ao ler arquivo {file}: {e}")
-                continue
-
-        if not dfs:
-            return pd.DataFrame()
+                raise ParquetReadError(f"Erro ao ler arquivo {files[file_idx]}: {e}") from e
+            if offset >= row_counts[file_idx]:
+                file_idx, offset = file_idx + 1, 0
 
-        return pd.concat(dfs, ignore_index=True) 
\ No newline at end of file
+        # Pula arquivos vazios ou ignorados no fim, para a última página não devolver cursor
+        while file_idx < len(files) and offset >= row_counts[file_idx]:
+            file_idx, offset = file_idx + 1, 0
+        next_cursor = self._encode_cursor(files, file_idx, offset) if file_idx < len(files) else None
+        if not tables:
+            return pd.DataFrame(), next_cursor, total
+        return pa.concat_tables(tables, promote_options="default").to_pandas(), next_cursor, total
@@ -1,9 +1,8 @@
 from typing import List, Dict, Any
 import pandas as pd
-import pyarrow.parquet as pq
-from sqlalchemy.orm import Session
 from datetime import datetime
 import os
+from .data_service import DataService, scan_parquet
 
 class UnifiedDataService:
     VALID_GROUPS = {
@@ -17,8 +16,7 @@ class UnifiedDataService:
         'PA': ['PA_CODUNI', 'PA_DOCORIG', 'PA_PROC_ID']
     }
 
-    def __init__(self, db: Session):
-        self.db = db
+    def __init__(self):
         self.base_path = "parquet_files"
         
     def validate_group_columns(self, grupo: str, colunas: List[str]) -> bool:
@@ -38,11 +36,12 @@ class UnifiedDataService:
             comp_fim=params['competencia_fim']
         )
         
-        dfs = []
-        for file in files:
-            df = pq.read_table(file).to_pandas()
-            if params['colunas']:
-                df = df[params['colunas']]
-            dfs.append(df)
-            
-        return pd.concat(dfs) if dfs else pd.DataFrame()
\ No newline at end of file
+        if not files:
+            return pd.DataFrame()
+
+        table = scan_parquet(files, params['colunas'])
+        return table.to_pandas() if table.num_columns else pd.DataFrame()
+
+    def _get_parquet_files(self, base: str, grupo: str, estados: List[str],
+                           comp_inicio: str, comp_fim: str) -> List[str]:
+        return DataService()._get_parquet_files(base, grupo, estados, comp_inicio, comp_fim)
\ No newline at end of file
@@ -156,9 +156,10 @@ def processar_dados(dados):
             # Opcional: Armazenar a justificativa se necessário
             # tipo_coluna_map[tabela_normalizada][coluna_normalizada]['justificativa'] = resultado['justificativa']
         
-        # Adicionar as três novas colunas
+        # Adicionar as colunas de controle (id, linhagem do arquivo de origem e UF)
         tipo_coluna_map[tabela_normalizada]['id'] = "SERIAL PRIMARY KEY"
-        tipo_coluna_map[tabela_normalizada]['id_log'] = "VARCHAR(255)"
+        tipo_coluna_map[tabela_normalizada]['file_id'] = "BIGINT"
+        tipo_coluna_map[tabela_normalizada]['linha_arquivo'] = "INTEGER"
         tipo_coluna_map[tabela_normalizada]['uf'] = "CHAR(2)"
         
         # Organizar as colunas em ordem alfabética
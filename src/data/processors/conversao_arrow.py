@@ -0,0 +1,193 @@
+import logging
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Formatos de data aceitos, na ordem de tentativa (DATASUS usa AAAAMMDD)
+FORMATOS_DATA = ("%Y%m%d", "%Y-%m-%d", "%d/%m/%Y")
+
+TIPOS_INTEIROS = {
+    "SMALLINT": pa.int16(),
+    "INTEGER": pa.int32(),
+    "BIGINT": pa.int64(),
+}
+
+# Colunas de linhagem (arquivo de origem e posição da linha), preenchidas pelos loaders
+COLUNAS_LINHAGEM = ("file_id", "linha_arquivo")
+
+_RE_INTEIRO = r"^[+-]?\d+$"
+_RE_NUMERICO = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+
+def _texto(coluna):
+    """
+    Converte a coluna para utf8 sem espaços nas bordas, preservando nulos.
+    """
+    if not pa.types.is_string(coluna.type) and not pa.types.is_large_string(coluna.type):
+        coluna = pc.cast(coluna, pa.string())
+    return pc.utf8_trim_whitespace(coluna)
+
+
+def _mascarar(coluna, padrao):
+    """
+    Texto aparado onde casa com o padrão; nulo nas demais linhas (equivale a errors='coerce').
+    """
+    texto = _texto(coluna)
+    return pc.if_else(pc.match_substring_regex(texto, padrao), texto, pa.scalar(None, pa.string()))
+
+
+def _para_inteiro(coluna, tipo):
+    if pa.types.is_integer(coluna.type):
+        valores = pc.cast(coluna, pa.int64())
+    elif pa.types.is_floating(coluna.type):
+        inteiros = pc.equal(coluna, pc.floor(coluna))
+        valores = pc.cast(pc.if_else(inteiros, coluna, pa.scalar(None, coluna.type)), pa.int64(), safe=False)
+    else:
+        valores = pc.cast(_mascarar(coluna, _RE_INTEIRO), pa.int64())
+    # Valores fora do intervalo do tipo viram nulos em vez de estourar
+    minimo = pa.scalar(-(2 ** (tipo.bit_width - 1)), pa.int64())
+    maximo = pa.scalar(2 ** (tipo.bit_width - 1) - 1, pa.int64())
+    no_intervalo = pc.and_(pc.greater_equal(valores, minimo), pc.less_equal(valores, maximo))
+    return pc.cast(pc.if_else(no_intervalo, valores, pa.scalar(None, pa.int64())), tipo)
+
+
+def _para_numerico(coluna):
+    """
+    NUMERIC sem passar por float64: colunas numéricas mantêm o tipo de origem
+    (inteiro, decimal128 ou float) e texto é validado e mantido como texto, para
+    a cópia gerar o Decimal exato a partir da string original.
+    """
+    if pa.types.is_integer(coluna.type) or pa.types.is_floating(coluna.type) or pa.types.is_decimal(coluna.type):
+        return coluna
+    return _mascarar(coluna, _RE_NUMERICO)
+
+
+def _para_data(coluna):
+    if pa.types.is_date(coluna.type):
+        return pc.cast(coluna, pa.date32())
+    if pa.types.is_timestamp(coluna.type):
+        return pc.cast(coluna, pa.date32())
+    texto = _texto(coluna)
+    tentativas = [
+        pc.strptime(texto, format=formato, unit="s", error_is_null=True)
+        for formato in FORMATOS_DATA
+    ]
+    return pc.cast(pc.coalesce(*tentativas), pa.date32())
+
+
+def _para_booleano(coluna):
+    if pa.types.is_boolean(coluna.type):
+        return coluna
+    if pa.types.is_integer(coluna.type) or pa.types.is_floating(coluna.type):
+        verdadeiro, falso = pc.equal(coluna, 1), pc.equal(coluna, 0)
+    else:
+        texto = _texto(coluna)
+        verdadeiro = pc.is_in(texto, value_set=pa.array(["True", "1"]))
+        falso = pc.is_in(texto, value_set=pa.array(["False", "0"]))
+    nulo = pa.scalar(None, pa.bool_())
+    return pc.if_else(verdadeiro, True, pc.if_else(falso, False, nulo))
+
+
+def converter_coluna(coluna, tipo):
+    """
+    Converte uma coluna Arrow para o tipo SQL do mapeamento. Valores inválidos
+    viram nulos; retorna None para tipos não mapeados.
+    """
+    tipo = tipo.upper()
+    if tipo.startswith("VARCHAR") or tipo.startswith("CHAR") or tipo == "TEXT":
+        return _texto(coluna)
+    if tipo in TIPOS_INTEIROS:
+        return _para_inteiro(coluna, TIPOS_INTEIROS[tipo])
+    if tipo.startswith("NUMERIC"):
+        return _para_numerico(coluna)
+    if tipo == "DATE":
+        return _para_data(coluna)
+    if tipo == "BOOLEAN":
+        return _para_booleano(coluna)
+    return None
+
+
+def converter_tabela(tabela, mapeamento_tipos):
+    """
+    Converte as colunas da tabela Arrow conforme o mapeamento {coluna: tipo SQL}
+    usando apenas kernels do pyarrow.compute (sem colunas de objetos Python).
+
+    Raises:
+        TypeError: Se ocorrer erro durante a conversão.
+    """
+    for col, tipo in mapeamento_tipos.items():
+        if col not in tabela.column_names:
+            continue
+        try:
+            convertida = converter_coluna(tabela.column(col), tipo)
+        except Exception as e:
+            raise TypeError(f"Erro ao converter coluna '{col}' para o tipo '{tipo}': {e}")
+        if convertida is None:
+            logger.warning(f"Tipo de dado não mapeado para a coluna '{col}': '{tipo}'. Mantendo o tipo original.")
+            continue
+        tabela = tabela.set_column(tabela.column_names.index(col), col, convertida)
+    return tabela
+
+
+def normalizar_tabela(tabela, colunas, remover=()):
+    """
+    Coloca os nomes das colunas em minúsculas, remove as colunas em `remover` e
+    retorna a tabela com exatamente `colunas`, na ordem dada. Colunas ausentes
+    entram como nulas (utf8).
+    """
+    tabela = tabela.rename_columns([col.lower() for col in tabela.column_names])
+    remover = {col.lower() for col in remover}
+    existentes = {col for col in tabela.column_names if col not in remover}
+    arrays = []
+    for coluna in (col.lower() for col in colunas):
+        if coluna in existentes:
+            arrays.append(tabela.column(coluna))
+        else:
+            logger.warning(f"Adicionando coluna ausente: {coluna}")
+            arrays.append(pa.nulls(tabela.num_rows, pa.string()))
+    return pa.table(arrays, names=[col.lower() for col in colunas])
+
+
+def coluna_constante(valor, tamanho):
+    """
+    Coluna utf8 com o mesmo valor em todas as linhas.
+    """
+    return pc.fill_null(pa.nulls(tamanho, pa.string()), valor)
+
+
+def adicionar_linhagem(tabela, file_id, inicio=0):
+    """
+    Preenche (ou acrescenta) as colunas de linhagem: 'file_id', o id do arquivo no
+    load_ledger, e 'linha_arquivo', a posição da linha no arquivo a partir de `inicio`.
+    Colunas inteiras geradas sem laço Python.
+    """
+    tamanho = tabela.num_rows
+    colunas = {
+        "file_id": pa.array(np.full(tamanho, file_id, dtype=np.int64)),
+        "linha_arquivo": pa.array(np.arange(inicio, inicio + tamanho, dtype=np.int32)),
+    }
+    for nome, coluna in colunas.items():
+        if nome in tabela.column_names:
+            tabela = tabela.set_column(tabela.column_names.index(nome), nome, coluna)
+        else:
+            tabela = tabela.append_column(nome, coluna)
+    return tabela
+
+
+def ler_parquet_em_lotes(arquivo, tamanho_lote, colunas=None):
+    """
+    Lê o arquivo .parquet em lotes de até `tamanho_lote` linhas (iter_batches),
+    como tabelas Arrow. Com `colunas`, só lê as colunas do arquivo cujo nome em
+    minúsculas está na lista. A memória usada é limitada pelo lote, não pelo arquivo.
+    """
+    arquivo_parquet = pq.ParquetFile(arquivo)
+    selecionadas = None
+    if colunas is not None:
+        desejadas = {col.lower() for col in colunas}
+        selecionadas = [col for col in arquivo_parquet.schema_arrow.names if col.lower() in desejadas]
+    for lote in arquivo_parquet.iter_batches(batch_size=tamanho_lote, columns=selecionadas):
+        if lote.num_rows:
+            yield pa.Table.from_batches([lote])
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from decimal import Decimal
+
+import asyncpg
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from conversao_arrow import converter_coluna
+
+logger = logging.getLogger(__name__)
+
+# Número de streams COPY simultâneos por tabela em cada processo
+UPLOAD_COPY_STREAMS = int(os.getenv("UPLOAD_COPY_STREAMS", "4"))
+
+# Tipos do information_schema -> tipos do mapeamento usado por converter_coluna
+TIPOS_POSTGRES = {
+    "smallint": "SMALLINT",
+    "integer": "INTEGER",
+    "bigint": "BIGINT",
+    "numeric": "NUMERIC",
+    "double precision": "NUMERIC",
+    "real": "NUMERIC",
+    "date": "DATE",
+    "boolean": "BOOLEAN",
+    "text": "TEXT",
+    "character": "CHAR",
+    "character varying": "VARCHAR",
+}
+
+# Colunas de ponto flutuante: validadas como NUMERIC, enviadas como float
+TIPOS_PONTO_FLUTUANTE = {"double precision", "real"}
+
+_FIM = object()
+
+
+def _decimal(valor):
+    """
+    Decimal exato a partir do texto de origem, de inteiros ou de decimal128.
+    Floats (já binários no arquivo de origem) usam a representação mais curta.
+    """
+    if valor is None or isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, float):
+        return Decimal(repr(valor))
+    return Decimal(valor)
+
+
+class CopiaBinaria:
+    """
+    Destino de COPY binário (asyncpg copy_records_to_table) para os loaders.
+
+    Os lotes (DataFrame ou tabela Arrow) entram numa fila limitada e são gravados
+    por `streams` conexões em paralelo, num event loop próprio em segundo plano.
+    Antes do envio cada coluna é convertida em Arrow para o tipo da coluna destino
+    (information_schema), então nenhum texto CSV é gerado nem interpretado.
+    Com `slot`, cada COPY ocupa um slot_copy(tabela) durante a gravação.
+    `ao_gravar(linhas, erro)`, se informado em enviar(), é chamado quando o lote
+    termina de ser gravado (ou falha); `ocupado` soma o tempo de trabalho dos streams.
+
+    Uso:
+        with CopiaBinaria(tabela, colunas) as copia:
+            copia.enviar(df_lote)
+    """
+
+    def __init__(self, tabela, colunas, streams=None, slot=None, log=None):
+        self.tabela = tabela
+        self.colunas = [col.lower() for col in colunas]
+        self.streams = streams or UPLOAD_COPY_STREAMS
+        self.slot = slot
+        self.log = log or logger
+        self.linhas = 0
+        self.bytes = 0
+        self.lotes_com_erro = 0
+        self.ocupado = 0.0
+        self._fila = queue.Queue(maxsize=self.streams * 2)
+        self._erro = None
+        self._tipos = {}
+        self._flutuantes = set()
+        self._pronto = threading.Event()
+        self._thread = None
+        self._inicio = None
+
+    def __enter__(self):
+        self._inicio = time.time()
+        self._thread = threading.Thread(target=self._executar, name=f"copia-{self.tabela}", daemon=True)
+        self._thread.start()
+        self._pronto.wait()
+        if self._erro:
+            raise self._erro
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for _ in range(self.streams):
+            self._fila.put(_FIM)
+        self._thread.join()
+        decorrido = max(time.time() - self._inicio, 1e-6)
+        self.log.info(
+            f"[{self.tabela}] COPY binário: {self.linhas} registros, {self.bytes / 1024 ** 2:.1f} MB em "
+            f"{decorrido:.1f}s ({self.linhas / decorrido:,.0f} registros/s, "
+            f"{self.bytes / 1024 ** 2 / decorrido:.1f} MB/s, {self.lotes_com_erro} lotes com erro)"
+        )
+        return False
+
+    def enviar(self, lote, ao_gravar=None):
+        """
+        Enfileira um lote; bloqueia enquanto a fila estiver cheia (back-pressure).
+        """
+        if self._erro:
+            raise self._erro
+        if not isinstance(lote, pa.Table):
+            lote = pa.Table.from_pandas(lote, preserve_index=False)
+        self._fila.put((lote, ao_gravar))
+
+    def _registros(self, lote):
+        colunas = []
+        for nome in self.colunas:
+            coluna = lote.column(nome) if nome in lote.column_names else pa.nulls(lote.num_rows)
+            tipo = self._tipos.get(nome)
+            if tipo:
+                coluna = converter_coluna(coluna, tipo) if not pa.types.is_null(coluna.type) else coluna
+            if tipo == "NUMERIC" and nome in self._flutuantes:
+                valores = pc.cast(coluna, pa.float64()).to_pylist()
+            elif tipo == "NUMERIC":
+                valores = [_decimal(v) for v in coluna.to_pylist()]
+            else:
+                valores = coluna.to_pylist()
+            colunas.append(valores)
+        return list(zip(*colunas))
+
+    async def _conectar(self):
+        return await asyncpg.connect(
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            host=os.getenv('DB_HOST'),
+            port=int(os.getenv('DB_PORT', 5432)),
+            database=os.getenv('DB_NAME'),
+            timeout=10
+        )
+
+    async def _copiar(self):
+        loop = asyncio.get_running_loop()
+        conexoes = []
+        try:
+            conexoes = await asyncio.gather(*(self._conectar() for _ in range(self.streams)))
+            tipos = await conexoes[0].fetch(
+                """
+                SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = $1
+                """,
+                self.tabela
+            )
+            self._tipos = {
+                linha["column_name"]: TIPOS_POSTGRES[linha["data_type"]]
+                for linha in tipos if linha["data_type"] in TIPOS_POSTGRES
+            }
+            self._flutuantes = {
+                linha["column_name"] for linha in tipos if linha["data_type"] in TIPOS_PONTO_FLUTUANTE
+            }
+        except Exception as e:
+            self._erro = e
+            self._pronto.set()
+            await asyncio.gather(*(c.close() for c in conexoes), return_exceptions=True)
+            return
+        self._pronto.set()
+
+        async def gravar(conexao):
+            while True:
+                item = await loop.run_in_executor(None, self._fila.get)
+                if item is _FIM:
+                    return
+                lote, ao_gravar = item
+                linhas, erro = 0, None
+                try:
+                    inicio = time.perf_counter()
+                    registros = await loop.run_in_executor(None, self._registros, lote)
+                    self.ocupado += time.perf_counter() - inicio
+                    slot = self.slot(self.tabela) if self.slot else None
+                    if slot is not None:
+                        await loop.run_in_executor(None, slot.__enter__)
+                    try:
+                        inicio = time.perf_counter()
+                        await conexao.copy_records_to_table(self.tabela, records=registros, columns=self.colunas)
+                        self.ocupado += time.perf_counter() - inicio
+                    finally:
+                        if slot is not None:
+                            await loop.run_in_executor(None, slot.__exit__, None, None, None)
+                    linhas = lote.num_rows
+                    self.linhas += linhas
+                    self.bytes += lote.nbytes
+                    self.log.info(f"[{self.tabela}] Lote de {lote.num_rows} registros inserido com sucesso.")
+                except Exception as e:
+                    erro = e
+                    self.lotes_com_erro += 1
+                    self.log.critical(f"[{self.tabela}] Erro ao inserir dados: {e}", exc_info=True)
+                finally:
+                    if ao_gravar is not None:
+                        try:
+                            await loop.run_in_executor(None, ao_gravar, linhas, erro)
+                        except Exception as e:
+                            self.log.error(f"[{self.tabela}] Erro no retorno do lote gravado: {e}")
+
+        try:
+            await asyncio.gather(*(gravar(c) for c in conexoes))
+        finally:
+            await asyncio.gather(*(c.close() for c in conexoes), return_exceptions=True)
+
+    def _executar(self):
+        asyncio.run(self._copiar())
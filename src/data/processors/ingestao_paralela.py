@@ -0,0 +1,119 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Configuração do modo paralelo (UPLOAD_WORKERS=0 mantém o processamento serial)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "0"))
+UPLOAD_COPY_POR_TABELA = int(os.getenv("UPLOAD_COPY_POR_TABELA", "2"))
+UPLOAD_MAX_CONEXOES_ATIVAS = int(os.getenv("UPLOAD_MAX_CONEXOES_ATIVAS", "16"))
+UPLOAD_INTERVALO_CARGA = float(os.getenv("UPLOAD_INTERVALO_CARGA", "5"))
+
+# Estado de cada processo worker, definido pelo initializer do pool
+_semaforos = {}
+_engine = None
+_ultima_verificacao = 0.0
+
+
+def _inicializar_worker(semaforos, engine_factory, nome_logger):
+    global _semaforos, _engine, logger
+    _semaforos = semaforos
+    _engine = engine_factory()
+    logger = logging.getLogger(nome_logger)
+
+
+def conexoes_ativas(engine):
+    """
+    Retorna o número de conexões ativas no banco (pg_stat_activity), excluindo a atual.
+    """
+    with engine.connect() as connection:
+        return connection.execute(text("""
+            SELECT count(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND state = 'active' AND pid <> pg_backend_pid()
+        """)).scalar()
+
+
+def aguardar_carga_postgres():
+    """
+    Back-pressure: enquanto o Postgres tiver mais conexões ativas que
+    UPLOAD_MAX_CONEXOES_ATIVAS, o worker espera antes de abrir um novo COPY.
+    A verificação é feita no máximo a cada UPLOAD_INTERVALO_CARGA segundos.
+    """
+    global _ultima_verificacao
+    if _engine is None or time.time() - _ultima_verificacao < UPLOAD_INTERVALO_CARGA:
+        return
+    while True:
+        try:
+            ativas = conexoes_ativas(_engine)
+        except Exception as e:
+            logger.warning(f"Não foi possível medir a carga do Postgres: {e}")
+            break
+        if ativas <= UPLOAD_MAX_CONEXOES_ATIVAS:
+            break
+        logger.info(f"Postgres com {ativas} conexões ativas; aguardando {UPLOAD_INTERVALO_CARGA}s")
+        time.sleep(UPLOAD_INTERVALO_CARGA)
+    _ultima_verificacao = time.time()
+
+
+@contextmanager
+def slot_copy(tabela):
+    """
+    Reserva um dos UPLOAD_COPY_POR_TABELA streams COPY da tabela (compartilhados
+    por todos os workers) depois de respeitar a carga do Postgres.
+    No modo serial (sem semáforos) apenas executa o bloco.
+    """
+    semaforo = _semaforos.get(tabela)
+    if semaforo is None:
+        yield
+        return
+    aguardar_carga_postgres()
+    with semaforo:
+        yield
+
+
+def executar_em_paralelo(tarefas, funcao, tabelas, engine_factory, nome_logger, workers=None):
+    """
+    Distribui as tarefas (tuplas de argumentos de `funcao`) entre processos worker.
+
+    Cada worker cria o próprio engine (e portanto a própria conexão de COPY) com
+    `engine_factory`. Os semáforos por tabela limitam os COPY simultâneos em cada
+    tabela destino, somando todos os workers. Os workers registram no logger
+    `nome_logger`, o mesmo do script que os iniciou.
+
+    Returns:
+        tuple: (tarefas concluídas, tarefas com erro)
+    """
+    global logger
+    logger = logging.getLogger(nome_logger)
+    workers = workers or UPLOAD_WORKERS or os.cpu_count()
+    contexto = multiprocessing.get_context("spawn")
+    semaforos = {tabela: contexto.BoundedSemaphore(UPLOAD_COPY_POR_TABELA) for tabela in set(tabelas)}
+    concluidas, erros = 0, 0
+    logger.info(
+        f"Ingestão paralela: {len(tarefas)} arquivos, {workers} workers, "
+        f"{UPLOAD_COPY_POR_TABELA} COPY por tabela"
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=contexto,
+        initializer=_inicializar_worker,
+        initargs=(semaforos, engine_factory, nome_logger)
+    ) as executor:
+        futuros = {executor.submit(funcao, *tarefa): tarefa for tarefa in tarefas}
+        for futuro in as_completed(futuros):
+            tarefa = futuros[futuro]
+            try:
+                futuro.result()
+                concluidas += 1
+            except Exception as e:
+                erros += 1
+                logger.error(f"Erro ao processar {tarefa}: {e}")
+            if (concluidas + erros) % 50 == 0:
+                logger.info(f"Progresso: {concluidas + erros}/{len(tarefas)} arquivos ({erros} com erro)")
+    logger.info(f"Ingestão paralela concluída: {concluidas} arquivos, {erros} com erro")
+    return concluidas, erros
@@ -0,0 +1,249 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from conversao_arrow import ler_parquet_em_lotes
+from copia_binaria import CopiaBinaria
+from registro_carga import checksum_arquivo, finalizar_carga, id_arquivo, iniciar_carga
+
+logger = logging.getLogger(__name__)
+
+# Workers de cada estágio; a escrita usa UPLOAD_COPY_STREAMS conexões (copia_binaria)
+UPLOAD_LEITORES = int(os.getenv("UPLOAD_LEITORES", "2"))
+UPLOAD_TRANSFORMADORES = int(os.getenv("UPLOAD_TRANSFORMADORES", "2"))
+# Lotes lidos aguardando transformação (limita a memória entre os estágios)
+UPLOAD_FILA_LOTES = int(os.getenv("UPLOAD_FILA_LOTES", "8"))
+
+_FIM = object()
+
+
+class _Estagio:
+    """
+    Tempo de trabalho (sem contar esperas em filas) dos workers de um estágio.
+    """
+
+    def __init__(self, nome, workers):
+        self.nome = nome
+        self.workers = workers
+        self.ocupado = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def medir(self):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.ocupado += time.perf_counter() - inicio
+
+
+class _Carga:
+    """
+    Estado de um arquivo em trânsito pelo pipeline. A carga é finalizada no
+    load_ledger quando a leitura terminou e todos os lotes enviados foram gravados.
+    """
+
+    def __init__(self, caminho, file_id, contexto):
+        self.caminho = caminho
+        self.file_id = file_id
+        self.contexto = contexto
+        self.pendentes = 0
+        self.linhas = 0
+        self.lotes_com_erro = 0
+        self.erro = None
+        self.lido = False
+        self.finalizada = False
+        self._lock = threading.Lock()
+
+
+class PipelineIngestao:
+    """
+    Ingestão em três estágios ligados por filas limitadas, para que disco, CPU e
+    rede trabalhem ao mesmo tempo:
+
+    - leitura (`leitores` threads): lê os arquivos .parquet em lotes (iter_batches)
+      e registra cada arquivo no load_ledger;
+    - transformação (`transformadores` threads): aplica `transformar` a cada lote
+      (normalização, conversão de tipos e linhagem, em kernels Arrow que liberam o GIL);
+    - escrita (`escritores` conexões): COPY binário pela CopiaBinaria.
+
+    `transformar(lote, contexto, file_id, inicio)` recebe o lote lido (tabela Arrow),
+    o contexto do arquivo, o file_id do ledger e a posição do lote no arquivo, e
+    retorna a tabela Arrow (ou DataFrame) a gravar. `contexto(caminho)`, se
+    informado, é calculado uma vez por arquivo; se levantar exceção, o arquivo é
+    registrado com erro. Ao final o uso de cada estágio é registrado no log.
+
+    Uso:
+        pipeline = PipelineIngestao(engine, tabela, colunas, transformar)
+        pipeline.executar(arquivos)
+    """
+
+    def __init__(self, engine, tabela, colunas, transformar, colunas_leitura=None, contexto=None,
+                 leitores=None, transformadores=None, escritores=None, slot=None,
+                 tamanho_lote=10000, log=None):
+        self.engine = engine
+        self.tabela = tabela
+        self.colunas = colunas
+        self.transformar = transformar
+        self.colunas_leitura = colunas_leitura
+        self.contexto = contexto
+        self.tamanho_lote = tamanho_lote
+        self.slot = slot
+        self.log = log or logger
+        self.leitura = _Estagio("leitura", leitores or UPLOAD_LEITORES)
+        self.transformacao = _Estagio("transformação", transformadores or UPLOAD_TRANSFORMADORES)
+        self.escritores = escritores
+        self._arquivos = queue.Queue()
+        self._lotes = queue.Queue(maxsize=UPLOAD_FILA_LOTES)
+        self._cargas = []
+
+    def executar(self, arquivos):
+        """
+        Carrega os arquivos (caminhos .parquet) e retorna o uso de cada estágio:
+        {estágio: {"workers", "ocupacao"}}, com a ocupação (fração do tempo em
+        trabalho, sem contar esperas nas filas) entre 0 e 1.
+        """
+        arquivos = list(arquivos)
+        if not arquivos:
+            return {}
+        for caminho in arquivos:
+            self._arquivos.put(caminho)
+        for _ in range(self.leitura.workers):
+            self._arquivos.put(_FIM)
+
+        inicio = time.perf_counter()
+        self.log.info(
+            f"[{self.tabela}] Pipeline: {len(arquivos)} arquivos, {self.leitura.workers} leitores, "
+            f"{self.transformacao.workers} transformadores"
+        )
+        with CopiaBinaria(self.tabela, self.colunas, streams=self.escritores, slot=self.slot, log=self.log) as copia:
+            leitores = [self._iniciar(self._ler, f"leitor-{i}") for i in range(self.leitura.workers)]
+            transformadores = [
+                self._iniciar(self._transformar, f"transformador-{i}", copia)
+                for i in range(self.transformacao.workers)
+            ]
+            for thread in leitores:
+                thread.join()
+            for _ in transformadores:
+                self._lotes.put(_FIM)
+            for thread in transformadores:
+                thread.join()
+        decorrido = max(time.perf_counter() - inicio, 1e-6)
+
+        # Cargas que não chegaram a ser finalizadas (ex.: erro da CopiaBinaria) ficam com erro
+        for carga in self._cargas:
+            if not carga.finalizada:
+                carga.erro = carga.erro or "carga interrompida"
+                carga.pendentes = 0
+                carga.lido = True
+                self._finalizar(carga)
+
+        uso = {
+            estagio.nome: {
+                "workers": estagio.workers,
+                "ocupacao": estagio.ocupado / (estagio.workers * decorrido),
+            }
+            for estagio in (self.leitura, self.transformacao)
+        }
+        uso["escrita"] = {
+            "workers": copia.streams,
+            "ocupacao": copia.ocupado / (copia.streams * decorrido),
+        }
+        resumo = ", ".join(
+            f"{nome} {dados['workers']} workers {dados['ocupacao']:.0%} ocupados" for nome, dados in uso.items()
+        )
+        self.log.info(f"[{self.tabela}] Pipeline concluído em {decorrido:.1f}s: {resumo}")
+        return uso
+
+    def _iniciar(self, alvo, nome, *args):
+        thread = threading.Thread(target=alvo, args=args, name=f"{self.tabela}-{nome}", daemon=True)
+        thread.start()
+        return thread
+
+    def _ler(self):
+        while True:
+            caminho = self._arquivos.get()
+            if caminho is _FIM:
+                return
+            carga = None
+            try:
+                with self.leitura.medir():
+                    file_id = iniciar_carga(
+                        self.engine, self.tabela, id_arquivo(caminho), caminho, checksum_arquivo(caminho)
+                    )
+                    carga = _Carga(caminho, file_id, None)
+                    self._cargas.append(carga)
+                    if self.contexto is not None:
+                        carga.contexto = self.contexto(caminho)
+                    mem = psutil.virtual_memory()
+                    self.log.info(
+                        f"[{self.tabela}] Carregando arquivo: {caminho} (memória disponível: "
+                        f"{mem.available / (1024 ** 2):.2f} MB, usada: {mem.percent}%)"
+                    )
+                    lotes = ler_parquet_em_lotes(caminho, self.tamanho_lote, self.colunas_leitura)
+                inicio = 0
+                while True:
+                    with self.leitura.medir():
+                        lote = next(lotes, None)
+                    if lote is None:
+                        break
+                    with carga._lock:
+                        carga.pendentes += 1
+                    # Bloqueia enquanto a fila estiver cheia (back-pressure da transformação)
+                    self._lotes.put((carga, lote, inicio))
+                    inicio += lote.num_rows
+            except Exception as e:
+                self.log.error(f"[{self.tabela}] Erro ao carregar arquivo {caminho}: {e}")
+                if carga is not None:
+                    carga.erro = str(e)
+            if carga is not None:
+                with carga._lock:
+                    carga.lido = True
+                self._finalizar(carga)
+
+    def _transformar(self, copia):
+        while True:
+            item = self._lotes.get()
+            if item is _FIM:
+                return
+            carga, lote, inicio = item
+            try:
+                with self.transformacao.medir():
+                    lote = self.transformar(lote, carga.contexto, carga.file_id, inicio)
+                # Bloqueia enquanto a fila da CopiaBinaria estiver cheia (back-pressure da escrita)
+                copia.enviar(lote, ao_gravar=lambda linhas, erro, carga=carga: self._gravado(carga, linhas, erro))
+            except Exception as e:
+                self.log.error(f"[{self.tabela}] Erro ao transformar lote de {carga.caminho}: {e}")
+                self._gravado(carga, 0, e)
+
+    def _gravado(self, carga, linhas, erro):
+        with carga._lock:
+            carga.pendentes -= 1
+            carga.linhas += linhas
+            if erro is not None:
+                carga.lotes_com_erro += 1
+        self._finalizar(carga)
+
+    def _finalizar(self, carga):
+        with carga._lock:
+            if carga.finalizada or not carga.lido or carga.pendentes > 0:
+                return
+            carga.finalizada = True
+        erro = carga.erro
+        if erro is None and carga.lotes_com_erro:
+            erro = f"{carga.lotes_com_erro} lotes com erro"
+        try:
+            finalizar_carga(self.engine, carga.file_id, carga.linhas, erro)
+        except Exception as e:
+            self.log.error(f"[{self.tabela}] Erro ao registrar a carga de {carga.caminho}: {e}")
+            return
+        if erro:
+            self.log.error(f"[{self.tabela}] Carga de {carga.caminho} registrada com erro: {erro}")
+        else:
+            self.log.info(f"[{self.tabela}] Carga de {carga.caminho} concluída: {carga.linhas} registros")
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+import struct
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+STATUS_EM_ANDAMENTO = "em_andamento"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+# Uma linha por (tabela destino, arquivo); a restrição UNIQUE é o índice das consultas de "já processado"
+DDL_LEDGER = """
+    CREATE TABLE IF NOT EXISTS load_ledger (
+        id BIGSERIAL PRIMARY KEY,
+        tabela TEXT NOT NULL,
+        arquivo TEXT NOT NULL,
+        caminho TEXT,
+        checksum TEXT,
+        linhas BIGINT,
+        status TEXT NOT NULL,
+        erro TEXT,
+        iniciado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+        concluido_em TIMESTAMPTZ,
+        UNIQUE (tabela, arquivo)
+    )
+"""
+
+_ledger_criado = False
+_tabelas_com_linhagem = set()
+
+
+def garantir_ledger(engine):
+    """
+    Cria a tabela load_ledger, se necessário (uma vez por processo).
+    """
+    global _ledger_criado
+    if _ledger_criado:
+        return
+    with engine.begin() as connection:
+        connection.execute(text(DDL_LEDGER))
+    _ledger_criado = True
+
+
+def id_arquivo(caminho):
+    """
+    Identificador do arquivo no ledger: '{pasta}_{arquivo}' (mesmo formato do id_log).
+    """
+    return f"{os.path.basename(os.path.dirname(caminho))}_{os.path.basename(caminho)}"
+
+
+def checksum_arquivo(caminho):
+    """
+    Checksum de um arquivo .parquet: sha256 do tamanho e do footer (metadados com
+    esquema, row groups e estatísticas). Muda quando o conteúdo muda e custa só a
+    leitura do footer, não do arquivo inteiro.
+    """
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, "rb") as f:
+        f.seek(max(tamanho - 8, 0))
+        final = f.read(8)
+        if len(final) < 8 or final[4:] != b"PAR1":
+            raise ValueError(f"Arquivo {caminho} não é um Parquet válido")
+        tamanho_footer = struct.unpack("<i", final[:4])[0]
+        f.seek(max(tamanho - 8 - tamanho_footer, 0))
+        footer = f.read(tamanho_footer)
+    return hashlib.sha256(str(tamanho).encode() + footer).hexdigest()
+
+
+def _colunas(connection, tabela):
+    return [
+        linha.column_name for linha in connection.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = :tabela
+            ORDER BY ordinal_position
+        """), {"tabela": tabela})
+    ]
+
+
+def verificar_linhagem(engine, tabela):
+    """
+    Confere se a tabela destino tem as colunas de linhagem (file_id, id do
+    load_ledger, e linha_arquivo). Colunas, índice em file_id e a view
+    {tabela}_id_log são criados pela migração alembic c4a9e2f17b30; aqui só
+    há leitura do catálogo, uma vez por processo e tabela.
+    """
+    if tabela in _tabelas_com_linhagem:
+        return
+    with engine.connect() as connection:
+        faltando = {"file_id", "linha_arquivo"} - set(_colunas(connection, tabela))
+    if faltando:
+        raise RuntimeError(
+            f"Tabela {tabela} sem as colunas de linhagem {sorted(faltando)}; execute 'alembic upgrade head'"
+        )
+    _tabelas_com_linhagem.add(tabela)
+
+
+def _migrar_id_log(connection, tabela):
+    """
+    Preenche o ledger de uma tabela carregada antes dele existir, a partir do id_log.
+    Faz a varredura com regex uma única vez; as próximas consultas usam só o ledger.
+    """
+    if "id_log" not in _colunas(connection, tabela):
+        return
+    resultado = connection.execute(text(f"""
+        INSERT INTO load_ledger (tabela, arquivo, linhas, status, concluido_em)
+        SELECT :tabela, arquivo, count(*), :status, now()
+        FROM (SELECT substring(id_log FROM '^(.*)_\\d+$') AS arquivo FROM {tabela}) AS t
+        WHERE arquivo IS NOT NULL
+        GROUP BY arquivo
+        ON CONFLICT (tabela, arquivo) DO NOTHING
+    """), {"tabela": tabela, "status": STATUS_CONCLUIDO})
+    logger.info(f"[{tabela}] Ledger preenchido a partir do id_log: {resultado.rowcount} arquivos")
+
+
+def arquivos_concluidos(engine, tabela):
+    """
+    Retorna {arquivo: checksum} dos arquivos já carregados por completo na tabela,
+    numa consulta indexada ao load_ledger.
+    """
+    garantir_ledger(engine)
+    verificar_linhagem(engine, tabela)
+    consulta = text("SELECT arquivo, checksum FROM load_ledger WHERE tabela = :tabela AND status = :status")
+    with engine.begin() as connection:
+        existe = connection.execute(
+            text("SELECT 1 FROM load_ledger WHERE tabela = :tabela LIMIT 1"), {"tabela": tabela}
+        ).first()
+        if existe is None:
+            _migrar_id_log(connection, tabela)
+        resultado = connection.execute(consulta, {"tabela": tabela, "status": STATUS_CONCLUIDO}).all()
+    return {linha.arquivo: linha.checksum for linha in resultado}
+
+
+def _checksum_mudou(arquivo, registrado, caminho):
+    """
+    Compara o checksum registrado no ledger com o do arquivo atual. Cargas
+    migradas do id_log não têm checksum e não são comparadas; um arquivo cujo
+    checksum não pode ser calculado é tratado como alterado (a carga registra o erro).
+    """
+    if registrado is None:
+        return False
+    try:
+        atual = checksum_arquivo(caminho)
+    except Exception:
+        return True
+    if atual != registrado:
+        logger.warning(f"Arquivo {arquivo} mudou desde a última carga (checksum diferente); será recarregado")
+        return True
+    return False
+
+
+def arquivo_pendente(concluidos, caminho):
+    """
+    Indica se o arquivo precisa ser carregado, dado o retorno de arquivos_concluidos:
+    ainda não concluído ou concluído com outro checksum (iniciar_carga remove as
+    linhas da carga anterior).
+    """
+    arquivo = id_arquivo(caminho)
+    return arquivo not in concluidos or _checksum_mudou(arquivo, concluidos[arquivo], caminho)
+
+
+def arquivo_concluido(engine, tabela, arquivo, caminho=None):
+    """
+    Verifica no ledger (consulta indexada) se o arquivo já foi carregado por completo.
+    Com caminho, a carga só vale se o checksum registrado for o do arquivo atual.
+    """
+    garantir_ledger(engine)
+    with engine.connect() as connection:
+        linha = connection.execute(
+            text("SELECT checksum FROM load_ledger WHERE tabela = :tabela AND arquivo = :arquivo AND status = :status"),
+            {"tabela": tabela, "arquivo": arquivo, "status": STATUS_CONCLUIDO}
+        ).first()
+    if linha is None:
+        return False
+    return caminho is None or not _checksum_mudou(arquivo, linha.checksum, caminho)
+
+
+def iniciar_carga(engine, tabela, arquivo, caminho, checksum):
+    """
+    Registra o início da carga de um arquivo e retorna o id da linha do ledger,
+    que é o file_id gravado nas linhas do arquivo.
+
+    Se uma tentativa anterior do mesmo arquivo não foi concluída, as linhas que
+    ela deixou na tabela são removidas na mesma transação, para a nova carga não
+    duplicar registros.
+    """
+    garantir_ledger(engine)
+    with engine.begin() as connection:
+        anterior = connection.execute(
+            text("SELECT id, status, linhas FROM load_ledger WHERE tabela = :tabela AND arquivo = :arquivo FOR UPDATE"),
+            {"tabela": tabela, "arquivo": arquivo}
+        ).first()
+        # Só há o que limpar se a tentativa anterior foi interrompida ou chegou a gravar linhas
+        if anterior is not None and (anterior.status == STATUS_EM_ANDAMENTO or anterior.linhas):
+            removidas = connection.execute(
+                text(f"DELETE FROM {tabela} WHERE file_id = :file_id"), {"file_id": anterior.id}
+            ).rowcount
+            logger.warning(f"[{tabela}] Removidas {removidas} linhas da carga incompleta de {arquivo}")
+        return connection.execute(text("""
+            INSERT INTO load_ledger (tabela, arquivo, caminho, checksum, status)
+            VALUES (:tabela, :arquivo, :caminho, :checksum, :status)
+            ON CONFLICT (tabela, arquivo) DO UPDATE
+            SET caminho = EXCLUDED.caminho, checksum = EXCLUDED.checksum, status = EXCLUDED.status,
+                linhas = NULL, erro = NULL, iniciado_em = now(), concluido_em = NULL
+            RETURNING id
+        """), {
+            "tabela": tabela, "arquivo": arquivo, "caminho": caminho,
+            "checksum": checksum, "status": STATUS_EM_ANDAMENTO
+        }).scalar()
+
+
+def finalizar_carga(engine, id_carga, linhas, erro=None):
+    """
+    Marca a carga como concluída (com o total de linhas gravadas) ou com erro.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("""
+            UPDATE load_ledger
+            SET linhas = :linhas, status = :status, erro = :erro, concluido_em = now()
+            WHERE id = :id
+        """), {
+            "id": id_carga, "linhas": linhas, "erro": erro,
+            "status": STATUS_ERRO if erro else STATUS_CONCLUIDO
+        })
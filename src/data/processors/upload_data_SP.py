@@ -1,7 +1,6 @@
 import os
 import logging
 import pandas as pd
-import io
 import psutil
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
@@ -11,6 +10,9 @@ from utils import (
     db_utils,
     log_utils
 )
+from conversao_arrow import COLUNAS_LINHAGEM, adicionar_linhagem
+from pipeline_ingestao import PipelineIngestao
+from registro_carga import arquivo_pendente, arquivos_concluidos
 
 # Configuração do ambiente
 load_dotenv()
@@ -42,7 +44,7 @@ ESTADOS_VALIDOS = {
     "35": "SP", "28": "SE", "17": "TO"
 }
 
-# Ordem das colunas conforme a tabela (incluindo 'id_log')
+# Ordem das colunas conforme a tabela (incluindo a linhagem 'file_id' e 'linha_arquivo')
 COLUNAS_TABELA = [
     "sp_uf", "sp_procrea", "sp_gestor",
     "sp_aa", "sp_mm", "sp_cnes", "sp_naih", "sp_dtinter",
@@ -51,7 +53,7 @@ COLUNAS_TABELA = [
     "sp_m_hosp", "sp_m_pac", "sp_des_hos", "sp_des_pac", "sp_complex",
     "sp_financ", "sp_co_faec", "sp_pf_cbo", "sp_pf_doc", "sp_pj_doc",
     "in_tp_val", "sequencia", "remessa", "serv_cla", "sp_cidpri",
-    "sp_cidsec", "sp_qt_proc", "sp_u_aih", "id_log"
+    "sp_cidsec", "sp_qt_proc", "sp_u_aih", "file_id", "linha_arquivo"
 ]
 
 def monitorar_memoria():
@@ -63,22 +65,16 @@ def monitorar_memoria():
 
 def verificar_ultimo_arquivo_procesado():
     """
-    Verifica no banco de dados qual foi o último arquivo e registro processado com base em 'id_log'.
-    Retorna uma lista de arquivos processados.
+    Retorna {arquivo: checksum} dos arquivos já carregados por completo,
+    consultando o load_ledger (consulta indexada por tabela, sem varrer a tabela destino).
     """
     try:
-        with engine.connect() as connection:
-            query = f"""
-            SELECT DISTINCT substring(id_log FROM '^(.*)_\\d+$') AS arquivo_processado
-            FROM {TABELA}
-            """
-            resultado = connection.execute(query).fetchall()
-            arquivos_processados = [row[0] for row in resultado]
-            logger.info(f"Arquivos já processados: {len(arquivos_processados)} encontrados.")
-            return set(arquivos_processados)
+        arquivos_processados = arquivos_concluidos(engine, TABELA)
+        logger.info(f"Arquivos já processados: {len(arquivos_processados)} encontrados.")
+        return arquivos_processados
     except Exception as e:
         logger.error(f"Erro ao verificar arquivos processados: {e}")
-        return set()
+        return {}
 
 def obter_pastas_de_arquivos():
     """
@@ -115,15 +111,15 @@ def normalizar_colunas(df):
     """
     Normaliza os nomes das colunas para corresponder ao esquema do banco e
     converte os códigos de estado numéricos para suas abreviações.
-    Adiciona colunas ausentes como valores nulos, exceto 'id_log'.
+    Adiciona colunas ausentes como valores nulos, exceto as de linhagem.
     """
-    colunas_corretas = COLUNAS_TABELA.copy()
-    colunas_corretas.remove('id_log')  # Remove 'id_log' da lista de colunas a serem verificadas
+    # Remove a linhagem da lista de colunas a serem verificadas
+    colunas_corretas = [col for col in COLUNAS_TABELA if col not in COLUNAS_LINHAGEM]
     
     colunas_mapeadas = {col.lower(): col for col in colunas_corretas}
     df.columns = [colunas_mapeadas.get(col.lower(), col) for col in df.columns]
 
-    # Adicionar colunas ausentes, exceto 'id_log'
+    # Adicionar colunas ausentes, exceto as de linhagem
     for coluna in colunas_corretas:
         if coluna not in df.columns:
             logger.warning(f"Adicionando coluna ausente: {coluna}")
@@ -157,65 +153,44 @@ def ajustar_ordem_colunas(df):
             df[coluna] = None
     return df[colunas_ordenadas]
 
-def carregar_dados_em_lotes(pastas_de_arquivos, tamanho_lote=10000):
+def transformar_lote(lote, contexto, file_id, inicio):
     """
-    Carrega os arquivos .parquet em lotes pequenos e gera a coluna id_log.
+    Prepara um lote lido (tabela Arrow) para inserção: normaliza as colunas, gera a
+    linhagem (file_id, id da carga no load_ledger, e linha_arquivo) e ajusta a ordem.
+    """
+    # Linhagem antes da normalização: linhas com UF inválida descartadas por
+    # normalizar_colunas não deslocam o linha_arquivo das seguintes
+    df = normalizar_colunas(adicionar_linhagem(lote, file_id, inicio).to_pandas())
+    return ajustar_ordem_colunas(df)
+
+def listar_arquivos(pastas_de_arquivos):
+    """
+    Lista os arquivos .parquet ainda não processados ou alterados desde a última
+    carga (consulta ao load_ledger, comparando o checksum).
     """
     arquivos_processados = verificar_ultimo_arquivo_procesado()
-    
+    arquivos = []
     for pasta in pastas_de_arquivos:
-        arquivos = obter_arquivos_parquet(pasta)
-        for arquivo in arquivos:
-            nome_pasta = os.path.basename(pasta)
-            nome_arquivo = os.path.basename(arquivo)
-            id_arquivo = f"{nome_pasta}_{nome_arquivo}"
-            
-            if id_arquivo in arquivos_processados:
+        for arquivo in obter_arquivos_parquet(pasta):
+            id_arquivo = f"{os.path.basename(pasta)}_{os.path.basename(arquivo)}"
+            if not arquivo_pendente(arquivos_processados, arquivo):
                 logger.info(f"PULANDO arquivo já processado: {id_arquivo}")
                 continue
-            
-            try:
-                logger.info(f"Carregando arquivo: {arquivo}")
-                monitorar_memoria()
-                df = pd.read_parquet(arquivo)
-                df = normalizar_colunas(df)
-                
-                # Adicionar a coluna 'id_log' com base no nome da pasta e arquivo e índice
-                df['id_log'] = [f"{id_arquivo}_{i}" for i in range(len(df))]
-                
-                for inicio in range(0, len(df), tamanho_lote):
-                    yield df.iloc[inicio:inicio + tamanho_lote]
-            except Exception as e:
-                logger.error(f"Erro ao carregar arquivo {arquivo}: {e}")
-
-def inserir_dados_em_lotes(df_lote):
-    """
-    Insere os dados no banco por lotes.
-    """
-    try:
-        csv_buffer = io.StringIO()
-        df_lote.to_csv(csv_buffer, index=False, header=False)
-        csv_buffer.seek(0)
-        with engine.connect() as connection:
-            with connection.connection.cursor() as cursor:
-                cursor.copy_expert(f"COPY {TABELA} ({', '.join(COLUNAS_TABELA)}) FROM STDIN WITH CSV", csv_buffer)
-            connection.connection.commit()
-        logger.info(f"Lote de {len(df_lote)} registros inserido com sucesso.")
-    except Exception as e:
-        logger.critical(f"Erro ao inserir dados: {e}", exc_info=True)
+            arquivos.append(arquivo)
+    return arquivos
 
 def processar_dados():
     """
-    Fluxo principal do script.
+    Fluxo principal do script: carrega os arquivos pelo PipelineIngestao
+    (leitura, transformação e COPY em estágios paralelos).
     """
     try:
         pastas_de_arquivos = obter_pastas_de_arquivos()
         if not pastas_de_arquivos:
             logger.warning("Nenhuma pasta de arquivos .parquet encontrada para processamento.")
             return
-        for df_lote in carregar_dados_em_lotes(pastas_de_arquivos):
-            df_lote = ajustar_ordem_colunas(df_lote)
-            inserir_dados_em_lotes(df_lote)
+        pipeline = PipelineIngestao(engine, TABELA, COLUNAS_TABELA, transformar_lote, log=logger)
+        pipeline.executar(listar_arquivos(pastas_de_arquivos))
         logger.info("Processo concluído.")
     except Exception as e:
         logger.critical(f"Erro crítico no processamento: {e}", exc_info=True)
@@ -1,8 +1,7 @@
 import os
 import re
 import logging
-import pandas as pd
-import io
+from functools import partial
 import psutil
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
@@ -13,6 +12,16 @@ from utils import (
     configurar_logging,
     get_db_engine
 )
+from ingestao_paralela import UPLOAD_WORKERS, executar_em_paralelo, slot_copy
+from pipeline_ingestao import PipelineIngestao
+from registro_carga import arquivo_concluido, arquivo_pendente, arquivos_concluidos
+from conversao_arrow import (
+    COLUNAS_LINHAGEM,
+    adicionar_linhagem,
+    coluna_constante,
+    converter_tabela,
+    normalizar_tabela
+)
 
 # Configuração do ambiente
 load_dotenv()
@@ -91,7 +100,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -176,7 +186,8 @@ GRUPOS_INFO = {
             "ap_vl_ap",
             "co_cidprim",
             "co_cidsec",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -239,7 +250,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -292,7 +304,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -350,7 +363,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -422,7 +436,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -489,7 +504,8 @@ GRUPOS_INFO = {
             "ap_ufnacio",
             "ap_unisol",
             "ap_vl_ap",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -570,7 +586,8 @@ GRUPOS_INFO = {
             "aq_totmau",
             "aq_totmpl",
             "aq_trante",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -651,7 +668,8 @@ GRUPOS_INFO = {
             "ar_numc3",
             "ar_smrd",
             "ar_trante",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -723,7 +741,8 @@ GRUPOS_INFO = {
             "atd_sitini",
             "atd_sittra",
             "atd_tru",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "uf"
         ]
     },
@@ -747,7 +766,8 @@ GRUPOS_INFO = {
             "dtnasc",
             "etnia",
             "gestao",
-            "id_log",
+            "file_id",
+            "linha_arquivo",
             "idadepac",
             "mn_ind",
             "mndif",
@@ -773,7 +793,8 @@ GRUPOS_INFO = {
     "PA": {
         "tabela": "sia_producao_ambulatorial",
         "colunas": {
-            "id_log": "VARCHAR(255)",
+            "file_id": "BIGINT",
+            "linha_arquivo": "INTEGER",
             "idademax": "TEXT",
             "idademin": "TEXT",
             "nu_pa_tot": "TEXT",
@@ -919,7 +940,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "TEXT",
         "ap_vl_ap": "CHAR(20)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_acompanhamento_pos_cirurgia_bariatrica": {
@@ -1001,7 +1023,8 @@ tipo_coluna_map = {
         "ap_vl_ap": "CHAR(20)",
         "co_cidprim": "TEXT",
         "co_cidsec": "TEXT",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_confeccao_de_fistula": {
@@ -1061,7 +1084,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "CHAR(7)",
         "ap_vl_ap": "CHAR(20)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_laudos_diversos": {
@@ -1111,7 +1135,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "TEXT",
         "ap_vl_ap": "CHAR(20)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_medicamentos": {
@@ -1166,7 +1191,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "TEXT",
         "ap_vl_ap": "CHAR(12)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_acompanhamento_multiprofissional": {
@@ -1235,7 +1261,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "TEXT",
         "ap_vl_ap": "CHAR(20)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_nefrologia": {
@@ -1299,7 +1326,8 @@ tipo_coluna_map = {
         "ap_ufnacio": "TEXT",
         "ap_unisol": "CHAR(7)",
         "ap_vl_ap": "CHAR(20)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_quimioterapia": {
@@ -1377,7 +1405,8 @@ tipo_coluna_map = {
         "aq_totmau": "TEXT",
         "aq_totmpl": "TEXT",
         "aq_trante": "TEXT",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_radioterapia": {
@@ -1455,7 +1484,8 @@ tipo_coluna_map = {
         "ar_numc3": "CHAR(3)",
         "ar_smrd": "CHAR(3)",
         "ar_trante": "CHAR(1)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_apac_tratamento_dialitico": {
@@ -1524,7 +1554,8 @@ tipo_coluna_map = {
         "atd_sitini": "CHAR(1)",
         "atd_sittra": "CHAR(1)",
         "atd_tru": "TEXT",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "uf": "CHAR(2)"
     },
     "sia_boletim_producao_ambulatorial_individualizado": {
@@ -1545,7 +1576,8 @@ tipo_coluna_map = {
         "dtnasc": "CHAR(8)",
         "etnia": "TEXT",
         "gestao": "CHAR(6)",
-        "id_log": "VARCHAR(255)",
+        "file_id": "BIGINT",
+        "linha_arquivo": "INTEGER",
         "idadepac": "CHAR(2)",
         "mn_ind": "CHAR(1)",
         "mndif": "BOOLEAN",
@@ -1579,22 +1611,16 @@ def monitorar_memoria():
 
 def verificar_ultimo_arquivo_processado(tabela):
     """
-    Verifica no banco de dados qual foi o último arquivo e registro processado com base em 'id_log'.
-    Retorna um conjunto de arquivos processados para a tabela específica.
+    Retorna {arquivo: checksum} dos arquivos já carregados por completo na tabela,
+    consultando o load_ledger (consulta indexada por tabela, sem varrer a tabela destino).
     """
     try:
-        with engine.connect() as connection:
-            query = text(f"""
-                SELECT DISTINCT substring(id_log FROM '^(.*)_\\d+$') AS arquivo_processado
-                FROM {tabela}
-            """)
-            resultado = connection.execute(query).mappings().all()
-            arquivos_processados = [row['arquivo_processado'] for row in resultado]
-            logger.info(f"[{tabela}] Arquivos já processados: {len(arquivos_processados)} encontrados.")
-            return set(arquivos_processados)
+        arquivos_processados = arquivos_concluidos(engine, tabela)
+        logger.info(f"[{tabela}] Arquivos já processados: {len(arquivos_processados)} encontrados.")
+        return arquivos_processados
     except Exception as e:
         logger.error(f"[{tabela}] Erro ao verificar arquivos processados: {e}")
-        return set()
+        return {}
 
 def obter_pastas_de_arquivos(grupo):
     """
@@ -1631,97 +1657,6 @@ def obter_arquivos_parquet(pasta_de_arquivos):
     logger.info(f"Arquivos .parquet encontrados na pasta {pasta_de_arquivos}: {len(arquivos_parquet)}")
     return arquivos_parquet
 
-def converter_tipos(df, mapeamento_tipos):
-    """
-    Converte os tipos de dados das colunas do DataFrame com base no mapeamento fornecido.
-    
-    Args:
-        df (pd.DataFrame): DataFrame a ser convertido.
-        mapeamento_tipos (dict): Dicionário mapeando colunas para tipos de dados.
-    
-    Returns:
-        pd.DataFrame: DataFrame com tipos de dados convertidos.
-    
-    Raises:
-        TypeError: Se ocorrer erro durante a conversão.
-    """
-    for col, tipo in mapeamento_tipos.items():
-        if col not in df.columns:
-            continue  # Ignorar colunas ausentes já verificadas
-        try:
-            if tipo.startswith("VARCHAR") or tipo.startswith("CHAR"):
-                # Remover espaços em branco
-                df[col] = df[col].astype(str).str.strip()
-                df[col] = df[col].astype(str)
-            elif tipo in ["INTEGER", "BIGINT", "SMALLINT"]:
-                if tipo == "SMALLINT":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int16')
-                elif tipo == "INTEGER":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int32')
-                elif tipo == "BIGINT":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            elif tipo.startswith("NUMERIC"):
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            elif tipo == "DATE":
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
-            elif tipo == "BOOLEAN":
-                # Garantir que valores válidos sejam mapeados corretamente
-                df[col] = df[col].map({True: True, False: False, 'True': True, 'False': False, '1': True, '0': False})
-            elif tipo == "TEXT":
-                df[col] = df[col].astype(str).str.strip()
-            else:
-                logger.warning(f"Tipo de dado não mapeado para a coluna '{col}': '{tipo}'. Mantendo o tipo original.")
-        except Exception as e:
-            raise TypeError(f"Erro ao converter coluna '{col}' para o tipo '{tipo}': {e}")
-    return df
-
-def normalizar_colunas(df, colunas_esperadas, mapeamento_tipos):
-    """
-    Normaliza os nomes das colunas para corresponder ao esquema do banco,
-    remove espaços em branco das colunas de texto e adiciona colunas ausentes como valores nulos,
-    excluindo 'uf' e 'id_log', que serão adicionadas posteriormente.
-    """
-    # Excluir 'uf' e 'id_log' das colunas esperadas para normalização
-    colunas_para_normalizar = [col for col in colunas_esperadas if col not in ('uf', 'id_log')]
-
-    # Remover as colunas 'uf' e 'id_log' do DataFrame, se existirem
-    df = df.drop(columns=['id', 'uf', 'id_log'], errors='ignore')
-
-    # Convertendo colunas esperadas para minúsculas
-    colunas_corretas = [col.lower() for col in colunas_para_normalizar]
-    colunas_mapeadas = {col.lower(): col.lower() for col in colunas_corretas}
-
-    # Convertendo as colunas do DataFrame para minúsculas
-    df.columns = [colunas_mapeadas.get(col.lower(), col.lower()) for col in df.columns]
-
-    # Remover espaços em branco para colunas de texto
-    for col in df.columns:
-        tipo = mapeamento_tipos.get(col, '').upper()
-        if tipo.startswith("VARCHAR") or tipo.startswith("CHAR") or tipo == "TEXT":
-            df[col] = df[col].astype(str).str.strip()
-
-    # Adicionar colunas ausentes
-    for coluna in colunas_corretas:
-        if coluna not in df.columns:
-            logger.warning(f"Adicionando coluna ausente: {coluna}")
-            df[coluna] = None  # Ou algum valor padrão, se aplicável
-
-    return df
-
-def ajustar_ordem_colunas(df, colunas_esperadas):
-    """
-    Ajusta a ordem das colunas do DataFrame para o esquema do banco, ignorando 'id_log'.
-    
-    Args:
-        df (pd.DataFrame): DataFrame a ser ajustado.
-        colunas_esperadas (list): Lista de colunas esperadas conforme a tabela.
-    
-    Returns:
-        pd.DataFrame: DataFrame com colunas na ordem correta.
-    """
-    colunas_ordenadas = [col.lower() for col in colunas_esperadas]
-    return df[colunas_ordenadas]
-
 def extrair_uf(nome, grupo):
     """
     Extrai a UF a partir do nome do arquivo ou pasta.
@@ -1733,121 +1668,123 @@ def extrair_uf(nome, grupo):
     else:
         return None
 
-def carregar_dados_em_lotes(grupo, pastas_de_arquivos, tamanho_lote=10000):
+def colunas_de_leitura(grupo):
     """
-    Carrega os arquivos .parquet em lotes pequenos, adiciona as colunas 'uf' e 'id_log',
-    e prepara os dados para inserção no banco de dados.
+    Colunas lidas dos arquivos do grupo: as da tabela, exceto 'uf' e a linhagem,
+    que são geradas pelo loader.
+    """
+    return [col for col in GRUPOS_INFO[grupo]["colunas"] if col not in ('uf',) + COLUNAS_LINHAGEM]
+
+def uf_do_arquivo(grupo, arquivo):
+    """
+    Extrai a UF do nome do arquivo ou, se não for possível, do nome da pasta.
+    Levanta ValueError se nenhum dos dois trouxer a UF.
+    """
+    uf = extrair_uf(os.path.basename(arquivo), grupo) or extrair_uf(os.path.basename(os.path.dirname(arquivo)), grupo)
+    if not uf:
+        raise ValueError(f"Não foi possível extrair UF do arquivo {arquivo}")
+    return uf.upper()
+
+def transformar_lote(grupo, lote, uf, file_id, inicio):
+    """
+    Prepara um lote lido para inserção: normaliza e converte as colunas (em Arrow)
+    e adiciona 'uf' e a linhagem (file_id, linha_arquivo).
     """
     tabela = GRUPOS_INFO[grupo]["tabela"]
-    arquivos_processados = verificar_ultimo_arquivo_processado(tabela)
-    colunas_esperadas = GRUPOS_INFO[grupo]["colunas"]
     mapeamento_tipos = tipo_coluna_map.get(tabela, {})
+    lote = normalizar_tabela(lote, colunas_de_leitura(grupo), remover=('id', 'uf', 'id_log') + COLUNAS_LINHAGEM)
+    lote = converter_tabela(lote, mapeamento_tipos)
 
-    # Excluir 'uf' e 'id_log' das colunas esperadas para evitar duplicação
-    colunas_para_insercao = [col for col in colunas_esperadas if col not in ('uf', 'id_log')]
+    # Adicionar a coluna 'uf' e a linhagem (id do arquivo no ledger e índice no arquivo)
+    lote = lote.append_column('uf', coluna_constante(uf, lote.num_rows))
+    return adicionar_linhagem(lote, file_id, inicio=inicio)
 
-    for pasta in pastas_de_arquivos:
-        arquivos = obter_arquivos_parquet(pasta)
-        nome_pasta = os.path.basename(pasta)
-        uf_pasta = extrair_uf(nome_pasta, grupo)
+def executar_pipeline(grupo, tarefas, **opcoes):
+    """
+    Carrega as tarefas (grupo, pasta, arquivo) do grupo pelo PipelineIngestao
+    (leitura, transformação e COPY em estágios paralelos), com a configuração do grupo.
+    """
+    info = GRUPOS_INFO[grupo]
+    pipeline = PipelineIngestao(
+        engine, info["tabela"], info["colunas"], partial(transformar_lote, grupo),
+        colunas_leitura=colunas_de_leitura(grupo), contexto=partial(uf_do_arquivo, grupo),
+        log=logger, **opcoes
+    )
+    return pipeline.executar(arquivo for _, _, arquivo in tarefas)
 
-        for arquivo in arquivos:
-            nome_arquivo = os.path.basename(arquivo)
-            id_arquivo = f"{nome_pasta}_{nome_arquivo}"
+def processar_arquivo(grupo, pasta, arquivo, tamanho_lote=10000):
+    """
+    Tarefa de um worker da ingestão paralela: carrega um arquivo pelo pipeline,
+    cada lote ocupando um dos streams COPY permitidos para a tabela.
+    """
+    tabela = GRUPOS_INFO[grupo]["tabela"]
+    id_arquivo = f"{os.path.basename(pasta)}_{os.path.basename(arquivo)}"
+    if arquivo_concluido(engine, tabela, id_arquivo, arquivo):
+        logger.info(f"[{grupo}] PULANDO arquivo já processado: {id_arquivo}")
+        return
+    # Um arquivo por worker: um leitor, um transformador e uma conexão de COPY;
+    # o slot_copy limita os COPY simultâneos na tabela
+    executar_pipeline(
+        grupo, [(grupo, pasta, arquivo)], leitores=1, transformadores=1, escritores=1,
+        slot=slot_copy, tamanho_lote=tamanho_lote
+    )
 
-            if id_arquivo in arquivos_processados:
-                logger.info(f"[{grupo}] PULANDO arquivo já processado: {id_arquivo}")
+def listar_tarefas(grupo, pastas_de_arquivos):
+    """
+    Lista (grupo, pasta, arquivo) dos arquivos do grupo ainda não processados
+    ou alterados desde a última carga (checksum diferente no load_ledger).
+    """
+    arquivos_processados = verificar_ultimo_arquivo_processado(GRUPOS_INFO[grupo]["tabela"])
+    tarefas = []
+    for pasta in pastas_de_arquivos:
+        nome_pasta = os.path.basename(pasta)
+        for arquivo in obter_arquivos_parquet(pasta):
+            if not arquivo_pendente(arquivos_processados, arquivo):
+                logger.info(f"[{grupo}] PULANDO arquivo já processado: {nome_pasta}_{os.path.basename(arquivo)}")
                 continue
+            tarefas.append((grupo, pasta, arquivo))
+    return tarefas
 
-            try:
-                logger.info(f"[{grupo}] Carregando arquivo: {arquivo}")
-                monitorar_memoria()
-                df = pd.read_parquet(arquivo)
-                df = normalizar_colunas(df, colunas_esperadas, mapeamento_tipos)
-                df = converter_tipos(df, mapeamento_tipos)
-
-                # Extrair UF do nome do arquivo, se não foi possível pelo nome da pasta
-                uf = extrair_uf(nome_arquivo, grupo) or uf_pasta
-                if not uf:
-                    logger.warning(f"[{grupo}] Não foi possível extrair UF do arquivo {arquivo}")
-                    continue
-
-                # Adicionar a coluna 'uf' ao DataFrame
-                df['uf'] = uf.upper()
-
-                # Adicionar a coluna 'id_log' com base no nome da pasta, arquivo e índice
-                df['id_log'] = [f"{id_arquivo}_{i}" for i in range(len(df))]
-
-                # Ajustar a ordem das colunas para inserção
-                colunas_ajustadas = colunas_para_insercao + ['uf', 'id_log']
-                df = df.reindex(columns=colunas_ajustadas)
-
-                for inicio in range(0, len(df), tamanho_lote):
-                    yield df.iloc[inicio:inicio + tamanho_lote]
-            except Exception as e:
-                logger.error(f"[{grupo}] Erro ao carregar arquivo {arquivo}: {e}")
+def obter_engine():
+    """
+    Engine do processo atual (cada worker da ingestão paralela tem o seu).
+    """
+    return engine
                             
-def inserir_dados_em_lotes(tabela, df_lote, colunas_ajustadas):
+def processar_dados_paralelo(workers=None):
     """
-    Insere os dados no banco por lotes.
+    Distribui os arquivos de todos os grupos entre processos worker (UPLOAD_WORKERS).
     """
     try:
-        # Reindexar o DataFrame para garantir que contém apenas as colunas esperadas, na ordem correta
-        df_lote = df_lote.reindex(columns=colunas_ajustadas)
-
-        # Log de depuração: imprimir colunas e dimensões
-        #logger.debug(f"[{tabela}] Colunas do DataFrame ({len(df_lote.columns)}): {df_lote.columns.tolist()}")
-        #logger.debug(f"[{tabela}] Colunas para inserção ({len(colunas_ajustadas)}): {colunas_ajustadas}")
-        logger.debug(f"[{tabela}] Número de registros no lote: {len(df_lote)}")
-
-        # Verificar se o número de colunas corresponde
-        if len(df_lote.columns) != len(colunas_ajustadas):
-            logger.error(f"[{tabela}] Número de colunas no DataFrame ({len(df_lote.columns)}) "
-                         f"não corresponde ao esperado ({len(colunas_ajustadas)})")
-            colunas_faltantes = set(colunas_ajustadas) - set(df_lote.columns)
-            colunas_extras = set(df_lote.columns) - set(colunas_ajustadas)
-            if colunas_faltantes:
-                logger.error(f"[{tabela}] Colunas faltantes no DataFrame: {colunas_faltantes}")
-            if colunas_extras:
-                logger.error(f"[{tabela}] Colunas extras no DataFrame: {colunas_extras}")
-            return
-
-        # Opcional: imprimir uma amostra dos dados
-        #logger.debug(f"[{tabela}] Amostra dos dados:\n{df_lote.head(1).to_string(index=False)}")
-
-        csv_buffer = io.StringIO()
-        df_lote.to_csv(csv_buffer, index=False, header=False)
-        csv_buffer.seek(0)
-        with engine.connect() as connection:
-            with connection.connection.cursor() as cursor:
-                cursor.copy_expert(
-                    f"COPY {tabela} ({', '.join([col.lower() for col in colunas_ajustadas])}) FROM STDIN WITH CSV",
-                    csv_buffer
-                )
-            connection.connection.commit()
-        logger.info(f"[{tabela}] Lote de {len(df_lote)} registros inserido com sucesso.")
+        tarefas = []
+        for grupo in GRUPOS_INFO:
+            pastas_de_arquivos = obter_pastas_de_arquivos(grupo)
+            if not pastas_de_arquivos:
+                logger.warning(f"[{grupo}] Nenhuma pasta de arquivos .parquet encontrada para processamento.")
+                continue
+            tarefas.extend(listar_tarefas(grupo, pastas_de_arquivos))
+        tabelas = [GRUPOS_INFO[grupo]["tabela"] for grupo, _, _ in tarefas]
+        executar_em_paralelo(tarefas, processar_arquivo, tabelas, obter_engine, 'upload_sia', workers)
+        logger.info("Processo concluído.")
     except Exception as e:
-        logger.critical(f"[{tabela}] Erro ao inserir dados: {e}", exc_info=True)
+        logger.critical(f"Erro crítico no processamento: {e}", exc_info=True)
 
 def processar_dados():
+    if UPLOAD_WORKERS > 0:
+        return processar_dados_paralelo()
     try:
         for grupo, info in GRUPOS_INFO.items():
             tabela = info["tabela"]
-            colunas_esperadas = info["colunas"]
             logger.info(f"[{grupo}] Iniciando processamento para a tabela {tabela}")
             
-            # Log antes de verificar arquivos processados
-            logger.info(f"[{tabela}] Verificando arquivos já processados...")
-            arquivos_processados = verificar_ultimo_arquivo_processado(tabela)
-            logger.info(f"[{tabela}] Total de arquivos já processados: {len(arquivos_processados)}")
-            
             pastas_de_arquivos = obter_pastas_de_arquivos(grupo)
             if not pastas_de_arquivos:
                 logger.warning(f"[{grupo}] Nenhuma pasta de arquivos .parquet encontrada para processamento.")
                 continue
-            logger.info(f"[{grupo}] Iniciando processamento das pastas de arquivos...")
-            for df_lote in carregar_dados_em_lotes(grupo, pastas_de_arquivos):
-                inserir_dados_em_lotes(tabela, df_lote, colunas_esperadas)
+            # Arquivos já processados são descartados com uma consulta ao load_ledger
+            tarefas = listar_tarefas(grupo, pastas_de_arquivos)
+            logger.info(f"[{grupo}] Iniciando processamento de {len(tarefas)} arquivos...")
+            executar_pipeline(grupo, tarefas)
         logger.info("Processo concluído.")
     except Exception as e:
         logger.critical(f"Erro crítico no processamento: {e}", exc_info=True)
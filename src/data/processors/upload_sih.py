@@ -1,11 +1,19 @@
 import os
 import logging
-import pandas as pd
-import io
+from functools import partial
 import psutil
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
+from ingestao_paralela import UPLOAD_WORKERS, executar_em_paralelo, slot_copy
+from pipeline_ingestao import PipelineIngestao
+from registro_carga import arquivo_concluido, arquivo_pendente, arquivos_concluidos
+from conversao_arrow import (
+    COLUNAS_LINHAGEM,
+    adicionar_linhagem,
+    converter_tabela,
+    normalizar_tabela
+)
 
 # Configuração do ambiente
 load_dotenv()
@@ -14,7 +22,8 @@ load_dotenv()
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
-logger = logging.getLogger(__name__)
+# Nome fixo para que os workers da ingestão paralela (spawn) usem o mesmo logger
+logger = logging.getLogger('upload_sih')
 logger.setLevel(logging.DEBUG)
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
@@ -46,7 +55,7 @@ GRUPOS_INFO = {
             "VAL_ACOMP", "VAL_ORTP", "VAL_SANGUE", "ETNIA", "REMESSA", "AUD_JUST", "SIS_JUST",
             "MARCA_UCI", "DIAGSEC1", "DIAGSEC2", "DIAGSEC3", "DIAGSEC4", "DIAGSEC5", "DIAGSEC6", "DIAGSEC7", 
             "DIAGSEC8", "DIAGSEC9", "TPDISEC1", "TPDISEC2", "TPDISEC3", "TPDISEC4", "TPDISEC5", "TPDISEC6", 
-            "TPDISEC7", "TPDISEC8", "TPDISEC9", "id_log", "UF_ZI", "ESPEC", "CGC_HOSP", "N_AIH", "IDENT", 
+            "TPDISEC7", "TPDISEC8", "TPDISEC9", "file_id", "linha_arquivo", "UF_ZI", "ESPEC", "CGC_HOSP", "N_AIH", "IDENT", 
             "CEP", "MUNIC_RES", "SEXO", "MARCA_UTI", "PROC_SOLIC", "PROC_REA", "DIAG_PRINC", "DIAG_SECUN", 
             "COBRANCA", "NATUREZA", "NAT_JUR", "GESTAO", "RUBRICA", "IND_VDRL", "MUNIC_MOV", "NUM_PROC", 
             "CAR_INT", "CPF_AUT", "INSTRU", "CID_NOTIF", "CONTRACEP1", "CONTRACEP2", "GESTRISCO", "INSC_PN",
@@ -68,7 +77,7 @@ GRUPOS_INFO = {
             "idade", "ident", "ind_vdrl", "infehosp", "dt_saida", "instru", 
             "SEQUENCIA", "mes_cmpt", "morte", "munic_mov", "munic_res", 
             "ano_cmpt", "nasc", "marca_uti", "REMESSA", 
-            "id_log", "st_situac", "st_bloq", "st_mot_blo",
+            "file_id", "linha_arquivo", "st_situac", "st_bloq", "st_mot_blo",
             "car_int", "cbor", "cep", "cgc_hosp", "cid_asso", 
             "cid_morte", "cid_notif", "cnaer", "cnpj_mant", 
             "cobranca", "complex", "contracep1", "contracep2", 
@@ -84,7 +93,7 @@ GRUPOS_INFO = {
          "tabela": "sih_aih_rejeitada_erro",
          "colunas": [
              "SEQUENCIA", "ANO", "MES", "DT_INTER", 
-             "DT_SAIDA", "UF_RES", "CO_ERRO", "id_log", 
+             "DT_SAIDA", "UF_RES", "CO_ERRO", "file_id", "linha_arquivo", 
              "MUN_MOV", "UF_ZI", "REMESSA", "CNES", "AIH", "MUN_RES"
          ]
     },
@@ -98,7 +107,7 @@ GRUPOS_INFO = {
              "sp_m_hosp", "sp_m_pac", "sp_des_hos", "sp_des_pac", "sp_complex",
              "sp_financ", "sp_co_faec", "sp_pf_cbo", "sp_pf_doc", "sp_pj_doc",
              "in_tp_val", "sequencia", "remessa", "serv_cla", "sp_cidpri",
-             "sp_cidsec", "sp_qt_proc", "sp_u_aih", "id_log"
+             "sp_cidsec", "sp_qt_proc", "sp_u_aih", "file_id", "linha_arquivo"
          ]
      }
 }
@@ -189,7 +198,8 @@ tipo_coluna_map = {
       'nasc':  "DATE", 
       'marca_uti':  "SMALLINT", 
       'remessa':  "VARCHAR(20)",
-      'id_log': "VARCHAR(255)", 
+      'file_id': "BIGINT", 
+      'linha_arquivo': "INTEGER", 
       'st_situac':  "SMALLINT", 
       'st_bloq':  "SMALLINT", 
       'st_mot_blo':  "VARCHAR(2)", 
@@ -246,22 +256,16 @@ def monitorar_memoria():
 
 def verificar_ultimo_arquivo_processado(tabela):
     """
-    Verifica no banco de dados qual foi o último arquivo e registro processado com base em 'id_log'.
-    Retorna um conjunto de arquivos processados para a tabela específica.
+    Retorna {arquivo: checksum} dos arquivos já carregados por completo na tabela,
+    consultando o load_ledger (consulta indexada por tabela, sem varrer a tabela destino).
     """
     try:
-        with engine.connect() as connection:
-            query = text(f"""
-                SELECT DISTINCT substring(id_log FROM '^(.*)_\\d+$') AS arquivo_processado
-                FROM {tabela}
-            """)
-            resultado = connection.execute(query).fetchall()
-            arquivos_processados = [row['arquivo_processado'] for row in resultado]
-            logger.info(f"[{tabela}] Arquivos já processados: {len(arquivos_processados)} encontrados.")
-            return set(arquivos_processados)
+        arquivos_processados = arquivos_concluidos(engine, tabela)
+        logger.info(f"[{tabela}] Arquivos já processados: {len(arquivos_processados)} encontrados.")
+        return arquivos_processados
     except Exception as e:
         logger.error(f"[{tabela}] Erro ao verificar arquivos processados: {e}")
-        return set()
+        return {}
 
 def obter_pastas_de_arquivos(grupo):
     """
@@ -291,182 +295,130 @@ def obter_arquivos_parquet(pasta_de_arquivos):
     logger.info(f"Arquivos .parquet encontrados na pasta {pasta_de_arquivos}: {len(arquivos_parquet)}")
     return arquivos_parquet
 
-def converter_tipos(df, mapeamento_tipos):
+def colunas_de_leitura(grupo):
     """
-    Converte os tipos de dados das colunas do DataFrame com base no mapeamento fornecido.
-    
-    Args:
-        df (pd.DataFrame): DataFrame a ser convertido.
-        mapeamento_tipos (dict): Dicionário mapeando colunas para tipos de dados.
-    
-    Returns:
-        pd.DataFrame: DataFrame com tipos de dados convertidos.
-    
-    Raises:
-        TypeError: Se ocorrer erro durante a conversão.
+    Colunas lidas dos arquivos do grupo: as da tabela, exceto a linhagem, que é
+    gerada pelo loader.
     """
-    for col, tipo in mapeamento_tipos.items():
-        if col not in df.columns:
-            continue  # Ignorar colunas ausentes já verificadas
-        try:
-            if tipo.startswith("VARCHAR") or tipo.startswith("CHAR"):
-                # Remover espaços em branco
-                df[col] = df[col].astype(str).str.strip()
-                df[col] = df[col].astype(str)
-            elif tipo in ["INTEGER", "BIGINT", "SMALLINT"]:
-                if tipo == "SMALLINT":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int16')
-                elif tipo == "INTEGER":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int32')
-                elif tipo == "BIGINT":
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            elif tipo.startswith("NUMERIC"):
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            elif tipo == "DATE":
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
-            elif tipo == "BOOLEAN":
-                # Garantir que valores válidos sejam mapeados corretamente
-                df[col] = df[col].map({True: True, False: False, 'True': True, 'False': False, '1': True, '0': False})
-            elif tipo == "TEXT":
-                df[col] = df[col].astype(str).str.strip()
-            else:
-                logger.warning(f"Tipo de dado não mapeado para a coluna '{col}': '{tipo}'. Mantendo o tipo original.")
-        except Exception as e:
-            raise TypeError(f"Erro ao converter coluna '{col}' para o tipo '{tipo}': {e}")
-    return df
+    return [col for col in GRUPOS_INFO[grupo]["colunas"] if col not in COLUNAS_LINHAGEM]
 
-def normalizar_colunas(df, colunas_esperadas, mapeamento_tipos):
+def transformar_lote(grupo, lote, contexto, file_id, inicio):
     """
-    Normaliza os nomes das colunas para corresponder ao esquema do banco,
-    remove espaços em branco das colunas de texto e adiciona colunas ausentes como valores nulos.
+    Prepara um lote lido para inserção: normaliza e converte as colunas em Arrow,
+    acrescenta a linhagem (file_id, linha_arquivo) e põe as colunas na ordem da tabela.
     
     Args:
-        df (pd.DataFrame): DataFrame a ser normalizado.
-        colunas_esperadas (list): Lista de colunas esperadas conforme a tabela.
-        mapeamento_tipos (dict): Dicionário mapeando colunas para tipos de dados.
+        grupo (str): Nome do grupo (e.g., "RD", "RJ", "ER").
+        lote (pa.Table): Lote lido do arquivo .parquet.
+        contexto: Não usado pelo SIH.
+        file_id (int): Id da carga do arquivo no load_ledger.
+        inicio (int): Posição da primeira linha do lote no arquivo.
     
     Returns:
-        pd.DataFrame: DataFrame com colunas normalizadas e adicionadas.
+        pa.Table: Lote na ordem de colunas da tabela.
     """
-    # Convertendo colunas esperadas para minúsculas
-    colunas_corretas = [col.lower() for col in colunas_esperadas]
-    colunas_mapeadas = {col.lower(): col.lower() for col in colunas_corretas}
-    
-    # Convertendo as colunas do DataFrame para minúsculas
-    df.columns = [colunas_mapeadas.get(col.lower(), col.lower()) for col in df.columns]
-    
-    # Remover espaços em branco para colunas de texto
-    for col in df.columns:
-        tipo = mapeamento_tipos.get(col, '').upper()
-        if tipo.startswith("VARCHAR") or tipo.startswith("CHAR") or tipo == "TEXT":
-            df[col] = df[col].astype(str).str.strip()
-    
-    # Adicionar colunas ausentes
-    for coluna in colunas_corretas:
-        if coluna not in df.columns:
-            logger.warning(f"Adicionando coluna ausente: {coluna}")
-            df[coluna] = None  # Ou algum valor padrão, se aplicável
-    
-    return df
+    tabela = GRUPOS_INFO[grupo]["tabela"]
+    mapeamento_tipos = tipo_coluna_map.get(tabela, {})
+    lote = normalizar_tabela(lote, colunas_de_leitura(grupo), remover=COLUNAS_LINHAGEM)
+    lote = converter_tabela(lote, mapeamento_tipos)
 
-def ajustar_ordem_colunas(df, colunas_esperadas):
+    # Linhagem: id do arquivo no ledger e índice no arquivo
+    lote = adicionar_linhagem(lote, file_id, inicio=inicio)
+    return lote.select([col.lower() for col in GRUPOS_INFO[grupo]["colunas"]])
+
+def executar_pipeline(grupo, tarefas, **opcoes):
     """
-    Ajusta a ordem das colunas do DataFrame para o esquema do banco, ignorando 'id_log'.
+    Carrega as tarefas (grupo, pasta, arquivo) do grupo pelo PipelineIngestao
+    (leitura, transformação e COPY em estágios paralelos), com a configuração do grupo.
     
     Args:
-        df (pd.DataFrame): DataFrame a ser ajustado.
-        colunas_esperadas (list): Lista de colunas esperadas conforme a tabela.
+        grupo (str): Nome do grupo (e.g., "RD", "RJ", "ER").
+        tarefas (list): Tuplas (grupo, pasta, arquivo) a carregar.
+        **opcoes: Workers por estágio, slot e tamanho do lote (ver PipelineIngestao).
     
     Returns:
-        pd.DataFrame: DataFrame com colunas na ordem correta.
+        dict: Ocupação de cada estágio do pipeline.
     """
-    colunas_ordenadas = [col.lower() for col in colunas_esperadas]
-    return df[colunas_ordenadas]
+    info = GRUPOS_INFO[grupo]
+    pipeline = PipelineIngestao(
+        engine, info["tabela"], info["colunas"], partial(transformar_lote, grupo),
+        colunas_leitura=colunas_de_leitura(grupo), log=logger, **opcoes
+    )
+    return pipeline.executar(arquivo for _, _, arquivo in tarefas)
 
-def carregar_dados_em_lotes(grupo, pastas_de_arquivos, tamanho_lote=10000):
+def processar_arquivo(grupo, pasta, arquivo, tamanho_lote=10000):
     """
-    Carrega os arquivos .parquet em lotes pequenos e gera a coluna id_log.
-    
-    Args:
-        grupo (str): Nome do grupo (e.g., "RD", "RJ", "ER").
-        pastas_de_arquivos (list): Lista de caminhos para as pastas de arquivos.
-        tamanho_lote (int): Número de registros por lote.
-    
-    Yields:
-        pd.DataFrame: Lote de dados a ser inserido no banco.
+    Tarefa de um worker da ingestão paralela: carrega um arquivo pelo pipeline,
+    cada lote ocupando um dos streams COPY permitidos para a tabela.
     """
     tabela = GRUPOS_INFO[grupo]["tabela"]
-    arquivos_processados = verificar_ultimo_arquivo_processado(tabela)
-    colunas_esperadas = GRUPOS_INFO[grupo]["colunas"]
-    mapeamento_tipos = tipo_coluna_map.get(tabela, {})
+    id_arquivo = f"{os.path.basename(pasta)}_{os.path.basename(arquivo)}"
+    if arquivo_concluido(engine, tabela, id_arquivo, arquivo):
+        logger.info(f"[{grupo}] PULANDO arquivo já processado: {id_arquivo}")
+        return
+    # Um arquivo por worker: um leitor, um transformador e uma conexão de COPY;
+    # o slot_copy limita os COPY simultâneos na tabela
+    executar_pipeline(
+        grupo, [(grupo, pasta, arquivo)], leitores=1, transformadores=1, escritores=1,
+        slot=slot_copy, tamanho_lote=tamanho_lote
+    )
 
+def listar_tarefas(grupo, pastas_de_arquivos):
+    """
+    Lista (grupo, pasta, arquivo) dos arquivos do grupo ainda não processados
+    ou alterados desde a última carga (checksum diferente no load_ledger).
+    """
+    arquivos_processados = verificar_ultimo_arquivo_processado(GRUPOS_INFO[grupo]["tabela"])
+    tarefas = []
     for pasta in pastas_de_arquivos:
-        arquivos = obter_arquivos_parquet(pasta)
-        for arquivo in arquivos:
-            nome_pasta = os.path.basename(pasta)
-            nome_arquivo = os.path.basename(arquivo)
-            id_arquivo = f"{nome_pasta}_{nome_arquivo}"
-            
-            if id_arquivo in arquivos_processados:
+        nome_pasta = os.path.basename(pasta)
+        for arquivo in obter_arquivos_parquet(pasta):
+            id_arquivo = f"{nome_pasta}_{os.path.basename(arquivo)}"
+            if not arquivo_pendente(arquivos_processados, arquivo):
                 logger.info(f"[{grupo}] PULANDO arquivo já processado: {id_arquivo}")
                 continue
-            
-            try:
-                logger.info(f"[{grupo}] Carregando arquivo: {arquivo}")
-                monitorar_memoria()
-                df = pd.read_parquet(arquivo)
-                df = normalizar_colunas(df, colunas_esperadas, mapeamento_tipos)
-                df = converter_tipos(df, mapeamento_tipos)
-                
-                # Adicionar a coluna 'id_log' com base no nome da pasta e arquivo e índice
-                df['id_log'] = [f"{id_arquivo}_{i}" for i in range(len(df))]
-                
-                # Ajustar a ordem das colunas
-                df = ajustar_ordem_colunas(df, colunas_esperadas)
-                
-                for inicio in range(0, len(df), tamanho_lote):
-                    yield df.iloc[inicio:inicio + tamanho_lote]
-            except Exception as e:
-                logger.error(f"[{grupo}] Erro ao carregar arquivo {arquivo}: {e}")
+            tarefas.append((grupo, pasta, arquivo))
+    return tarefas
 
-def inserir_dados_em_lotes(tabela, df_lote, colunas_esperadas):
+def obter_engine():
     """
-    Insere os dados no banco por lotes.
-    
-    Args:
-        tabela (str): Nome da tabela no banco de dados.
-        df_lote (pd.DataFrame): Lote de dados a ser inserido.
-        colunas_esperadas (list): Lista de colunas esperadas conforme a tabela.
+    Engine do processo atual (cada worker da ingestão paralela tem o seu).
+    """
+    return engine
+
+def processar_dados_paralelo(workers=None):
+    """
+    Distribui os arquivos de todos os grupos entre processos worker (UPLOAD_WORKERS).
     """
     try:
-        csv_buffer = io.StringIO()
-        df_lote.to_csv(csv_buffer, index=False, header=False)
-        csv_buffer.seek(0)
-        with engine.connect() as connection:
-            with connection.connection.cursor() as cursor:
-                cursor.copy_expert(
-                    f"COPY {tabela} ({', '.join([col.lower() for col in colunas_esperadas])}) FROM STDIN WITH CSV",
-                    csv_buffer
-                )
-            connection.connection.commit()
-        logger.info(f"[{tabela}] Lote de {len(df_lote)} registros inserido com sucesso.")
+        tarefas = []
+        for grupo in GRUPOS_INFO:
+            pastas_de_arquivos = obter_pastas_de_arquivos(grupo)
+            if not pastas_de_arquivos:
+                logger.warning(f"[{grupo}] Nenhuma pasta de arquivos .parquet encontrada para processamento.")
+                continue
+            tarefas.extend(listar_tarefas(grupo, pastas_de_arquivos))
+        tabelas = [GRUPOS_INFO[grupo]["tabela"] for grupo, _, _ in tarefas]
+        executar_em_paralelo(tarefas, processar_arquivo, tabelas, obter_engine, 'upload_sih', workers)
+        logger.info("Processo concluído.")
     except Exception as e:
-        logger.critical(f"[{tabela}] Erro ao inserir dados: {e}", exc_info=True)
+        logger.critical(f"Erro crítico no processamento: {e}", exc_info=True)
 
 def processar_dados():
     """
-    Fluxo principal do script.
+    Fluxo principal do script. Com UPLOAD_WORKERS > 0 usa a ingestão paralela.
     """
+    if UPLOAD_WORKERS > 0:
+        return processar_dados_paralelo()
     try:
-        for grupo, info in GRUPOS_INFO.items():
-            tabela = info["tabela"]
-            colunas_esperadas = info["colunas"]
+        for grupo in GRUPOS_INFO:
             pastas_de_arquivos = obter_pastas_de_arquivos(grupo)
             if not pastas_de_arquivos:
                 logger.warning(f"[{grupo}] Nenhuma pasta de arquivos .parquet encontrada para processamento.")
                 continue
-            for df_lote in carregar_dados_em_lotes(grupo, pastas_de_arquivos):
-                inserir_dados_em_lotes(tabela, df_lote, colunas_esperadas)
+            # Arquivos já processados são descartados com uma consulta ao load_ledger
+            tarefas = listar_tarefas(grupo, pastas_de_arquivos)
+            executar_pipeline(grupo, tarefas)
         logger.info("Processo concluído.")
     except Exception as e:
         logger.critical(f"Erro crítico no processamento: {e}", exc_info=True)
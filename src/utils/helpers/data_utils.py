@@ -35,22 +35,3 @@ def carregar_parquet(caminho: str) -> pd.DataFrame:
         return pd.concat((pd.read_parquet(f) for f in arquivos), 
                         ignore_index=True)
     return pd.read_parquet(caminho)
-
-def converter_tipos(df: pd.DataFrame, mapeamento: dict) -> pd.DataFrame:
-    """
-    Converte tipos de colunas de um DataFrame conforme mapeamento
-    
-    Args:
-        df (pd.DataFrame): DataFrame original
-        mapeamento (dict): Dicionário {coluna: tipo}
-    
-    Returns:
-        pd.DataFrame: DataFrame com tipos convertidos
-    """
-    for col, dtype in mapeamento.items():
-        if col in df.columns:
-            try:
-                df[col] = df[col].astype(dtype)
-            except Exception as e:
-                raise ValueError(f"Erro ao converter {col} para {dtype}: {e}")
-    return df 
\ No newline at end of file
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Os módulos de carga importam uns aos outros pelo nome (ex.: from conversao_arrow import ...)
+for caminho in (RAIZ, os.path.join(RAIZ, "src", "data", "processors")):
+    if caminho not in sys.path:
+        sys.path.insert(0, caminho)
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """
+    Módulo main importado com configurações de teste: caminhos (catálogo, fila de
+    jobs, cache, logs) num diretório temporário e um PostgreSQL fictício, que não
+    é acessado na importação.
+    """
+    pytest.importorskip("duckdb")
+    pytest.importorskip("fastapi")
+    base = tmp_path_factory.mktemp("api")
+    os.environ.update({
+        "DB_NAME": "teste", "DB_USER": "teste", "DB_PASS": "teste",
+        "DB_HOST": "localhost", "DB_PORT": "5432",
+        "PARQUET_ROOT": str(base / "parquet_files"),
+        "CATALOG_PATH": str(base / "catalogo.sqlite"),
+        "JOB_STORE_PATH": str(base / "jobs.sqlite"),
+        "RESULT_CACHE_DIR": str(base / "resultados"),
+        "DUCKDB_TEMP_DIRECTORY": str(base / "duckdb_tmp"),
+        "JOB_WORKERS": "0",
+    })
+    cwd = os.getcwd()
+    # main cria a pasta de logs no diretório atual
+    os.chdir(base)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
@@ -0,0 +1,95 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+def monitor(sobrecarregado=False):
+    return SimpleNamespace(
+        interval=0.01, overloaded=lambda: sobrecarregado, metrics=lambda: {"cpu_usage": "0%"}
+    )
+
+
+def aguardar_fila(controlador, tamanho):
+    prazo = time.time() + 2
+    while controlador.status()["queued"] != tamanho:
+        assert time.time() < prazo, controlador.status()
+        time.sleep(0.005)
+
+
+def test_admissao_em_ordem_de_chegada(api):
+    controlador = api.AdmissionController(100, 10, 5, monitor())
+    primeira = controlador.acquire(80)
+    admitidas = []
+
+    def pedir(custo, nome):
+        release = controlador.acquire(custo)
+        admitidas.append(nome)
+        release()
+
+    grande = threading.Thread(target=pedir, args=(95, "grande"))
+    grande.start()
+    aguardar_fila(controlador, 1)
+    # Caberia na capacidade livre, mas chegou depois da consulta grande;
+    # com a grande em execução não cabe, então a ordem de admissão é determinística
+    pequena = threading.Thread(target=pedir, args=(10, "pequena"))
+    pequena.start()
+    aguardar_fila(controlador, 2)
+    time.sleep(0.05)
+    assert admitidas == []
+
+    primeira()
+    grande.join(2)
+    pequena.join(2)
+    assert admitidas == ["grande", "pequena"]
+    assert controlador.status() == {"running": 0, "queued": 0, "reserved_bytes": 0, "capacity_bytes": 100}
+
+
+def test_primeira_consulta_sempre_admitida(api):
+    controlador = api.AdmissionController(100, 10, 0.05, monitor(sobrecarregado=True))
+    release = controlador.acquire(500)
+    assert controlador.status()["running"] == 1
+    with pytest.raises(api.AdmissionRejected):
+        controlador.acquire(1)
+    release()
+    release()
+    assert controlador.status()["reserved_bytes"] == 0
+
+
+def test_espera_acima_do_timeout_e_rejeitada(api):
+    controlador = api.AdmissionController(100, 10, 0.05, monitor())
+    release = controlador.acquire(80)
+    inicio = time.time()
+    with pytest.raises(api.AdmissionRejected, match="aguardou"):
+        controlador.acquire(50)
+    assert time.time() - inicio >= 0.05
+    assert controlador.status()["queued"] == 0
+    release()
+
+
+def test_fila_cheia_rejeita_sem_esperar(api):
+    controlador = api.AdmissionController(100, 1, 2, monitor())
+    release = controlador.acquire(80)
+    na_fila = threading.Thread(target=lambda: controlador.acquire(50)())
+    na_fila.start()
+    aguardar_fila(controlador, 1)
+    with pytest.raises(api.AdmissionRejected, match="cheia"):
+        controlador.acquire(1)
+    release()
+    na_fila.join(2)
+
+
+def test_rejeicao_vira_503_com_retry_after(api, monkeypatch):
+    controlador = api.AdmissionController(100, 10, 0.02, monitor())
+    monkeypatch.setattr(controlador, "estimate_cost", lambda files, memory_per_job: 50)
+    monkeypatch.setattr(api, "admission", controlador)
+    release = controlador.acquire(80)
+
+    with pytest.raises(api.HTTPException) as erro:
+        api._admit(["qualquer.parquet"])
+
+    release()
+    assert erro.value.status_code == 503
+    assert erro.value.detail["error"] == "high_load"
+    assert erro.value.headers == {"Retry-After": str(int(api.settings.admission_retry_after))}
@@ -0,0 +1,76 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+
+def parametros(api, **extras):
+    dados = {
+        "base": "SIH", "grupo": "RD", "cnes_list": ["*"], "campos_agrupamento": ["sexo"],
+        "competencia_inicio": "01/2022", "competencia_fim": "01/2022",
+    }
+    dados.update(extras)
+    return api.QueryParams(**dados)
+
+
+def test_sem_medidas_mantem_campos_como_enviados(api):
+    params = parametros(api, campos_agrupamento=["sexo", "N_AIH", "sexo"])
+
+    assert params.campos_agrupamento == ["sexo", "N_AIH", "sexo"]
+
+
+def test_com_medidas_normaliza_campos_do_group_by(api):
+    params = parametros(api, campos_agrupamento=[" sexo", "SEXO", "cnes"],
+                        medidas=[{"funcao": "count"}])
+
+    assert params.campos_agrupamento == ["SEXO", "CNES"]
+
+
+def test_com_medidas_rejeita_campo_invalido(api):
+    with pytest.raises(ValidationError):
+        parametros(api, campos_agrupamento=["sexo; drop table x"], medidas=[{"funcao": "count"}])
+
+
+@pytest.mark.parametrize("funcao", ["sum", "avg"])
+def test_soma_de_coluna_texto_retorna_422(api, funcao):
+    corpo = parametros(api).model_dump(exclude_none=True)
+    corpo["medidas"] = [{"funcao": funcao, "coluna": "n_aih"}]
+
+    resposta = TestClient(api.app).post("/query", json=corpo)
+
+    assert resposta.status_code == 422
+    assert "numérica" in resposta.text
+
+
+def test_min_max_e_count_distinct_aceitam_texto(api):
+    params = parametros(api, medidas=[
+        {"funcao": "min", "coluna": "n_aih"},
+        {"funcao": "count_distinct", "coluna": "n_aih"},
+    ])
+
+    assert [m.nome for m in params.medidas] == ["min_n_aih", "count_distinct_n_aih"]
+
+
+def test_group_by_calcula_medidas_por_grupo(api, tmp_path):
+    arquivo = tmp_path / "part-0.parquet"
+    pq.write_table(pa.table({
+        "SEXO": ["1", "3", "1", "3", "1"],
+        "CNES": ["1234567", "1234567", "7654321", "1234567", "1234567"],
+        "VAL_TOT": ["10.50", "2.00", "100.00", "3.00", "1.50"],
+        "DIAS_PERM": ["2", "1", "5", "4", "x"],
+    }), arquivo)
+    params = parametros(api, cnes_list=["1234567"], campos_agrupamento=["sexo"], medidas=[
+        {"funcao": "count"},
+        {"funcao": "sum", "coluna": "val_tot", "alias": "valor"},
+        {"funcao": "avg", "coluna": "dias_perm"},
+    ])
+
+    with api.duckdb_pool.job() as job:
+        consulta = api.build_result_query(job.con, [str(arquivo)], params)
+        linhas = job.con.execute(f"SELECT * FROM ({consulta}) ORDER BY SEXO").fetchall()
+        colunas = [c[0] for c in job.con.description]
+
+    assert colunas == ["SEXO", "qtd_registros", "valor", "avg_dias_perm"]
+    # O CNES 7654321 fica fora pelo filtro; o valor inválido de DIAS_PERM vira NULL
+    assert [(s, n, float(v), m) for s, n, v, m in linhas] == [("1", 2, 12.0, 2.0), ("3", 2, 5.0, 2.5)]
@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(api):
+    # Sem o context manager os eventos de startup (pool asyncpg, workers) não rodam
+    return TestClient(api.app)
+
+
+def consulta(api, **extras):
+    dados = {
+        "base": "SIH", "grupo": "RD", "cnes_list": ["*"], "campos_agrupamento": ["N_AIH"],
+        "competencia_inicio": "01/2022", "competencia_fim": "01/2022",
+    }
+    dados.update(extras)
+    return api.QueryParams(**dados)
+
+
+@pytest.mark.parametrize("caminho", ["/results/load_ledger", "/results/load_ledger/metadata"])
+def test_tabela_que_nao_e_resultado_de_job_responde_404(client, caminho):
+    resposta = client.get(caminho)
+
+    assert resposta.status_code == 404
+
+
+def test_nome_de_tabela_invalido_responde_400(client):
+    assert client.get("/results/a;drop").status_code == 400
+
+
+def test_so_tabelas_de_jobs_concluidos_sao_resultados(api, tmp_path):
+    job_store = api.JobStore(str(tmp_path / "jobs.sqlite"))
+    job_id, _ = job_store.submit(consulta(api), "Resultado_Teste")
+
+    assert not job_store.is_result_table("resultado_teste")
+    job_store.claim("teste")
+    job_store.complete(job_id)
+    assert job_store.is_result_table("resultado_teste")
+    assert not job_store.is_result_table("load_ledger")
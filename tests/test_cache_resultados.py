@@ -0,0 +1,92 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+
+def parametros(api, **extras):
+    dados = {
+        "base": "SIH", "grupo": "RD", "cnes_list": ["1234567", "7654321"],
+        "campos_agrupamento": ["N_AIH"], "competencia_inicio": "01/2022", "competencia_fim": "01/2022",
+    }
+    dados.update(extras)
+    return api.QueryParams(**dados)
+
+
+ENTRADAS = [{"path": "/dados/RDSP2201.parquet/part-0.parquet", "size_bytes": 100, "mtime": 1.0}]
+
+
+@pytest.fixture
+def cache(api, tmp_path):
+    return api.ResultCache(str(tmp_path / "resultados"), 10 * 1024**2)
+
+
+def gravar(cache, chave, linhas=3):
+    tmp = f"{cache.path(chave)}.tmp"
+    pq.write_table(pa.table({"N_AIH": [str(i) for i in range(linhas)]}), tmp)
+    cache.commit(tmp, chave)
+
+
+def test_chave_normaliza_parametros(api, cache):
+    chave = cache.key(parametros(api), ENTRADAS, "table")
+
+    # Ordem e repetição do cnes_list e a tabela de destino não mudam o resultado
+    assert cache.key(parametros(api, cnes_list=["7654321", "1234567", "1234567"]), ENTRADAS, "table") == chave
+    assert cache.key(parametros(api, table_name="outra_tabela"), ENTRADAS, "table") == chave
+    assert cache.key(parametros(api), ENTRADAS, "stream") != chave
+    assert cache.key(parametros(api, campos_agrupamento=["CNES"]), ENTRADAS, "table") != chave
+
+
+@pytest.mark.parametrize("alteracao", [{"mtime": 2.0}, {"size_bytes": 101}, {"path": "/dados/outro.parquet"}])
+def test_nova_versao_dos_dados_invalida_a_entrada(api, cache, alteracao):
+    chave = cache.key(parametros(api), ENTRADAS, "table")
+    gravar(cache, chave)
+    with cache.get(chave) as arquivo:
+        assert pq.read_table(arquivo).num_rows == 3
+
+    nova = cache.key(parametros(api), [dict(ENTRADAS[0], **alteracao)], "table")
+
+    assert nova != chave
+    assert cache.get(nova) is None
+
+
+def test_entrada_aberta_sobrevive_a_evicao(api, cache):
+    gravar(cache, "antiga", linhas=1000)
+    arquivo = cache.get("antiga")
+    try:
+        # Limite menor que a entrada: a evicção remove o arquivo do diretório
+        cache.max_bytes = 1
+        cache.evict()
+        assert cache.get("antiga") is None
+        assert pq.read_table(arquivo).num_rows == 1000
+    finally:
+        arquivo.close()
+
+
+def test_cache_desativado(api, tmp_path):
+    cache = api.ResultCache(str(tmp_path / "desativado"), 0)
+
+    assert not cache.enabled
+    assert cache.get("qualquer") is None
+
+
+def test_process_data_serve_do_cache(api, tmp_path, monkeypatch, cache):
+    pasta = tmp_path / "RDSP2201.parquet"
+    pasta.mkdir()
+    arquivo = str(pasta / "part-0.parquet")
+    pq.write_table(pa.table({"N_AIH": ["1", "2"], "CNES": ["1234567", "1234567"]}), arquivo)
+    monkeypatch.setattr(api, "result_cache", cache)
+    params = parametros(api, cnes_list=["*"])
+
+    with api.duckdb_pool.job() as job:
+        primeira = job.con.execute(f"SELECT * FROM {api.process_data([arquivo], params, job=job)}").fetchall()
+
+    def nao_deveria_processar(*args, **kwargs):
+        raise AssertionError("resultado deveria vir do cache")
+
+    monkeypatch.setattr(api, "_process_data", nao_deveria_processar)
+    with api.duckdb_pool.job() as job:
+        segunda = job.con.execute(f"SELECT * FROM {api.process_data([arquivo], params, job=job)}").fetchall()
+
+    assert segunda == primeira
+    assert len(segunda) == 2
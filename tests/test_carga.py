@@ -0,0 +1,188 @@
+import re
+import threading
+from contextlib import contextmanager
+
+import pytest
+from pydantic import ValidationError
+
+
+class PostgresFalso:
+    """Engine SQLAlchemy fictícia: registra o SQL e conta as linhas copiadas."""
+
+    def __init__(self):
+        self.sql = []
+        self.copiadas = {}
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    connect = begin
+
+    def execute(self, comando):
+        sql = " ".join(str(comando).split())
+        self.sql.append(sql)
+        contagem = re.match(r"SELECT COUNT\(\*\) FROM (\S+)", sql)
+        total = len(self.copiadas.get(contagem.group(1), [])) if contagem else None
+
+        class Resultado:
+            def scalar(self):
+                return total
+
+        return Resultado()
+
+
+@pytest.fixture
+def postgres(api, monkeypatch):
+    """Modo attach (PG_COPY_MODE) com a cópia e o PostgreSQL substituídos por fakes."""
+    falso = PostgresFalso()
+
+    def copiar(cursor, origem, destino, alias):
+        linhas = cursor.execute(f"SELECT * FROM {origem}").fetchall()
+        falso.copiadas.setdefault(destino, []).extend(linhas)
+        return len(linhas)
+
+    monkeypatch.setattr(api, "engine", falso)
+    monkeypatch.setattr(api, "copy_via_attach", copiar)
+    monkeypatch.setattr(api.settings, "pg_copy_mode", "attach")
+    monkeypatch.setattr(api.settings, "pg_copy_unlogged", True)
+    return falso
+
+
+def parametros(api, **extras):
+    dados = {
+        "base": "SIH", "grupo": "RD", "cnes_list": ["*"], "campos_agrupamento": ["N_AIH"],
+        "competencia_inicio": "01/2022", "competencia_fim": "01/2022",
+    }
+    dados.update(extras)
+    return api.QueryParams(**dados)
+
+
+def chunk(job, nome, linhas):
+    tabela = job.table(nome)
+    job.con.execute(f"CREATE TABLE {tabela} (N_AIH VARCHAR, new_N_AIH_error VARCHAR)")
+    job.con.executemany(f"INSERT INTO {tabela} VALUES (?, NULL)", [[str(i)] for i in linhas])
+    return tabela
+
+
+@pytest.mark.parametrize("destino, schema", [("Resultado_Teste", ""), ("Analises.Resultado_Teste", "analises.")])
+def test_carga_em_chunks_e_troca_unica(api, postgres, destino, schema):
+    with api.duckdb_pool.job() as job:
+        carga = api.StagedLoad(destino, parametros(api), job)
+        carga.append(chunk(job, "chunk_a", range(3)), drop_source=True)
+        carga.append(chunk(job, "chunk_b", range(3, 5)), drop_source=True)
+        carga.finish()
+
+    tabela_carga = f"{schema}resultado_teste_carga_{job.tag}"
+    assert carga.load_table == tabela_carga
+    assert len(postgres.copiadas[tabela_carga]) == 5
+    assert postgres.sql[0] == f"DROP TABLE IF EXISTS {tabela_carga} CASCADE"
+    assert postgres.sql[1].startswith(f"CREATE UNLOGGED TABLE {tabela_carga} (")
+    # Coluna de erro sem ocorrências removida antes da troca, que mantém o schema
+    assert postgres.sql[-4:] == [
+        f'ALTER TABLE {tabela_carga} DROP COLUMN "new_N_AIH_error"',
+        f"ALTER TABLE {tabela_carga} SET LOGGED",
+        f"DROP TABLE IF EXISTS {schema}resultado_teste CASCADE",
+        f"ALTER TABLE {tabela_carga} RENAME TO resultado_teste",
+    ]
+
+
+def test_divergencia_de_contagem_nao_substitui_o_destino(api, postgres):
+    with api.duckdb_pool.job() as job:
+        carga = api.StagedLoad("resultado_teste", parametros(api), job)
+        carga.append(chunk(job, "chunk_a", range(3)))
+        carga.wait()
+        postgres.copiadas[carga.load_table].pop()
+        with pytest.raises(ValueError, match="Divergência"):
+            carga.finish()
+        carga.abort()
+
+    assert not any(sql.startswith("ALTER TABLE") and "RENAME" in sql for sql in postgres.sql)
+    assert postgres.sql[-1] == f"DROP TABLE IF EXISTS {carga.load_table} CASCADE"
+
+
+def test_chunk_com_schema_diferente_e_rejeitado(api, postgres):
+    with api.duckdb_pool.job() as job:
+        carga = api.StagedLoad("resultado_teste", parametros(api), job)
+        carga.append(chunk(job, "chunk_a", range(2)))
+        outro = job.table("chunk_b")
+        job.con.execute(f"CREATE TABLE {outro} (CNES VARCHAR)")
+        with pytest.raises(ValueError, match="Schema do chunk"):
+            carga.append(outro)
+        carga.abort()
+
+
+def test_job_cancelado_interrompe_a_carga(api, postgres):
+    with api.duckdb_pool.job() as job:
+        carga = api.StagedLoad("resultado_teste", parametros(api), job)
+        job.cancelled.set()
+        with pytest.raises(api.JobCancelled):
+            carga.append(chunk(job, "chunk_a", range(2)))
+        carga.abort()
+
+    assert postgres.copiadas == {}
+
+
+@pytest.mark.parametrize("nome", ["a.b.c", "tabela;drop", "1tabela", "schema."])
+def test_table_name_invalido(api, nome):
+    with pytest.raises(ValidationError):
+        parametros(api, table_name=nome)
+
+
+class ConexaoAsyncpgFalsa:
+    def __init__(self, copias):
+        self.copias = copias
+        self.fechada = False
+
+    async def copy_records_to_table(self, table_name, *, schema_name=None, records, columns):
+        self.copias.append((schema_name, table_name, tuple(columns), list(records)))
+
+    async def close(self):
+        self.fechada = True
+
+
+@pytest.fixture
+def asyncpg_falso(api, monkeypatch):
+    copias, conexoes = [], []
+
+    async def conectar(**kwargs):
+        conexao = ConexaoAsyncpgFalsa(copias)
+        conexoes.append(conexao)
+        return conexao
+
+    monkeypatch.setattr(api.asyncpg, "connect", conectar)
+    return copias, conexoes
+
+
+def test_copia_binaria_paralela(api, asyncpg_falso):
+    copias, conexoes = asyncpg_falso
+    with api.duckdb_pool.job() as job:
+        origem = job.table("origem")
+        job.con.execute(f"CREATE TABLE {origem} AS SELECT i AS id, 'x' || i AS nome FROM range(5000) t(i)")
+        total = api.copy_binary_parallel(
+            job.con, origem, "analises.destino", ["id", "nome"],
+            parallelism=3, batch_size=1024, progress=job.progress
+        )
+
+    assert total == 5000
+    assert len(conexoes) == 3 and all(c.fechada for c in conexoes)
+    assert {(schema, tabela, colunas) for schema, tabela, colunas, _ in copias} == {
+        ("analises", "destino", ("id", "nome"))
+    }
+    registros = sorted(r for *_, lote in copias for r in lote)
+    assert registros[:2] == [(0, "x0"), (1, "x1")] and len(registros) == 5000
+    assert job.progress.snapshot()["rows_copied"] == 5000
+
+
+def test_copia_binaria_cancelada(api, asyncpg_falso):
+    copias, conexoes = asyncpg_falso
+    cancelado = threading.Event()
+    cancelado.set()
+    with api.duckdb_pool.job() as job:
+        origem = job.table("origem")
+        job.con.execute(f"CREATE TABLE {origem} AS SELECT i AS id FROM range(10) t(i)")
+        with pytest.raises(api.JobCancelled):
+            api.copy_binary_parallel(job.con, origem, "destino", ["id"], 2, 1024, cancelled=cancelado)
+
+    assert copias == []
+    assert all(c.fechada for c in conexoes)
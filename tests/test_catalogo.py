@@ -0,0 +1,108 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.core.services.data_service import parse_file_name
+
+
+def gravar_parte(raiz, pasta, parte, linhas):
+    destino = raiz / "SIH" / "RD" / pasta
+    destino.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table({"N_AIH": [str(i) for i in range(linhas)]}), destino / parte)
+    return destino
+
+
+def tocar(caminho, deslocamento):
+    """Avança o mtime, para o teste não depender da resolução do relógio do sistema de arquivos."""
+    st = os.stat(caminho)
+    os.utime(caminho, (st.st_atime, st.st_mtime + deslocamento))
+
+
+@pytest.fixture
+def catalogo(api, tmp_path):
+    raiz = tmp_path / "parquet_files"
+    (raiz / "SIH" / "RD").mkdir(parents=True)
+    return raiz, api.ParquetCatalog(str(raiz), str(tmp_path / "catalogo.sqlite"), refresh_interval=3600)
+
+
+@pytest.mark.parametrize("nome, esperado", [
+    ("RDSP2201.parquet", ("SP", 202201)),
+    ("rdsp2201.parquet", ("SP", 202201)),
+    ("RDSP9912_1.parquet", ("SP", 199912)),
+    ("RDXX2201.parquet", None),
+    ("RDSP2213.parquet", None),
+    ("RDSP2201_old.parquet", None),
+    ("RJSP2201.parquet", None),
+])
+def test_parse_file_name(nome, esperado):
+    assert parse_file_name(nome, "RD") == esperado
+
+
+def test_lookup_por_intervalo_com_metadados(catalogo):
+    raiz, cat = catalogo
+    gravar_parte(raiz, "RDSP2201.parquet", "part-0.parquet", 3)
+    gravar_parte(raiz, "RDSP2202.parquet", "part-0.parquet", 4)
+    gravar_parte(raiz, "RDSP2203.parquet", "part-0.parquet", 5)
+
+    entradas = cat.lookup("SIH", "RD", 202201, 202202)
+
+    assert [(e["uf"], e["competencia"], e["num_rows"]) for e in entradas] == [
+        ("SP", 202201, 3), ("SP", 202202, 4)
+    ]
+    assert all(e["size_bytes"] > 0 and e["uncompressed_bytes"] > 0 for e in entradas)
+
+
+def test_parte_nova_em_pasta_existente_aparece_dentro_do_intervalo(catalogo):
+    raiz, cat = catalogo
+    pasta = gravar_parte(raiz, "RDSP2201.parquet", "part-0.parquet", 3)
+    assert len(cat.lookup("SIH", "RD", 202201, 202201)) == 1
+
+    mtime_grupo = os.stat(raiz / "SIH" / "RD").st_mtime
+    gravar_parte(raiz, "RDSP2201.parquet", "part-1.parquet", 2)
+    tocar(pasta, 10)
+    # A pasta do grupo não muda quando só a pasta de competência recebe partes
+    assert os.stat(raiz / "SIH" / "RD").st_mtime == mtime_grupo
+
+    entradas = cat.lookup("SIH", "RD", 202201, 202201)
+
+    assert sorted(e["num_rows"] for e in entradas) == [2, 3]
+
+
+def test_pastas_inalteradas_nao_releem_footers(catalogo):
+    raiz, cat = catalogo
+    gravar_parte(raiz, "RDSP2201.parquet", "part-0.parquet", 3)
+    assert cat.refresh("SIH", "RD")["arquivos_lidos"] == 1
+
+    cat.refresh_interval = 0
+    stats = cat.refresh("SIH", "RD")
+
+    assert stats["pastas"] == 1
+    assert stats["pastas_alteradas"] == 0
+    assert stats["arquivos_lidos"] == 0
+
+
+def test_pasta_removida_sai_do_catalogo(catalogo):
+    raiz, cat = catalogo
+    gravar_parte(raiz, "RDSP2201.parquet", "part-0.parquet", 3)
+    pasta = gravar_parte(raiz, "RDRJ2201.parquet", "part-0.parquet", 2)
+    assert len(cat.lookup("SIH", "RD", 202201, 202201)) == 2
+
+    (pasta / "part-0.parquet").unlink()
+    pasta.rmdir()
+    tocar(raiz / "SIH" / "RD", 10)
+
+    assert [e["uf"] for e in cat.lookup("SIH", "RD", 202201, 202201)] == ["SP"]
+
+
+def test_describe_usa_catalogo_e_stat_para_arquivos_fora_dele(catalogo, tmp_path):
+    raiz, cat = catalogo
+    pasta = gravar_parte(raiz, "RDSP2201.parquet", "part-0.parquet", 3)
+    cat.lookup("SIH", "RD", 202201, 202201)
+    avulso = tmp_path / "avulso.parquet"
+    pq.write_table(pa.table({"N_AIH": ["1"]}), avulso)
+
+    descritos = cat.describe([str(pasta / "part-0.parquet"), str(avulso)])
+
+    assert [d["num_rows"] for d in descritos] == [3, 1]
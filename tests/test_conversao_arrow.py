@@ -0,0 +1,112 @@
+import datetime
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from conversao_arrow import (
+    COLUNAS_LINHAGEM,
+    adicionar_linhagem,
+    converter_coluna,
+    converter_tabela,
+    ler_parquet_em_lotes,
+    normalizar_tabela
+)
+
+
+@pytest.mark.parametrize("tipo, valores, esperado", [
+    ("SMALLINT", ["1", " 32767 ", "32768", "-32769", "abc", None], [1, 32767, None, None, None, None]),
+    ("INTEGER", [1, 2 ** 31, -(2 ** 31)], [1, None, -(2 ** 31)]),
+    ("BIGINT", [1.0, 2.5, None], [1, None, None]),
+])
+def test_inteiros_invalidos_ou_fora_do_intervalo_viram_nulos(tipo, valores, esperado):
+    assert converter_coluna(pa.array(valores), tipo).to_pylist() == esperado
+
+
+def test_numerico_mantem_o_texto_de_origem():
+    coluna = pa.array(["1.5", " 2 ", "1e3", "x", None])
+
+    # Texto validado, sem passar por float64 (a cópia gera o Decimal exato)
+    assert converter_coluna(coluna, "NUMERIC(10,2)").to_pylist() == ["1.5", "2", "1e3", None, None]
+
+
+def test_numerico_mantem_tipos_numericos():
+    decimais = pa.array([Decimal("1234567890123456.78")], pa.decimal128(20, 2))
+
+    assert converter_coluna(decimais, "NUMERIC(20,2)").equals(decimais)
+    assert converter_coluna(pa.array([1, 2]), "NUMERIC").type == pa.int64()
+
+
+def test_datas_nos_formatos_aceitos():
+    coluna = pa.array(["20220131", "2022-02-28", "31/03/2022", "20221340", "", None])
+
+    assert converter_coluna(coluna, "DATE").to_pylist() == [
+        datetime.date(2022, 1, 31), datetime.date(2022, 2, 28), datetime.date(2022, 3, 31), None, None, None
+    ]
+
+
+@pytest.mark.parametrize("valores, esperado", [
+    (["True", "False", "1", "0", "sim", None], [True, False, True, False, None, None]),
+    ([1, 0, 2, None], [True, False, None, None]),
+    ([True, None], [True, None]),
+])
+def test_booleanos(valores, esperado):
+    assert converter_coluna(pa.array(valores), "BOOLEAN").to_pylist() == esperado
+
+
+def test_texto_aparado_preserva_nulos():
+    assert converter_coluna(pa.array([" a ", None]), "VARCHAR(10)").to_pylist() == ["a", None]
+    assert converter_coluna(pa.array([3, None]), "TEXT").to_pylist() == ["3", None]
+
+
+def test_converter_tabela_ignora_ausentes_e_tipos_nao_mapeados():
+    tabela = pa.table({"a": ["1"], "b": ["x"]})
+
+    convertida = converter_tabela(tabela, {"a": "INTEGER", "b": "JSONB", "c": "DATE"})
+
+    assert convertida.column("a").type == pa.int32()
+    assert convertida.column("b").to_pylist() == ["x"]
+    assert convertida.column_names == ["a", "b"]
+
+
+def test_normalizar_tabela_ordena_remove_e_completa():
+    tabela = pa.table({"B": [1, 2], "ID": [9, 9], "A": ["x", "y"]})
+
+    normalizada = normalizar_tabela(tabela, ["a", "B", "c"], remover=("id", "b"))
+
+    assert normalizada.column_names == ["a", "b", "c"]
+    assert normalizada.column("a").to_pylist() == ["x", "y"]
+    # Colunas removidas ou ausentes entram como nulas
+    assert normalizada.column("b").to_pylist() == [None, None]
+    assert normalizada.column("c").type == pa.string()
+
+
+def test_ler_parquet_em_lotes(tmp_path):
+    caminho = tmp_path / "part-0.parquet"
+    pq.write_table(pa.table({"ID": list(range(25)), "Outra": ["x"] * 25}), caminho, row_group_size=7)
+
+    lotes = list(ler_parquet_em_lotes(str(caminho), 10, colunas=["id"]))
+
+    assert all(lote.num_rows <= 10 for lote in lotes)
+    assert all(lote.column_names == ["ID"] for lote in lotes)
+    assert [v for lote in lotes for v in lote.column("ID").to_pylist()] == list(range(25))
+
+
+def test_adicionar_linhagem_acrescenta_colunas():
+    tabela = adicionar_linhagem(pa.table({"a": ["x", "y", "z"]}), 42, inicio=100)
+
+    assert tabela.column_names == ["a", "file_id", "linha_arquivo"]
+    assert tabela.column("file_id").type == pa.int64()
+    assert tabela.column("file_id").to_pylist() == [42, 42, 42]
+    assert tabela.column("linha_arquivo").type == pa.int32()
+    assert tabela.column("linha_arquivo").to_pylist() == [100, 101, 102]
+
+
+def test_adicionar_linhagem_preenche_colunas_existentes():
+    tabela = normalizar_tabela(pa.table({"A": [1, 2]}), ["file_id", "a", "linha_arquivo"], remover=COLUNAS_LINHAGEM)
+
+    tabela = adicionar_linhagem(tabela, 7)
+
+    assert tabela.column_names == ["file_id", "a", "linha_arquivo"]
+    assert tabela.to_pydict() == {"file_id": [7, 7], "a": [1, 2], "linha_arquivo": [0, 1]}
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from copia_binaria import CopiaBinaria
+
+
+def copia_com_tipos(tipos, flutuantes=()):
+    """CopiaBinaria sem conexão, com os tipos que viriam do information_schema."""
+    copia = CopiaBinaria("tabela", list(tipos))
+    copia._tipos = dict(tipos)
+    copia._flutuantes = set(flutuantes)
+    return copia
+
+
+def test_numeric_exato_a_partir_do_texto_e_do_decimal128():
+    copia = copia_com_tipos({"texto": "NUMERIC", "decimal": "NUMERIC", "inteiro": "NUMERIC"})
+    lote = pa.table({
+        "texto": pa.array(["1234567890123456.78", " 0.1 ", "x", None]),
+        "decimal": pa.array([Decimal("1234567890123456.78"), Decimal("0.10"), None, None], pa.decimal128(20, 2)),
+        "inteiro": pa.array([12345678901234567, 1, None, None]),
+    })
+
+    registros = copia._registros(lote)
+
+    assert registros[0] == (Decimal("1234567890123456.78"), Decimal("1234567890123456.78"), Decimal(12345678901234567))
+    assert registros[1] == (Decimal("0.1"), Decimal("0.10"), Decimal(1))
+    assert registros[2] == (None, None, None)
+
+
+def test_float_de_origem_usa_a_representacao_mais_curta():
+    copia = copia_com_tipos({"valor": "NUMERIC"})
+
+    assert copia._registros(pa.table({"valor": [0.1, None]})) == [(Decimal("0.1"),), (None,)]
+
+
+def test_colunas_double_precision_recebem_float():
+    copia = copia_com_tipos({"valor": "NUMERIC"}, flutuantes={"valor"})
+
+    assert copia._registros(pa.table({"valor": ["1.5", "1e3", "x"]})) == [(1.5,), (1000.0,), (None,)]
@@ -0,0 +1,146 @@
+import asyncio
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.core.services.data_service import DataService, InvalidCursor, ParquetReadError, scan_parquet
+
+
+def gravar_partes(pasta, partes):
+    """Grava uma pasta {grupo}{UF}{AAMM}.parquet com um arquivo por parte."""
+    pasta.mkdir(parents=True)
+    for i, tabela in enumerate(partes):
+        pq.write_table(tabela, pasta / f"part-{i}.parquet")
+    return str(pasta)
+
+
+def tabela(inicio, fim, **extras):
+    dados = {"id": list(range(inicio, fim)), "uf": ["SP"] * (fim - inicio)}
+    dados.update(extras)
+    return pa.table(dados)
+
+
+@pytest.fixture
+def servico(tmp_path):
+    servico = DataService()
+    servico.base_path = str(tmp_path)
+    return servico
+
+
+def test_scan_parquet_le_pastas_de_partes(tmp_path):
+    pasta = gravar_partes(tmp_path / "RDSP2201.parquet", [tabela(0, 1), tabela(1, 2)])
+
+    resultado = scan_parquet([pasta], ["id"])
+
+    assert sorted(resultado.column("id").to_pylist()) == [0, 1]
+
+
+def test_scan_parquet_ignora_partes_sem_as_colunas(tmp_path):
+    pasta = gravar_partes(tmp_path / "RDSP2201.parquet", [tabela(0, 2, valor=[1.0, 2.0]), tabela(2, 3)])
+
+    resultado = scan_parquet([pasta], ["id", "valor"])
+
+    assert resultado.column("id").to_pylist() == [0, 1]
+
+
+def test_scan_parquet_falha_em_arquivo_ilegivel(tmp_path):
+    pasta = gravar_partes(tmp_path / "RDSP2201.parquet", [tabela(0, 2)])
+    (tmp_path / "RDSP2201.parquet" / "part-9.parquet").write_bytes(b"corrompido")
+
+    with pytest.raises(ParquetReadError):
+        scan_parquet([pasta], ["id"])
+
+
+def test_get_data_no_layout_de_pastas(tmp_path, servico):
+    grupo = tmp_path / "SIH" / "RD"
+    gravar_partes(grupo / "RDSP2201.parquet", [tabela(0, 1), tabela(1, 2)])
+    gravar_partes(grupo / "RDSP2202.parquet", [tabela(2, 3)])
+    gravar_partes(grupo / "RDRJ2201.parquet", [tabela(3, 4)])
+
+    df = asyncio.run(servico.get_data("SIH", "RD", ["SP"], ["id"], "01/2022", "01/2022"))
+
+    assert sorted(df["id"]) == [0, 1]
+
+
+def percorrer_paginas(servico, page_size, estados=("SP",)):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        df, cursor, total = asyncio.run(servico.get_page(
+            "SIH", "RD", list(estados), ["id"], "01/2022", "02/2022", page_size, cursor
+        ))
+        assert len(df) <= page_size
+        ids.extend(df["id"].tolist())
+        paginas += 1
+        if cursor is None:
+            return ids, total, paginas
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 4, 7, 10, 100])
+def test_get_page_retorna_cada_linha_uma_vez(tmp_path, servico, page_size):
+    grupo = tmp_path / "SIH" / "RD"
+    (grupo / "RDSP2201.parquet").mkdir(parents=True)
+    pq.write_table(tabela(0, 25), grupo / "RDSP2201.parquet" / "part-0.parquet", row_group_size=7)
+    pq.write_table(tabela(25, 30), grupo / "RDSP2201.parquet" / "part-1.parquet", row_group_size=2)
+    gravar_partes(grupo / "RDSP2202.parquet", [tabela(30, 33)])
+
+    ids, total, paginas = percorrer_paginas(servico, page_size)
+
+    assert ids == list(range(33))
+    assert total == 33
+    assert paginas == -(-33 // page_size)
+
+
+def test_get_page_cursor_de_outra_consulta(tmp_path, servico):
+    grupo = tmp_path / "SIH" / "RD"
+    gravar_partes(grupo / "RDSP2201.parquet", [tabela(0, 10)])
+    gravar_partes(grupo / "RDRJ2201.parquet", [tabela(10, 20)])
+    _, cursor, _ = asyncio.run(servico.get_page("SIH", "RD", ["SP"], ["id"], "01/2022", "01/2022", 4))
+
+    with pytest.raises(InvalidCursor):
+        asyncio.run(servico.get_page("SIH", "RD", ["RJ"], ["id"], "01/2022", "01/2022", 4, cursor))
+
+
+def test_get_page_ignora_partes_sem_as_colunas(tmp_path, servico):
+    grupo = tmp_path / "SIH" / "RD"
+    gravar_partes(grupo / "RDSP2201.parquet", [tabela(0, 3, valor=[1.0, 2.0, 3.0]), tabela(3, 5)])
+
+    df, cursor, total = asyncio.run(servico.get_page(
+        "SIH", "RD", ["SP"], ["id", "valor"], "01/2022", "01/2022", 10
+    ))
+
+    # Mesmo comportamento do scan_parquet
+    assert df["id"].tolist() == [0, 1, 2]
+    assert total == 3
+    assert cursor is None
+
+
+def test_get_page_falha_em_arquivo_ilegivel(tmp_path, servico):
+    grupo = tmp_path / "SIH" / "RD"
+    gravar_partes(grupo / "RDSP2201.parquet", [tabela(0, 2)])
+    (grupo / "RDSP2201.parquet" / "part-9.parquet").write_bytes(b"corrompido")
+
+    with pytest.raises(ParquetReadError):
+        asyncio.run(servico.get_page("SIH", "RD", ["SP"], ["id"], "01/2022", "01/2022", 10))
+
+
+def test_get_page_abre_so_os_arquivos_da_pagina(tmp_path, servico, monkeypatch):
+    grupo = tmp_path / "SIH" / "RD"
+    gravar_partes(grupo / "RDSP2201.parquet", [tabela(0, 5), tabela(5, 10), tabela(10, 15)])
+    abertos = []
+    original = pq.ParquetFile
+
+    class ParquetFileContado(original):
+        def __init__(self, source, *args, **kwargs):
+            abertos.append(str(source).rsplit("/", 1)[-1])
+            super().__init__(source, *args, **kwargs)
+
+    monkeypatch.setattr(pq, "ParquetFile", ParquetFileContado)
+    _, cursor, total = asyncio.run(servico.get_page("SIH", "RD", ["SP"], ["id"], "01/2022", "01/2022", 4))
+    assert total == 15
+    assert abertos == ["part-0.parquet"]
+
+    abertos.clear()
+    df, _, _ = asyncio.run(servico.get_page("SIH", "RD", ["SP"], ["id"], "01/2022", "01/2022", 4, cursor))
+    assert df["id"].tolist() == [4, 5, 6, 7]
+    assert abertos == ["part-0.parquet", "part-1.parquet"]
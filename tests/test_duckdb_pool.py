@@ -0,0 +1,79 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+
+def gravar(caminho, linhas, row_groups=1):
+    tabela = pa.table({"N_AIH": [f"{i:012d}" for i in range(linhas)]})
+    pq.write_table(tabela, caminho, row_group_size=max(1, linhas // row_groups))
+    metadata = pq.read_metadata(caminho)
+    return str(caminho), sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+
+
+def test_chunks_limitados_pelo_tamanho_descomprimido(api, tmp_path, monkeypatch):
+    catalogo = api.ParquetCatalog(str(tmp_path), str(tmp_path / "catalogo.sqlite"))
+    monkeypatch.setattr(api, "catalog", catalogo)
+    arquivos = [gravar(tmp_path / f"parte_{i}.parquet", linhas, row_groups=2)
+                for i, linhas in enumerate([1000, 1000, 5000, 200, 200])]
+    tamanhos = [tamanho for _, tamanho in arquivos]
+    limite = tamanhos[0] + tamanhos[1]
+
+    chunks = api.plan_chunks([caminho for caminho, _ in arquivos], limite)
+
+    # O terceiro arquivo passa do limite sozinho e forma um chunk próprio
+    assert chunks == [[arquivos[0][0], arquivos[1][0]], [arquivos[2][0]], [arquivos[3][0], arquivos[4][0]]]
+    # O tamanho usado é o descomprimido do footer, não o do arquivo em disco
+    assert catalogo.describe([arquivos[2][0]])[0]["uncompressed_bytes"] == tamanhos[2]
+
+
+def test_memoria_e_threads_divididas_entre_os_jobs(api, tmp_path):
+    pool = api.DuckDBPool(max_jobs=2, memory_budget=2 * 1024**3, temp_directory=str(tmp_path), threads_per_job=1)
+    with pool.job() as job:
+        limite, threads, temp = job.con.execute(
+            "SELECT current_setting('memory_limit'), current_setting('threads'), current_setting('temp_directory')"
+        ).fetchone()
+
+    assert pool.memory_per_job == 1024**3
+    # Em bytes binários: no DuckDB, "MB" é potência de 1000
+    assert limite == "1.0 GiB"
+    assert threads == 1
+    assert temp.startswith(str(tmp_path))
+
+
+def test_memoria_minima_por_job(api, tmp_path):
+    pool = api.DuckDBPool(max_jobs=8, memory_budget=1024**3, temp_directory=str(tmp_path))
+    assert pool.memory_per_job == 256 * 1024**2
+
+
+def test_tabelas_do_job_removidas_e_conexao_reutilizada(api, tmp_path):
+    pool = api.DuckDBPool(max_jobs=1, memory_budget=1024**3, temp_directory=str(tmp_path))
+    with pool.job(job_id="Job-0001-abc") as job:
+        tabela = job.table("temp_converted")
+        job.con.execute(f"CREATE TABLE {tabela} AS SELECT 1 AS x")
+        con = job.con
+
+    assert tabela == "temp_converted_job0001abc"
+    with pool.job() as outro:
+        assert outro.con is con
+        assert con.execute("SELECT count(*) FROM information_schema.tables").fetchone()[0] == 0
+        assert outro.tag != job.tag
+
+
+def test_jobs_simultaneos_usam_conexoes_isoladas(api, tmp_path):
+    pool = api.DuckDBPool(max_jobs=2, memory_budget=1024**3, temp_directory=str(tmp_path))
+    with pool.job() as primeiro, pool.job() as segundo:
+        primeiro.con.execute("CREATE TABLE isolada AS SELECT 1 AS x")
+        assert primeiro.con is not segundo.con
+        assert segundo.con.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_name = 'isolada'"
+        ).fetchone()[0] == 0
+
+
+def test_cancelamento_do_job(api, tmp_path):
+    pool = api.DuckDBPool(max_jobs=1, memory_budget=1024**3, temp_directory=str(tmp_path))
+    with pool.job() as job:
+        job.check_cancelled()
+        job.cancel()
+        assert job.cancelled.is_set()
+        with pytest.raises(api.JobCancelled):
+            job.check_cancelled()
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(1, thread_name_prefix="teste") as pool:
+        yield pool
+
+
+def test_run_blocking_nao_trava_o_event_loop(api, executor):
+    async def cenario():
+        marcas = []
+
+        def bloqueante(atraso, *, nome):
+            time.sleep(atraso)
+            return nome, threading.current_thread().name, time.monotonic()
+
+        async def batimento():
+            for _ in range(3):
+                marcas.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        resultado, _ = await asyncio.gather(
+            api.run_blocking(executor, bloqueante, 0.5, nome="consulta"), batimento()
+        )
+        return resultado, marcas
+
+    (nome, thread, fim), marcas = asyncio.run(cenario())
+
+    assert nome == "consulta" and thread.startswith("teste")
+    # O loop continuou agendando outras corrotinas durante a chamada bloqueante
+    assert len(marcas) == 3 and marcas[-1] < fim
+
+
+def test_iterate_in_executor_consome_no_executor(api, executor):
+    threads = []
+
+    def gerador():
+        for i in range(3):
+            threads.append(threading.current_thread().name)
+            yield i
+
+    async def consumir():
+        return [item async for item in api.iterate_in_executor(executor, gerador())]
+
+    assert asyncio.run(consumir()) == [0, 1, 2]
+    assert all(nome.startswith("teste") for nome in threads)
+
+
+def test_iterate_in_executor_fecha_o_gerador_na_desconexao(api, executor):
+    fechado = threading.Event()
+
+    def gerador():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            fechado.set()
+
+    async def consumir_parcialmente():
+        stream = api.iterate_in_executor(executor, gerador())
+        recebidos = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return recebidos
+
+    assert asyncio.run(consumir_parcialmente()) == [0, 1]
+    assert fechado.wait(1)
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import ingestao_paralela
+from ingestao_paralela import slot_copy
+
+
+def test_slot_copy_sem_semaforos_executa_direto(monkeypatch):
+    monkeypatch.setattr(ingestao_paralela, "_semaforos", {})
+
+    with slot_copy("sia_pa"):
+        pass
+
+
+def test_slot_copy_limita_copias_por_tabela(monkeypatch):
+    monkeypatch.setattr(ingestao_paralela, "_semaforos", {"sia_pa": threading.BoundedSemaphore(2)})
+    monkeypatch.setattr(ingestao_paralela, "_engine", None)
+    ativas, maximo = 0, 0
+    lock = threading.Lock()
+
+    def copiar():
+        nonlocal ativas, maximo
+        with slot_copy("sia_pa"):
+            with lock:
+                ativas += 1
+                maximo = max(maximo, ativas)
+            time.sleep(0.02)
+            with lock:
+                ativas -= 1
+
+    threads = [threading.Thread(target=copiar) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert maximo == 2
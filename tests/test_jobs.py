@@ -0,0 +1,152 @@
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+
+def gravar_mes(raiz, uf, aamm, linhas, inicio=0):
+    """Pasta {grupo}{UF}{AAMM}.parquet do SIH/RD com uma parte."""
+    pasta = raiz / "SIH" / "RD" / f"RD{uf}{aamm}.parquet"
+    pasta.mkdir(parents=True, exist_ok=True)
+    tabela = pa.table({
+        "N_AIH": [str(inicio + i).zfill(13) for i in range(linhas)],
+        "CNES": ["1234567"] * linhas,
+    })
+    pq.write_table(tabela, pasta / "part-0.parquet")
+    return pasta
+
+
+def consulta(api, **extras):
+    dados = {
+        "base": "SIH", "grupo": "RD", "cnes_list": ["*"], "campos_agrupamento": ["N_AIH"],
+        "competencia_inicio": "01/2022", "competencia_fim": "03/2022",
+    }
+    dados.update(extras)
+    return api.QueryParams(**dados)
+
+
+@pytest.fixture
+def ambiente(api, tmp_path, monkeypatch):
+    """Catálogo, fila de jobs e cache isolados no tmp_path."""
+    raiz = tmp_path / "parquet_files"
+    monkeypatch.setattr(api, "catalog", api.ParquetCatalog(str(raiz), str(tmp_path / "catalogo.sqlite")))
+    monkeypatch.setattr(api, "job_store", api.JobStore(str(tmp_path / "jobs.sqlite")))
+    monkeypatch.setattr(api, "result_cache", api.ResultCache(str(tmp_path / "resultados"), 0))
+    return raiz
+
+
+def test_job_assincrono_publica_progresso_por_chunk(api, ambiente, monkeypatch):
+    for mes, linhas in (("2201", 3), ("2202", 4), ("2203", 5)):
+        gravar_mes(ambiente, "SP", mes, linhas)
+    # Um arquivo por chunk e publicação de progresso sem intervalo mínimo
+    monkeypatch.setattr(api.settings, "chunk_max_bytes", 1)
+    monkeypatch.setattr(api.settings, "job_progress_interval", 0.0)
+    publicados = []
+
+    class CargaFalsa:
+        def __init__(self, target_table, params, job):
+            self.target_table = target_table
+            self.job = job
+
+        def append(self, source_table, drop_source=False):
+            # O que /query/jobs/{id} mostraria enquanto o job ainda está em execução
+            linha = api.job_store.get(self.job.job_id)
+            assert linha["status"] == "running"
+            publicados.append(json.loads(linha["progress"]))
+
+        def finish(self):
+            pass
+
+        def abort(self):
+            pass
+
+    monkeypatch.setattr(api, "StagedLoad", CargaFalsa)
+    job_id, _ = api.job_store.submit(consulta(api), "resultado_rd")
+    row = api.job_store.claim("teste")
+
+    api.run_claimed_job(row, "teste")
+
+    assert api.job_store.get(job_id)["status"] == "completed"
+    assert [p["files_scanned"] for p in publicados] == [1, 2, 3]
+    assert [p["rows_converted"] for p in publicados] == [3, 7, 12]
+    assert all(p["files_total"] == 3 for p in publicados)
+
+
+@pytest.fixture
+def fila(api, tmp_path):
+    return api.JobStore(str(tmp_path / "fila.sqlite"))
+
+
+def test_claim_e_complete(api, fila):
+    job_id, anexado = fila.submit(consulta(api), "sih_teste", max_attempts=1)
+    assert not anexado
+    linha = fila.claim("w1")
+    assert linha["job_id"] == job_id
+    assert linha["status"] == "running"
+    assert linha["attempts"] == 1
+    # Job reservado não é entregue a outro worker
+    assert fila.claim("w2") is None
+    fila.complete(job_id)
+    assert fila.get(job_id)["status"] == "completed"
+    assert fila.is_result_table("SIH_TESTE")
+
+
+def test_falha_reenfileira_e_depois_marca_erro(api, fila):
+    job_id, _ = fila.submit(consulta(api), "sih_teste", max_attempts=2)
+    fila.claim("w1")
+    assert fila.fail(job_id, "falha 1", backoff=0) == "queued"
+    linha = fila.claim("w1")
+    assert linha["job_id"] == job_id
+    assert linha["attempts"] == 2
+    assert fila.fail(job_id, "falha 2", backoff=0) == "error"
+    final = fila.get(job_id)
+    assert final["status"] == "error"
+    assert final["error"] == "falha 2"
+    assert final["finished_at"] is not None
+    assert fila.claim("w1") is None
+
+
+def test_backoff_adia_nova_tentativa(api, fila):
+    job_id, _ = fila.submit(consulta(api), "sih_teste", max_attempts=2)
+    fila.claim("w1")
+    assert fila.fail(job_id, "falha", backoff=3600) == "queued"
+    assert fila.claim("w1") is None
+
+
+def test_job_sem_heartbeat_volta_para_fila(api, fila):
+    job_id, _ = fila.submit(consulta(api), "sih_teste", max_attempts=2)
+    fila.claim("w1")
+    # Heartbeat recente: nada a liberar
+    assert fila.requeue_stale(stale_after=60) == 0
+    assert fila.requeue_stale(stale_after=-1) == 1
+    assert fila.get(job_id)["status"] == "queued"
+    assert fila.claim("w2")["worker"] == "w2"
+    # Sem tentativas restantes o job termina em erro
+    assert fila.requeue_stale(stale_after=-1) == 1
+    assert fila.get(job_id)["status"] == "error"
+
+
+def test_cancelar_job_na_fila(api, fila):
+    job_id, _ = fila.submit(consulta(api), "sih_teste")
+    assert fila.cancel(job_id) == "cancelled"
+    assert fila.get(job_id)["finished_at"] is not None
+    assert fila.claim("w1") is None
+    # Nova submissão igual não se anexa ao job cancelado
+    novo_id, anexado = fila.submit(consulta(api), "sih_teste")
+    assert not anexado and novo_id != job_id
+    assert fila.cancel("inexistente") is None
+
+
+def test_pool_de_workers_inicia_uma_vez_por_lock(api, tmp_path):
+    lock = str(tmp_path / "jobs.sqlite.workers.lock")
+    primeiro = api.JobWorkerPool(0, lock)
+    segundo = api.JobWorkerPool(0, lock)
+    try:
+        assert primeiro.start()
+        assert not segundo.start()
+    finally:
+        primeiro.stop()
+    # Liberado o lock, outro processo pode assumir o pool
+    assert segundo.start()
+    segundo.stop()
@@ -0,0 +1,174 @@
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import pipeline_ingestao
+from conversao_arrow import adicionar_linhagem
+from pipeline_ingestao import PipelineIngestao
+
+
+class CopiaFalsa:
+    """
+    Substitui a CopiaBinaria: guarda os lotes e só confirma a gravação (ao_gravar)
+    numa thread própria, como os escritores reais. Lotes com `falhar` na coluna
+    'id' são confirmados com erro.
+    """
+
+    instancias = []
+
+    def __init__(self, tabela, colunas, streams=None, slot=None, log=None, falhar=()):
+        self.streams = streams or 1
+        self.ocupado = 0.0
+        self.lotes = []
+        self.falhar = set(falhar)
+        self._threads = []
+        self._lock = threading.Lock()
+        CopiaFalsa.instancias.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for thread in self._threads:
+            thread.join()
+        return False
+
+    def enviar(self, lote, ao_gravar=None):
+        def gravar():
+            erro = None
+            if self.falhar & set(lote.column("id").to_pylist()):
+                erro = RuntimeError("falha no COPY")
+            else:
+                with self._lock:
+                    self.lotes.append(lote)
+            ao_gravar(0 if erro else lote.num_rows, erro)
+
+        thread = threading.Thread(target=gravar)
+        self._threads.append(thread)
+        thread.start()
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    """Ledger em memória no lugar das funções do registro_carga."""
+    registro = {"cargas": {}, "finalizadas": {}}
+
+    def iniciar_carga(engine, tabela, arquivo, caminho, checksum):
+        file_id = len(registro["cargas"]) + 1
+        registro["cargas"][file_id] = caminho
+        return file_id
+
+    def finalizar_carga(engine, file_id, linhas, erro=None):
+        assert file_id not in registro["finalizadas"], "carga finalizada duas vezes"
+        gravadas = sum(
+            lote.num_rows for copia in CopiaFalsa.instancias for lote in copia.lotes
+            if lote.column("file_id")[0].as_py() == file_id
+        )
+        registro["finalizadas"][file_id] = {"linhas": linhas, "erro": erro, "gravadas": gravadas}
+
+    CopiaFalsa.instancias = []
+    monkeypatch.setattr(pipeline_ingestao, "CopiaBinaria", CopiaFalsa)
+    monkeypatch.setattr(pipeline_ingestao, "iniciar_carga", iniciar_carga)
+    monkeypatch.setattr(pipeline_ingestao, "finalizar_carga", finalizar_carga)
+    monkeypatch.setattr(pipeline_ingestao, "checksum_arquivo", lambda caminho: "checksum")
+    return registro
+
+
+def transformar(lote, contexto, file_id, inicio):
+    return adicionar_linhagem(lote, file_id, inicio=inicio)
+
+
+def gravar(tmp_path, nome, inicio, fim):
+    pasta = tmp_path / "PASP2201.parquet"
+    pasta.mkdir(exist_ok=True)
+    caminho = pasta / nome
+    pq.write_table(pa.table({"id": list(range(inicio, fim))}), caminho, row_group_size=4)
+    return str(caminho)
+
+
+def executar(arquivos, transformar=transformar, **opcoes):
+    pipeline = PipelineIngestao(
+        None, "teste", ["id", "file_id", "linha_arquivo"], transformar,
+        leitores=2, transformadores=3, tamanho_lote=3, **opcoes
+    )
+    uso = pipeline.executar(arquivos)
+    return pipeline, uso
+
+
+def linhas_gravadas():
+    return sorted(
+        (file_id, linha, valor)
+        for copia in CopiaFalsa.instancias
+        for lote in copia.lotes
+        for file_id, linha, valor in zip(
+            lote.column("file_id").to_pylist(), lote.column("linha_arquivo").to_pylist(), lote.column("id").to_pylist()
+        )
+    )
+
+
+def test_grava_todas_as_linhas_e_finaliza_depois_dos_lotes(tmp_path, ledger):
+    arquivos = [gravar(tmp_path, "part-0.parquet", 0, 10), gravar(tmp_path, "part-1.parquet", 10, 17)]
+
+    _, uso = executar(arquivos)
+
+    ids = {caminho: file_id for file_id, caminho in ledger["cargas"].items()}
+    esperado = sorted(
+        [(ids[arquivos[0]], i, i) for i in range(10)] + [(ids[arquivos[1]], i, 10 + i) for i in range(7)]
+    )
+    assert linhas_gravadas() == esperado
+    # Cada carga é finalizada uma vez, só depois de todos os seus lotes gravados
+    assert ledger["finalizadas"] == {
+        ids[arquivos[0]]: {"linhas": 10, "erro": None, "gravadas": 10},
+        ids[arquivos[1]]: {"linhas": 7, "erro": None, "gravadas": 7},
+    }
+    assert set(uso) == {"leitura", "transformação", "escrita"}
+
+
+def test_erro_de_gravacao_marca_so_o_arquivo_afetado(tmp_path, ledger, monkeypatch):
+    monkeypatch.setattr(
+        pipeline_ingestao, "CopiaBinaria", lambda *args, **kwargs: CopiaFalsa(*args, falhar={12}, **kwargs)
+    )
+    arquivos = [gravar(tmp_path, "part-0.parquet", 0, 10), gravar(tmp_path, "part-1.parquet", 10, 17)]
+
+    executar(arquivos)
+
+    ids = {caminho: file_id for file_id, caminho in ledger["cargas"].items()}
+    assert ledger["finalizadas"][ids[arquivos[0]]]["erro"] is None
+    assert ledger["finalizadas"][ids[arquivos[1]]]["erro"] == "1 lotes com erro"
+    assert ledger["finalizadas"][ids[arquivos[1]]]["linhas"] == 4
+
+
+def test_erro_de_contexto_e_de_leitura(tmp_path, ledger):
+    bom = gravar(tmp_path, "part-0.parquet", 0, 5)
+    ruim = gravar(tmp_path, "part-1.parquet", 5, 10)
+    corrompido = tmp_path / "PASP2201.parquet" / "part-2.parquet"
+    corrompido.write_bytes(b"corrompido")
+
+    def contexto(caminho):
+        if caminho == ruim:
+            raise ValueError("UF ausente")
+        return None
+
+    executar([bom, ruim, str(corrompido)], contexto=contexto)
+
+    por_caminho = {ledger["cargas"][file_id]: dados for file_id, dados in ledger["finalizadas"].items()}
+    assert por_caminho[bom] == {"linhas": 5, "erro": None, "gravadas": 5}
+    assert por_caminho[ruim]["erro"] == "UF ausente"
+    assert por_caminho[ruim]["gravadas"] == 0
+    assert por_caminho[str(corrompido)]["erro"]
+    assert por_caminho[str(corrompido)]["linhas"] == 0
+
+
+def test_erro_de_transformacao_marca_o_arquivo(tmp_path, ledger):
+    arquivo = gravar(tmp_path, "part-0.parquet", 0, 9)
+
+    def transformar_com_erro(lote, contexto, file_id, inicio):
+        if inicio == 3:
+            raise TypeError("coluna inválida")
+        return transformar(lote, contexto, file_id, inicio)
+
+    executar([arquivo], transformar=transformar_com_erro)
+
+    assert list(ledger["finalizadas"].values()) == [{"linhas": 6, "erro": "1 lotes com erro", "gravadas": 6}]
@@ -0,0 +1,38 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from registro_carga import arquivo_pendente, checksum_arquivo, id_arquivo
+
+
+def gravar(caminho, valores):
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table({"id": valores}), caminho)
+    return str(caminho)
+
+
+def test_id_arquivo_usa_pasta_e_nome(tmp_path):
+    caminho = tmp_path / "PASP2201.parquet" / "part-0.parquet"
+
+    assert id_arquivo(str(caminho)) == "PASP2201.parquet_part-0.parquet"
+
+
+def test_arquivo_pendente_compara_checksum(tmp_path):
+    caminho = gravar(tmp_path / "PASP2201.parquet" / "part-0.parquet", [1, 2, 3])
+    arquivo = id_arquivo(caminho)
+
+    assert arquivo_pendente({}, caminho)
+    assert not arquivo_pendente({arquivo: checksum_arquivo(caminho)}, caminho)
+    # Cargas migradas do id_log não têm checksum
+    assert not arquivo_pendente({arquivo: None}, caminho)
+
+    registrado = checksum_arquivo(caminho)
+    gravar(tmp_path / "PASP2201.parquet" / "part-0.parquet", [1, 2, 3, 4])
+    assert arquivo_pendente({arquivo: registrado}, caminho)
+
+
+def test_arquivo_pendente_com_arquivo_invalido(tmp_path):
+    caminho = tmp_path / "PASP2201.parquet" / "part-0.parquet"
+    caminho.parent.mkdir()
+    caminho.write_bytes(b"corrompido")
+
+    assert arquivo_pendente({id_arquivo(str(caminho)): "abc"}, str(caminho))
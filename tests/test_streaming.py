@@ -0,0 +1,60 @@
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+
+CONSULTA = {
+    "base": "SIH", "grupo": "RD", "cnes_list": ["*"], "campos_agrupamento": ["N_AIH", "CNES"],
+    "competencia_inicio": "01/2022", "competencia_fim": "01/2022",
+}
+
+
+@pytest.fixture
+def client(api, tmp_path, monkeypatch):
+    """Catálogo e cache de resultados isolados, com uma competência de 2.500 registros."""
+    raiz = tmp_path / "parquet_files"
+    pasta = raiz / "SIH" / "RD" / "RDSP2201.parquet"
+    pasta.mkdir(parents=True)
+    pq.write_table(pa.table({
+        "N_AIH": [f"{i:013d}" for i in range(2500)],
+        "CNES": ["2077485"] * 2500,
+    }), pasta / "part-0.parquet")
+    monkeypatch.setattr(api, "catalog", api.ParquetCatalog(str(raiz), str(tmp_path / "catalogo.sqlite")))
+    monkeypatch.setattr(api, "result_cache", api.ResultCache(str(tmp_path / "resultados"), 1024**3))
+    # Sem o context manager os eventos de startup (pool asyncpg, workers) não rodam
+    return TestClient(api.app)
+
+
+def test_streaming_arrow_em_batches(client):
+    resposta = client.post("/query/stream", params={"formato": "arrow", "batch_size": 1000}, json=CONSULTA)
+
+    assert resposta.status_code == 200
+    assert resposta.headers["x-cache"] == "MISS"
+    assert resposta.headers["x-job-id"]
+    tabela = pa.ipc.open_stream(io.BytesIO(resposta.content)).read_all()
+    assert tabela.num_rows == 2500
+    assert {"N_AIH", "CNES"} <= set(tabela.column_names)
+    assert not any(nome.endswith("_error") for nome in tabela.column_names)
+
+
+def test_streaming_ndjson_e_servido_do_cache_na_repeticao(client):
+    primeira = client.post("/query/stream", params={"formato": "ndjson", "batch_size": 1000}, json=CONSULTA)
+    segunda = client.post("/query/stream", params={"formato": "parquet"}, json=CONSULTA)
+
+    linhas = [json.loads(linha) for linha in primeira.text.splitlines()]
+    assert len(linhas) == 2500 and linhas[0]["CNES"] == "2077485"
+    assert segunda.headers["x-cache"] == "HIT"
+    assert pq.read_table(io.BytesIO(segunda.content)).num_rows == 2500
+
+
+def test_streaming_sem_arquivos_responde_404(client):
+    consulta = dict(CONSULTA, competencia_inicio="01/2030", competencia_fim="01/2030")
+    assert client.post("/query/stream", json=consulta).status_code == 404
+
+
+def test_batch_size_abaixo_do_minimo_responde_422(client):
+    assert client.post("/query/stream", params={"batch_size": 10}, json=CONSULTA).status_code == 422